@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -10,3 +12,11 @@ class ResetRequestBody(BaseModel):
     id: int
     game: int
     world_type: str
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepRequestBody]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetRequestBody]
@@ -30,3 +30,11 @@ class QueryRequest(BaseModel):
     
 class CloseRequestBody(BaseModel):
     env_idx: int
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepQuery]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetQuery]
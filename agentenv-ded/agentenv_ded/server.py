@@ -1,8 +1,36 @@
-from fastapi import FastAPI
+import asyncio
+import inspect
+from typing import List
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 import os
 from .model import *
 from .environment import server
 
+
+async def run_batch(handler, bodies: list) -> List[dict]:
+    """
+    Run `handler` on every body of a batch request concurrently, as FastAPI runs
+    separate requests, and return `{"ok": true, "result": ...}` or
+    `{"ok": false, "status_code": ..., "error": ...}` for each body, in order.
+    """
+    if inspect.iscoroutinefunction(handler):
+        calls = [handler(body) for body in bodies]
+    else:
+        calls = [run_in_threadpool(handler, body) for body in bodies]
+    results = []
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, HTTPException):
+            results.append(
+                {"ok": False, "status_code": result.status_code, "error": str(result.detail)}
+            )
+        elif isinstance(result, Exception):
+            results.append({"ok": False, "status_code": 500, "error": repr(result)})
+        else:
+            results.append({"ok": True, "result": result})
+    return results
+
+
 app = FastAPI()
 
 VISUAL = os.environ.get("VISUAL", "false").lower() == "true"
@@ -61,3 +89,13 @@ def reset(reset_query: ResetQuery):
 def close(body: CloseRequestBody):
     # print(f"/close {body.env_idx}")
     return server.close(body.env_idx)
+
+
+@app.post("/step_batch")
+async def step_batch(body: StepBatchRequestBody):
+    return await run_batch(step, body.steps)
+
+
+@app.post("/reset_batch")
+async def reset_batch(body: ResetBatchRequestBody):
+    return await run_batch(reset, body.resets)
@@ -1,9 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+import inspect
+from typing import List
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from .maze.environment import maze_server
 from .maze.model import *
 from .wordle.environment import wordle_server
 from .wordle.model import *
 
+
+async def run_batch(handler, bodies: list) -> List[dict]:
+    """
+    Run `handler` on every body of a batch request concurrently, as FastAPI runs
+    separate requests, and return `{"ok": true, "result": ...}` or
+    `{"ok": false, "status_code": ..., "error": ...}` for each body, in order.
+    """
+    if inspect.iscoroutinefunction(handler):
+        calls = [handler(body) for body in bodies]
+    else:
+        calls = [run_in_threadpool(handler, body) for body in bodies]
+    results = []
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, HTTPException):
+            results.append(
+                {"ok": False, "status_code": result.status_code, "error": str(result.detail)}
+            )
+        elif isinstance(result, Exception):
+            results.append({"ok": False, "status_code": 500, "error": repr(result)})
+        else:
+            results.append({"ok": True, "result": result})
+    return results
+
+
 app = FastAPI()
 
 
@@ -47,6 +75,16 @@ def maze_get_detailed_info(id: int):
     return maze_server.get_detailed_info(id)
 
 
+@app.post("/maze/step_batch")
+async def maze_step_batch(body: MazeStepBatchRequestBody):
+    return await run_batch(maze_step, body.steps)
+
+
+@app.post("/maze/reset_batch")
+async def maze_reset_batch(body: MazeResetBatchRequestBody):
+    return await run_batch(maze_reset, body.resets)
+
+
 # ----------------------------------------
 # wordle
 # ----------------------------------------
@@ -80,3 +118,13 @@ def wordle_get_observation(id: int):
 @app.get("/wordle/detail")
 def wordle_get_detailed_info(id: int):
     return wordle_server.get_detailed_info(id)
+
+
+@app.post("/wordle/step_batch")
+async def wordle_step_batch(body: WordleStepBatchRequestBody):
+    return await run_batch(wordle_step, body.steps)
+
+
+@app.post("/wordle/reset_batch")
+async def wordle_reset_batch(body: WordleResetBatchRequestBody):
+    return await run_batch(wordle_reset, body.resets)
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -9,3 +11,11 @@ class WordleStepRequestBody(BaseModel):
 class WordleResetRequestBody(BaseModel):
     id: int
     seed: int
+
+
+class WordleStepBatchRequestBody(BaseModel):
+    steps: List[WordleStepRequestBody]
+
+
+class WordleResetBatchRequestBody(BaseModel):
+    resets: List[WordleResetRequestBody]
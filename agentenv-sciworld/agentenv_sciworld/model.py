@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class StepRequestBody(BaseModel):
@@ -12,4 +12,12 @@ class ResetRequestBody(BaseModel):
     data_idx: int
 
 class CloseRequestBody(BaseModel):
-    id: int
\ No newline at end of file
+    id: int
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepRequestBody]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetRequestBody]
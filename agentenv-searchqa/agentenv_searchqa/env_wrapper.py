@@ -2,7 +2,7 @@
 SearchQAEnvServer
 """
 
-from typing import Optional
+from typing import List, Optional, Tuple
 import threading
 import json
 import os
@@ -137,28 +137,75 @@ class SearchQAEnvServer:
             ValueError: if the action is not a valid string format
         """
         self._check_env_idx(env_idx)
+        action, content = self._parse_action(response)
+        search_result = None
+        if action == "search":
+            logger.info(f"Search query: {content}")
+            search_result = self._search(content)[0]
+        return self._step_output(env_idx, response, action, search_result)
+
+    def step_batch(self, steps: List[Tuple[int, str]]) -> list:
+        """
+        Perform a step in each of several environments, with a single retrieval call
+        for all their searches.
+        Input:
+            steps: (env_idx, action) pairs
+        Output:
+            the output of `step` for each pair, or the exception it raised
+        """
+        parsed = []
+        for env_idx, response in steps:
+            try:
+                self._check_env_idx(env_idx)
+                parsed.append(self._parse_action(response))
+            except Exception as e:
+                parsed.append(e)
+        queries = [
+            p[1] for p in parsed if not isinstance(p, Exception) and p[0] == "search"
+        ]
+        logger.info(f"Search queries: {queries}")
+        search_results = iter(self._search_batch(queries) if queries else [])
+
+        outputs = []
+        for (env_idx, response), p in zip(steps, parsed):
+            if isinstance(p, Exception):
+                outputs.append(p)
+                continue
+            action, _ = p
+            search_result = next(search_results) if action == "search" else None
+            try:
+                outputs.append(
+                    self._step_output(env_idx, response, action, search_result)
+                )
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+
+    @staticmethod
+    def _parse_action(response: str) -> Tuple[Optional[str], str]:
+        """
+        The action ("search", "answer" or None if invalid) and its content.
+        """
+        if not isinstance(response, str):  # for llm output
+            raise ValueError(f"Invalid action type: {type(response)}")
+        pattern = r"<(search|answer)>(.*?)</\1>"
+        match = re.search(pattern, response, re.DOTALL)
+        if match:
+            return match.group(1), match.group(2).strip()
+        return None, ""
+
+    def _step_output(
+        self,
+        env_idx,
+        response: str,
+        action: Optional[str],
+        search_result: Optional[str],
+    ):
         reward = 0
         done = False
         observation = ""
-
-        if isinstance(response, str):  # for llm output
-            pattern = r"<(search|answer)>(.*?)</\1>"
-            match = re.search(pattern, response, re.DOTALL)
-            if match:
-                content = match.group(2).strip()
-                action = match.group(1)
-            else:
-                content = ""
-                action = None
-        else:
-            raise ValueError(f"Invalid action type: {type(action)}")
-
         if action == "search":
-            search_query = content
-            logger.info(f"Search query: {search_query}")
-            search_results = self._search(search_query)
-            # search_results = ["pass"]
-            observation = f"<information>{search_results.pop(0).strip()}</information>"
+            observation = f"<information>{search_result.strip()}</information>"
         elif action == "answer":
             # Check if the answer is correct
             format_score = compute_score_em_format(
@@ -208,6 +255,16 @@ class SearchQAEnvServer:
         logger.info(f"Search results: {result}\nRAW: {resp}")
         return result
 
+    def _search_batch(self, search_queries: List[str]) -> List[str]:
+        results, scores = self.retriever.batch_search(
+            query_list=search_queries, num=3, return_score=True
+        )
+        resp = [
+            [{"document": doc, "score": score} for doc, score in zip(docs, doc_scores)]
+            for docs, doc_scores in zip(results, scores)
+        ]
+        return [self._passages2string(r) for r in resp]
+
     def _passages2string(self, retrieval_result):
         format_reference = ""
         for idx, doc_item in enumerate(retrieval_result):
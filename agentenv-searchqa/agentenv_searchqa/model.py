@@ -33,4 +33,12 @@ class QueryRequest(BaseModel):
     return_scores: bool = False
     
 class CloseRequestBody(BaseModel):
-    env_idx: int
\ No newline at end of file
+    env_idx: int
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepQuery]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetQuery]
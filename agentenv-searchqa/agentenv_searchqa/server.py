@@ -1,4 +1,8 @@
-from fastapi import FastAPI, Request
+import asyncio
+import inspect
+from typing import List
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 import time
 import logging
 import os
@@ -8,6 +12,29 @@ from .model import *
 from .utils import debug_flg
 
 
+async def run_batch(handler, bodies: list) -> List[dict]:
+    """
+    Run `handler` on every body of a batch request concurrently, as FastAPI runs
+    separate requests, and return `{"ok": true, "result": ...}` or
+    `{"ok": false, "status_code": ..., "error": ...}` for each body, in order.
+    """
+    if inspect.iscoroutinefunction(handler):
+        calls = [handler(body) for body in bodies]
+    else:
+        calls = [run_in_threadpool(handler, body) for body in bodies]
+    results = []
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, HTTPException):
+            results.append(
+                {"ok": False, "status_code": result.status_code, "error": str(result.detail)}
+            )
+        elif isinstance(result, Exception):
+            results.append({"ok": False, "status_code": 500, "error": repr(result)})
+        else:
+            results.append({"ok": True, "result": result})
+    return results
+
+
 app = FastAPI(debug=debug_flg)
 
 VISUAL = os.environ.get("VISUAL", "false").lower() == "true"
@@ -67,3 +94,31 @@ def reset(reset_query: ResetQuery):
 def close(body: CloseRequestBody):
     # print(f"/close {body.env_idx}")
     return searchqa_env_server.close(body.env_idx)
+
+
+@app.post("/step_batch")
+def step_batch(body: StepBatchRequestBody):
+    # the searches of all steps go to the retriever in one batch
+    outputs = searchqa_env_server.step_batch(
+        [(step_query.env_idx, step_query.action) for step_query in body.steps]
+    )
+    results = []
+    for output in outputs:
+        if isinstance(output, Exception):
+            results.append({"ok": False, "status_code": 500, "error": repr(output)})
+        else:
+            observation, reward, done, info = output
+            results.append(
+                {
+                    "ok": True,
+                    "result": StepResponse(
+                        observation=observation, reward=reward, done=done, info=info
+                    ),
+                }
+            )
+    return results
+
+
+@app.post("/reset_batch")
+async def reset_batch(body: ResetBatchRequestBody):
+    return await run_batch(reset, body.resets)
@@ -18,3 +18,11 @@ class StepResponse(BaseModel):
 class ResetQuery(BaseModel):
     env_idx: int
     item_id: int
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepQuery]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetQuery]
@@ -2,16 +2,43 @@
 FastAPI Server
 """
 
+import asyncio
+import inspect
 import logging
 import time
 from typing import List, Literal, Tuple
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 
 from .environment import sqlgym_env_server
 from .model import *
 from .utils import debug_flg
 
+
+async def run_batch(handler, bodies: list) -> List[dict]:
+    """
+    Run `handler` on every body of a batch request concurrently, as FastAPI runs
+    separate requests, and return `{"ok": true, "result": ...}` or
+    `{"ok": false, "status_code": ..., "error": ...}` for each body, in order.
+    """
+    if inspect.iscoroutinefunction(handler):
+        calls = [handler(body) for body in bodies]
+    else:
+        calls = [run_in_threadpool(handler, body) for body in bodies]
+    results = []
+    for result in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(result, HTTPException):
+            results.append(
+                {"ok": False, "status_code": result.status_code, "error": str(result.detail)}
+            )
+        elif isinstance(result, Exception):
+            results.append({"ok": False, "status_code": 500, "error": repr(result)})
+        else:
+            results.append({"ok": True, "result": result})
+    return results
+
+
 app = FastAPI(debug=debug_flg)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 
@@ -73,3 +100,13 @@ async def observation(env_idx: int):
 async def reset(reset_query: ResetQuery):
     print(reset_query)
     return sqlgym_env_server.reset(reset_query.env_idx, reset_query.item_id), None
+
+
+@app.post("/step_batch")
+async def step_batch(body: StepBatchRequestBody):
+    return await run_batch(step, body.steps)
+
+
+@app.post("/reset_batch")
+async def reset_batch(body: ResetBatchRequestBody):
+    return await run_batch(reset, body.resets)
@@ -21,3 +21,11 @@ class StepResponse(BaseModel):
 class ResetQuery(BaseModel):
     env_idx: int
     id: Optional[int] = None
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepQuery]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetQuery]
@@ -4,6 +4,7 @@ FastAPI Server
 
 from typing import List, Tuple
 
+from agentenv_tool_common import run_batch
 from fastapi import FastAPI
 
 from .todo_environment import todo_env_server
@@ -49,3 +50,13 @@ def observation(env_idx: int):
 def reset(reset_query: ResetQuery):
     todo_env_server.reset(reset_query.env_idx, reset_query.id)
     return todo_env_server.observation(reset_query.env_idx)
+
+
+@app.post("/step_batch")
+async def step_batch(body: StepBatchRequestBody):
+    return await run_batch(step, body.steps)
+
+
+@app.post("/reset_batch")
+async def reset_batch(body: ResetBatchRequestBody):
+    return await run_batch(reset, body.resets)
@@ -2,46 +2,55 @@
 WebshopEnvServer
 """
 
+import threading
 from typing import Optional
 
 import gym
 from web_agent_site.envs import WebAgentTextEnv
+from web_agent_site.envs.web_agent_text_env import get_catalog
 
 
 class WebshopEnvServer:
     """
     WebshopEnvServer
+
+    The products, search engine and goals are loaded once and shared by all envs
+    (see `SimCatalog`); an env only holds its browser and session state.
     """
 
+    num_products = 1000
+
     def __init__(self) -> None:
         self._max_id = 0
         self.env = {}
-        self.ls = []
-        self.sz = 8000
-        self.now = -1
+        self._lock = threading.Lock()
 
     def create(self) -> int:
-        env_idx = self._max_id
         import random
         import time
 
+        # load the shared catalog before the first env, not while holding the lock
+        get_catalog(num_products=self.num_products)
         random.seed(time.time())
-        idx = random.randint(0, 48950076)
+        with self._lock:
+            idx = random.randint(0, 48950076)
+            while idx in self.env:
+                idx = random.randint(0, 48950076)
+            # reserve the id while the env is built
+            self.env[idx] = None
+            self._max_id += 1
         print(f"-------Env {idx} created--------")
-        if len(self.env) == self.sz:
-            self.now = self.now + 1
-            if self.now == self.sz:
-                self.now = 0
-            return self.ls[self.now]
-
-        self.env[idx] = gym.make(
-            "WebAgentTextEnv-v0",
-            observation_mode="text",
-            num_products=1000,
-        )
-        self.env[idx].reset()
-        self._max_id += 1
-        self.ls.append(idx)
+        try:
+            # the env is reset on construction
+            self.env[idx] = gym.make(
+                "WebAgentTextEnv-v0",
+                observation_mode="text_structured",
+                num_products=self.num_products,
+            )
+        except Exception:
+            with self._lock:
+                del self.env[idx]
+            raise
         return idx
 
     def step(self, env_idx, action: str):
@@ -94,11 +103,30 @@ class WebshopEnvServer:
 
     def reset(self, env_idx, session_id: Optional[int]):
         return self.env[env_idx].reset(session=session_id)
-    
+
+    def close(self, env_idx):
+        """
+        Raises:
+            KeyError: if there is no env `env_idx`, or it is still being created
+        """
+        with self._lock:
+            if env_idx not in self.env:
+                raise KeyError(f"Env {env_idx} not found")
+            # the id is reserved with None until `create` has built the env
+            if self.env[env_idx] is None:
+                raise KeyError(f"Env {env_idx} is still being created")
+            env = self.env.pop(env_idx)
+        env.close()
+        print(f"-------Env {env_idx} closed--------")
+        return True
+
     def __del__(self):
-        for idx in self.ls:
-            self.env[idx].close
-            print(f"-------Env {idx} closed--------")
+        with self._lock:
+            envs = list(self.env.items())
+        for idx, env in envs:
+            if env is not None:
+                env.close()
+                print(f"-------Env {idx} closed--------")
 
 
 webshop_env_server = WebshopEnvServer()
@@ -29,3 +29,15 @@ class StateResponse(BaseModel):
 class ResetQuery(BaseModel):
     env_idx: int
     session_id: Optional[int] = None
+
+
+class CloseRequestBody(BaseModel):
+    env_idx: int
+
+
+class StepBatchRequestBody(BaseModel):
+    steps: List[StepQuery]
+
+
+class ResetBatchRequestBody(BaseModel):
+    resets: List[ResetQuery]
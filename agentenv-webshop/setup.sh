@@ -10,7 +10,9 @@ mkdir -p resources resources_100 resources_1k resources_100k
 python convert_product_file_format.py # convert items.json => required doc format
 mkdir -p indexes
 bash ./run_indexing.sh
-cd ../..
+cd ..
+python -m web_agent_site.engine.catalog --num_products 1000 # preprocess items => memory-mapped catalog
+cd ..
 
 pip install -e .
 
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+import os
+
+from web_agent_site.engine.catalog import (
+    MappedCatalog, catalog_path, load_catalog, open_catalog, source_stamp, write_catalog
+)
+
+PRODUCTS = [
+    {'asin': 'B07ZQXMK2L', 'name': 'Red Shirt', 'category': 'fashion', 'query': 'shirt',
+     'Attributes': ['cotton'], 'Price': '$10.00', 'pricing': [10.0]},
+    {'asin': 'A1', 'name': 'Blue Mug ☕', 'category': 'home', 'query': 'mug',
+     'Attributes': [], 'Price': '$20.50', 'pricing': [20.5]},
+    {'asin': 'C3', 'name': 'Green Lamp', 'category': 'home', 'query': 'lamp',
+     'Attributes': ['led'], 'Price': '$5.25', 'pricing': [5.25]},
+]
+PRICES = {'B07ZQXMK2L': 10.0, 'A1': 20.5, 'C3': 5.25}
+ATTRIBUTE_TO_ASINS = {'cotton': {'B07ZQXMK2L'}, 'led': {'C3'}}
+GOALS = [{'asin': 'A1', 'instruction_text': 'Find a mug', 'weight': 1, 'price_upper': 30.0}]
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / 'items.catalog')
+    write_catalog(path, PRODUCTS, PRICES, ATTRIBUTE_TO_ASINS, GOALS)
+    catalog = MappedCatalog(path, cache_size=2)
+    yield catalog
+    catalog.close()
+
+def test_catalog_round_trip(catalog):
+    assert len(catalog) == 3
+    assert list(catalog.products) == PRODUCTS
+    assert catalog.products[-1] == PRODUCTS[-1]
+    assert catalog.products[1:] == PRODUCTS[1:]
+    assert dict(catalog.product_item_dict) == {p['asin']: p for p in PRODUCTS}
+    assert dict(catalog.product_prices) == PRICES
+    assert catalog.attribute_to_asins == ATTRIBUTE_TO_ASINS
+    assert catalog.goals == GOALS
+
+def test_catalog_lookups(catalog):
+    assert 'C3' in catalog.product_item_dict
+    assert 'B07ZQXMK2' not in catalog.product_item_dict
+    assert catalog.product_prices.get('missing') is None
+    with pytest.raises(KeyError):
+        catalog.product_item_dict['missing']
+    with pytest.raises(IndexError):
+        catalog.products[3]
+    for asin in ['', 'A', 'A0', 'A10', 'Z', 'B07ZQXMK2M']:
+        assert asin not in catalog.product_item_dict
+    assert [catalog.index(p['asin']) for p in PRODUCTS] == [0, 1, 2]
+    assert random.sample(catalog.products, k=3) is not None
+
+def test_goals_are_copies(catalog):
+    goals = catalog.goals
+    goals[0]['instruction_text'] = 'Find anything'
+    assert catalog.goals == GOALS
+
+def test_load_catalog_matches_load_products(tmp_path):
+    path = str(tmp_path / 'items.catalog')
+    write_catalog(path, PRODUCTS, PRICES, ATTRIBUTE_TO_ASINS, GOALS)
+    all_products, product_item_dict, product_prices, attribute_to_asins = load_catalog(path)
+    assert list(all_products) == PRODUCTS
+    assert product_item_dict['A1'] is all_products[1]
+    assert product_prices['A1'] == 20.5
+    assert attribute_to_asins == ATTRIBUTE_TO_ASINS
+
+def test_not_a_catalog(tmp_path):
+    path = tmp_path / 'items.json'
+    path.write_text('[]')
+    with pytest.raises(ValueError):
+        MappedCatalog(str(path))
+
+def test_catalog_path():
+    assert catalog_path('data/items.json', 1000) == 'data/items.1000.synthetic.catalog'
+    assert catalog_path('data/items.json', None, True) == 'data/items.all.human.catalog'
+
+def test_open_catalog_checks_source(tmp_path):
+    items_path = tmp_path / 'items.json'
+    items_path.write_text('[]')
+    path = catalog_path(str(items_path), 1000)
+    assert open_catalog(str(items_path), 1000) is None
+    write_catalog(path, PRODUCTS, PRICES, ATTRIBUTE_TO_ASINS, GOALS, source=source_stamp(str(items_path)))
+    catalog = open_catalog(str(items_path), 1000)
+    assert catalog is not None and list(catalog.products) == PRODUCTS
+    assert open_catalog(str(items_path), 100) is None
+
+    # the items file changed since the catalog was built
+    items_path.write_text('[{}]')
+    assert open_catalog(str(items_path), 1000) is None
+    os.utime(items_path, ns=(0, catalog.header['source']['mtime_ns']))
+    assert open_catalog(str(items_path), 1000) is None
+
+def test_catalog_without_source_is_not_current(tmp_path):
+    items_path = tmp_path / 'items.json'
+    items_path.write_text('[]')
+    write_catalog(catalog_path(str(items_path)), PRODUCTS, PRICES, ATTRIBUTE_TO_ASINS, GOALS)
+    assert open_catalog(str(items_path)) is None
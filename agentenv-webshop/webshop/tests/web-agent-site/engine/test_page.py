@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+from bs4 import BeautifulSoup
+from web_agent_site.engine.engine import ACTION_TO_TEMPLATE, END_BUTTON
+from web_agent_site.engine.page import Page
+from web_agent_site.envs.web_agent_text_env import WebAgentTextEnv, page_templates
+
+PRODUCT = {
+    'asin': 'B07ZQXMK2L',
+    'Title': 'Red <Cotton> Shirt & "Tie"',
+    'Price': '$10.00 to $12.50',
+    'Rating': 4.5,
+    'MainImage': 'https://example.com/shirt.jpg',
+    'BulletPoints': ['soft', '  machine washable\n', ' ', '\n', 'café &amp; more'],
+    'Description': 'A shirt.\nWith two lines.',
+    'Reviews': [
+        {'title': 'Great', 'body': 'Fits well', 'score': 5},
+        {'title': ' ', 'body': '\n  \n', 'score': '3'},
+    ],
+    'Attributes': ['cotton', ''],
+    'category': 'fashion',
+    'query': 'shirt',
+    'product_category': 'Clothing › Shirts',
+    'options': {'size': ['small', 'large', 7], 'color': ['red', 'Red'], 'fit': []},
+    'option_to_image': {'red': 'https://example.com/red.jpg'},
+}
+SPARSE_PRODUCT = {'asin': 'A1', 'Title': ' ', 'Price': '\n', 'options': {}, 'option_to_image': {}}
+COMMON = dict(
+    session_id='fixed_0',
+    instruction_text='Find a red shirt, price lower than 20.00 dollars',
+    keywords=['red', 'shirt'],
+    page=1,
+    asin=PRODUCT['asin'],
+    options={'size': 'small'},
+)
+PAGES = [
+    ('start', {}),
+    ('start', dict(instruction_text='')),
+    ('search[red shirt]', dict(products=[PRODUCT, SPARSE_PRODUCT], total=2)),
+    ('search[red shirt]', dict(products=[PRODUCT, SPARSE_PRODUCT, PRODUCT], total=23, page=3)),
+    ('search[red shirt]', dict(products=[], total=0, instruction_text=' ')),
+    ('click[B07ZQXMK2L]', dict(product_info=PRODUCT, show_attrs=False)),
+    ('click[B07ZQXMK2L]', dict(product_info=PRODUCT, show_attrs=True, instruction_text=None)),
+    ('click[A1]', dict(product_info=SPARSE_PRODUCT, show_attrs=False, asin='A1')),
+    *[(f'click[{sub_page}]', dict(product_info=PRODUCT)) for sub_page in ACTION_TO_TEMPLATE],
+    *[(f'click[{sub_page}]', dict(product_info=SPARSE_PRODUCT)) for sub_page in ACTION_TO_TEMPLATE],
+    (f'click[{END_BUTTON}]', dict(reward=0.0)),
+    (f'click[{END_BUTTON}]', dict(
+        reward=0.5, reward_info={'r_att': 1.0}, options={'size': '<small>', 'fit': "'slim'"},
+        goal={'asin': 'A1', 'goal_options': ['small'], 'price_upper': 20.0, 'query': ' '},
+        purchased_attrs=['cotton'], query='shirt', category='fashion', mturk_code='',
+    )),
+]
+
+def html_observation(html):
+    """The text observation, actions and clickables of `observation_mode='text'`, from the HTML"""
+    env = WebAgentTextEnv.__new__(WebAgentTextEnv)
+    env.observation_mode = 'text'
+    env.instruction_text = None
+    env.browser = SimpleNamespace(current_url=None, page_source=html)
+    env._parsed_page = None
+    actions = env.get_available_actions()
+    return env.observation, actions, env.text_to_clickable
+
+@pytest.mark.parametrize('action, kwargs', PAGES)
+def test_page_matches_html(action, kwargs):
+    page = Page(action, page_templates, **dict(COMMON, **kwargs))
+    text, actions, text_to_clickable = html_observation(page.html)
+    assert page.text() == text
+    assert list(page.clickables()) == actions['clickables']
+    assert page.has_search_bar == actions['has_search_bar']
+    for clickable_name, element in text_to_clickable.items():
+        clickable = page.clickables()[clickable_name]
+        assert clickable.get('class') == element.get('class')
+        assert clickable.get('name') == element.get('name')
+
+@pytest.mark.parametrize('action, kwargs', [p for p in PAGES if END_BUTTON not in p[0]])
+def test_instruction_text_matches_html(action, kwargs):
+    page = Page(action, page_templates, **dict(COMMON, **kwargs))
+    html_obj = BeautifulSoup(page.html, 'html.parser')
+    assert page.instruction_text() == html_obj.find(id='instruction-text').h4.text
+
+def test_clickables_are_copies():
+    page = Page('start', page_templates, **COMMON)
+    page.clickables().clear()
+    assert list(page.clickables()) == ['search']
+
+def test_unknown_action():
+    with pytest.raises(ValueError):
+        Page('scroll[down]', page_templates, **COMMON)
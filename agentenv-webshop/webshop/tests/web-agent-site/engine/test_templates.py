@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from flask import render_template_string
+from web_agent_site.engine.engine import (
+    map_action_to_html, read_html_template, TemplateRegistry, ACTION_TO_TEMPLATE,
+    END_BUTTON, TEMPLATE_DIR
+)
+from web_agent_site.envs.web_agent_text_env import app, page_templates
+
+PRODUCT = {
+    'asin': 'B07ZQXMK2L',
+    'Title': 'Red <Cotton> Shirt & Tie',
+    'Price': '$10.00',
+    'Rating': 4.5,
+    'MainImage': 'https://example.com/shirt.jpg',
+    'BulletPoints': ['soft', 'machine "washable"'],
+    'Description': 'A shirt.',
+    'Reviews': [{'title': 'Great', 'body': 'Fits well', 'score': 5}],
+    'Attributes': ['cotton'],
+    'category': 'fashion',
+    'query': 'shirt',
+    'product_category': 'Clothing › Shirts',
+    'options': {'size': ['small', 'large'], 'color': ['red']},
+    'option_to_image': {'red': 'https://example.com/red.jpg'},
+}
+COMMON = dict(
+    session_id='fixed_0',
+    instruction_text='Find a red shirt, price lower than 20.00 dollars',
+    keywords=['red', 'shirt'],
+    page=1,
+    asin=PRODUCT['asin'],
+    options={'size': 'small'},
+)
+ACTIONS = [
+    ('start', {}),
+    ('search[red shirt]', dict(products=[PRODUCT, dict(PRODUCT, asin='A1')], total=2)),
+    ('click[B07ZQXMK2L]', dict(product_info=PRODUCT, show_attrs=False)),
+    ('click[B07ZQXMK2L]', dict(product_info=PRODUCT, show_attrs=True)),
+    *[(f'click[{sub_page}]', dict(product_info=PRODUCT)) for sub_page in ACTION_TO_TEMPLATE],
+    (f'click[{END_BUTTON}]', dict(
+        reward=0.5, reward_info={'r_att': 1.0}, goal={'asin': 'A1', 'goal_options': ['small']},
+        purchased_attrs=['cotton'], query='shirt', category='fashion',
+    )),
+]
+
+class RequestTemplates:
+    """How the simulator rendered pages before: read from disk and compiled in a request context, on every call"""
+    def render(self, name, **context):
+        return render_template_string(read_html_template(os.path.join(TEMPLATE_DIR, name)), **context)
+
+def render_in_request(action, **kwargs):
+    with app.app_context(), app.test_request_context():
+        return map_action_to_html(action, templates=RequestTemplates(), **kwargs)
+
+@pytest.mark.parametrize('action, kwargs', ACTIONS)
+def test_registry_renders_like_flask(action, kwargs):
+    kwargs = dict(COMMON, **kwargs)
+    assert map_action_to_html(action, templates=page_templates, **kwargs) == render_in_request(action, **kwargs)
+
+def test_templates_compiled_once():
+    templates = TemplateRegistry(app)
+    kwargs = dict(COMMON, product_info=PRODUCT, show_attrs=False)
+    map_action_to_html('click[B07ZQXMK2L]', templates=templates, **kwargs)
+    template = templates.env.get_template('item_page.html')
+    map_action_to_html('click[B07ZQXMK2L]', templates=templates, **kwargs)
+    assert templates.env.get_template('item_page.html') is template
+
+def test_unknown_action():
+    with pytest.raises(ValueError):
+        map_action_to_html('scroll[down]', templates=page_templates, **COMMON)
@@ -0,0 +1,142 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from web_agent_site.envs import web_agent_text_env
+from web_agent_site.envs.web_agent_text_env import SimServer, WebAgentTextEnv, get_catalog
+
+BASE_URL = 'http://127.0.0.1:3000'
+
+PRODUCTS = [
+    {'asin': 'A1', 'name': 'Red Shirt', 'category': 'fashion', 'query': 'shirt',
+     'Title': 'Red Shirt', 'Price': '$10.00', 'Rating': 4.0, 'Description': 'A red shirt.',
+     'BulletPoints': ['cotton'], 'Reviews': [], 'Attributes': ['cotton'],
+     'options': {'size': ['small', 'large']}, 'option_to_image': {}},
+    {'asin': 'A2', 'name': 'Blue Mug', 'category': 'home', 'query': 'mug',
+     'Title': 'Blue Mug & Saucer', 'Price': '$20.00', 'Rating': 'N.A.', 'Description': ' ',
+     'BulletPoints': [], 'Reviews': [{'title': 'Nice', 'body': 'Holds coffee', 'score': 4}],
+     'Attributes': [], 'options': {}, 'option_to_image': {}},
+]
+
+class SearchEngine:
+    """Returns every product for any keywords"""
+    def search(self, keywords, k):
+        return [SimpleNamespace(docid=p['asin']) for p in PRODUCTS][:k]
+
+    def doc(self, docid):
+        return SimpleNamespace(raw=lambda: json.dumps({'id': docid}))
+
+@pytest.fixture
+def loader_calls(monkeypatch):
+    """Replace the product, search engine and goal loaders with small fakes that count their calls"""
+    calls = {'load_products': 0, 'init_search_engine': 0, 'get_goals': 0}
+
+    def load_products(filepath, num_products=None, human_goals=True):
+        calls['load_products'] += 1
+        product_item_dict = {p['asin']: p for p in PRODUCTS}
+        return list(PRODUCTS), product_item_dict, {'A1': 10.0, 'A2': 20.0}, {}
+
+    def init_search_engine(num_products=None):
+        calls['init_search_engine'] += 1
+        return SearchEngine()
+
+    def get_goals(all_products, product_prices, human_goals=True):
+        calls['get_goals'] += 1
+        return [
+            {'asin': p['asin'], 'instruction_text': f"Find {p['name']}", 'weight': 1}
+            for p in all_products
+        ]
+
+    monkeypatch.setattr(web_agent_text_env, 'load_products', load_products)
+    monkeypatch.setattr(web_agent_text_env, 'init_search_engine', init_search_engine)
+    monkeypatch.setattr(web_agent_text_env, 'get_goals', get_goals)
+    monkeypatch.setattr(web_agent_text_env, '_catalogs', {})
+    return calls
+
+def test_servers_share_catalog(loader_calls):
+    server_1 = SimServer(BASE_URL, 'items.json', num_products=100)
+    server_2 = SimServer(BASE_URL, 'items.json', num_products=100)
+    assert server_1.catalog is server_2.catalog
+    assert server_1.goals is server_2.goals
+    assert server_1.search_engine is server_2.search_engine
+    assert server_1.user_sessions is not server_2.user_sessions
+    assert loader_calls == {'load_products': 1, 'init_search_engine': 1, 'get_goals': 1}
+
+def test_catalog_per_arguments(loader_calls):
+    catalog = get_catalog('items.json', num_products=100)
+    assert get_catalog('items.json', num_products=100, human_goals=None) is catalog
+    assert get_catalog('items.json', num_products=1000) is not catalog
+    assert get_catalog('items.json', num_products=100, human_goals=1) is not catalog
+    assert loader_calls['load_products'] == 3
+
+def test_sessions_are_independent(loader_calls):
+    server_1 = SimServer(BASE_URL, 'items.json', num_products=100)
+    server_2 = SimServer(BASE_URL, 'items.json', num_products=100)
+    html_1, _, _ = server_1.receive('abc', None, session_int=0)
+    html_2, _, _ = server_2.receive('abc', None, session_int=1)
+    assert server_1.user_sessions['abc']['goal'] is server_1.goals[0]
+    assert server_2.user_sessions['abc']['goal'] is server_2.goals[1]
+    assert server_1.goals[0]['instruction_text'] in html_1
+    assert server_1.goals[1]['instruction_text'] in html_2
+
+def test_assigned_instruction_text_keeps_goals(loader_calls):
+    server_1 = SimServer(BASE_URL, 'items.json', num_products=100)
+    server_2 = SimServer(BASE_URL, 'items.json', num_products=100)
+    instruction_text = server_1.goals[0]['instruction_text']
+    server_1.assigned_instruction_text = 'Find anything'
+    html, _, _ = server_1.receive('abc', None, session_int=0)
+    assert 'Find anything' in html
+    assert server_1.user_sessions['abc']['goal']['instruction_text'] == 'Find anything'
+    assert server_2.goals[0]['instruction_text'] == instruction_text
+
+ACTIONS = [
+    'search[shirt]', 'click[a2]', 'click[reviews]', 'click[< prev]', 'click[description]',
+    'click[< prev]', 'click[< prev]', 'click[a1]', 'click[large]', 'click[small]',
+    'click[features]', 'click[back to search]', 'search[mug]', 'click[next >]',
+    'click[missing]', 'click[a1]', 'click[attributes]', 'click[< prev]', 'click[buy now]',
+]
+
+def rollout(env, session):
+    steps = [(env.reset(session=session)[0], env.instruction_text, env.get_available_actions())]
+    for action in ACTIONS:
+        steps.append((*env.step(action), env.get_available_actions()))
+    return steps
+
+def test_structured_observation_matches_text(loader_calls, monkeypatch):
+    monkeypatch.setattr(web_agent_text_env, 'get_reward', lambda *args, **kwargs: (0.5, {}))
+    text_env = WebAgentTextEnv(observation_mode='text', num_products=100, show_attrs=True)
+    structured_env = WebAgentTextEnv(observation_mode='text_structured', num_products=100, show_attrs=True)
+    assert text_env.server.render_html
+    assert not structured_env.server.render_html
+    assert rollout(structured_env, 1) == rollout(text_env, 1)
+    assert structured_env.browser.page_source == text_env.browser.page_source
+
+def test_structured_observation_on_shared_server(loader_calls):
+    server = SimServer(BASE_URL, 'items.json', num_products=100)
+    structured_env = WebAgentTextEnv(observation_mode='text_structured', server=server)
+    text_env = WebAgentTextEnv(observation_mode='text', server=server)
+    server.render_html = False
+    assert rollout(structured_env, 0)[:4] == rollout(text_env, 0)[:4]
+
+@pytest.mark.parametrize('observation_mode', ['text', 'text_rich', 'html'])
+def test_pages_parsed_once(loader_calls, monkeypatch, observation_mode):
+    parses = []
+    beautiful_soup = web_agent_text_env.BeautifulSoup
+    monkeypatch.setattr(
+        web_agent_text_env, 'BeautifulSoup',
+        lambda html, *args: parses.append(html) or beautiful_soup(html, *args),
+    )
+    env = WebAgentTextEnv(observation_mode=observation_mode, num_products=100)
+    assert env.instruction_text.startswith('Instruction: ')
+    env.get_available_actions()
+    env.get_instruction_text()
+    assert parses == [env.browser.page_source]
+    env.step('search[shirt]')
+    env.get_available_actions()
+    assert env.observation == env.observation
+    env.step('click[missing]')
+    assert len(parses) == 2 and parses[-1] is env.browser.page_source
+    env.step('click[a1]')
+    env.get_available_actions()
+    env.get_available_actions()
+    assert len(parses) == 3
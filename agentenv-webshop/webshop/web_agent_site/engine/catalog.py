@@ -0,0 +1,306 @@
+"""
+Preprocessed, memory-mapped product catalogs.
+
+`load_products` parses and normalises the items JSON on every start. `build_catalog` runs it
+(and `get_goals`) once and writes the result to a catalog file, which `MappedCatalog` maps
+into memory: products are decoded on access, and the pages of the file are shared by all
+processes that map it.
+
+    python -m web_agent_site.engine.catalog --num_products 1000
+
+File layout: an 8 byte magic, the length of a JSON header (uint64), the header, then the
+sections it lists, each 8-byte aligned:
+    asins       -- ASINs in catalog order, 10 bytes each, NUL padded
+    asin_order  -- positions sorted by ASIN (uint32), for lookups by binary search
+    offsets     -- start of every product in `products` and its end (uint64)
+    prices      -- the price of every product (float64)
+    products    -- the products as UTF-8 JSON
+    attribute_to_asins, goals -- JSON
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+
+from web_agent_site.utils import DEFAULT_FILE_PATH
+
+MAGIC = b'WSCATLG\x01'
+ASIN_WIDTH = 10
+ARRAY_SECTIONS = {'asin_order': 'I', 'offsets': 'Q', 'prices': 'd'}
+
+
+def catalog_path(file_path=DEFAULT_FILE_PATH, num_products=None, human_goals=0):
+    """Where the catalog built from `file_path` with these arguments is written and looked for"""
+    stem = os.path.splitext(file_path)[0]
+    size = 'all' if num_products is None else num_products
+    goals = 'human' if human_goals else 'synthetic'
+    return f'{stem}.{size}.{goals}.catalog'
+
+
+def source_stamp(file_path):
+    """Size and modification time of the items file a catalog is built from"""
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def write_catalog(path, all_products, product_prices, attribute_to_asins, goals, human_goals=0, source=None):
+    """
+    Write loaded products, prices, attribute map and goals to a catalog file. `source`
+    is the `source_stamp` of the items file; catalogs without one are never current.
+    """
+    asins = [p['asin'] for p in all_products]
+    for asin in asins:
+        if len(asin.encode('ascii')) > ASIN_WIDTH:
+            raise ValueError(f'ASIN {asin} is longer than {ASIN_WIDTH} characters.')
+    blobs = [json.dumps(p, default=_json_default).encode('utf-8') for p in all_products]
+    offsets = array('Q', [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    sections = {
+        'asins': b''.join(asin.encode('ascii').ljust(ASIN_WIDTH, b'\0') for asin in asins),
+        'asin_order': array('I', sorted(range(len(asins)), key=asins.__getitem__)).tobytes(),
+        'offsets': offsets.tobytes(),
+        'prices': array('d', [product_prices[asin] for asin in asins]).tobytes(),
+        'products': b''.join(blobs),
+        'attribute_to_asins': json.dumps(
+            {a: sorted(asins) for a, asins in attribute_to_asins.items()}
+        ).encode('utf-8'),
+        'goals': json.dumps(goals, default=_json_default).encode('utf-8'),
+    }
+    header = {
+        'version': 1,
+        'num_products': len(asins),
+        'human_goals': bool(human_goals),
+        'byteorder': sys.byteorder,
+        'source': source,
+        'sections': {},
+    }
+    # section offsets are relative to the end of the header, so they do not depend on its length
+    position = 0
+    for name, data in sections.items():
+        header['sections'][name] = [position, len(data)]
+        position = _align(position + len(data))
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (_align(16 + len(header_bytes)) - 16 - len(header_bytes))
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name, data in sections.items():
+            f.write(data)
+            f.write(b'\0' * (_align(len(data)) - len(data)))
+    os.replace(tmp_path, path)
+
+
+def build_catalog(file_path=DEFAULT_FILE_PATH, num_products=None, human_goals=0, path=None):
+    """Load and normalise the products of `file_path`, generate the goals and write them to a catalog file"""
+    from web_agent_site.engine.engine import load_products
+    from web_agent_site.engine.goal import get_goals
+
+    all_products, _, product_prices, attribute_to_asins = \
+        load_products(filepath=file_path, num_products=num_products, human_goals=human_goals)
+    goals = get_goals(all_products, product_prices, human_goals)
+    path = catalog_path(file_path, num_products, human_goals) if path is None else path
+    write_catalog(
+        path, all_products, product_prices, attribute_to_asins, goals, human_goals,
+        source=source_stamp(file_path),
+    )
+    print(f'Wrote {len(all_products)} products and {len(goals)} goals to {path}.')
+    return path
+
+
+class MappedCatalog:
+    """A catalog file mapped into memory. Products are decoded when they are accessed"""
+    def __init__(self, path, cache_size=4096):
+        """
+        Arguments:
+        path (`str`) -- The catalog file, written by `write_catalog`
+        cache_size (`int`) -- Number of decoded products kept per process
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a WebShop catalog file.')
+        header_length = int.from_bytes(self._mmap[8:16], 'little')
+        self.header = json.loads(self._mmap[16:16 + header_length])
+        if self.header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was built on a {self.header["byteorder"]} endian machine; rebuild it.')
+        self.human_goals = self.header['human_goals']
+
+        data = memoryview(self._mmap)[16 + header_length:]
+        # every view of the map, each after the view it is taken from, released by `close`
+        self._views = [data]
+        self._sections = {}
+        for name, (start, length) in self.header['sections'].items():
+            section = data[start:start + length]
+            self._views.append(section)
+            if name in ARRAY_SECTIONS:
+                section = section.cast(ARRAY_SECTIONS[name])
+                self._views.append(section)
+            self._sections[name] = section
+        self._asins = self._sections['asins']
+        self._asin_order = self._sections['asin_order']
+        self._offsets = self._sections['offsets']
+        self._prices = self._sections['prices']
+        self._products = self._sections['products']
+        self.product = lru_cache(maxsize=cache_size)(self._decode_product)
+
+        self.products = MappedProducts(self)
+        self.product_item_dict = MappedProductDict(self)
+        self.product_prices = MappedPrices(self)
+        self._attribute_to_asins = None
+        self._goals = None
+
+    def __len__(self):
+        return self.header['num_products']
+
+    def asin(self, i):
+        return bytes(self._asins[i * ASIN_WIDTH:(i + 1) * ASIN_WIDTH]).rstrip(b'\0').decode('ascii')
+
+    def index(self, asin):
+        """The position of `asin` in the catalog, or -1"""
+        if not isinstance(asin, str):
+            return -1
+        order = self._asin_order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.asin(order[mid]) < asin:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self.asin(order[lo]) == asin:
+            return order[lo]
+        return -1
+
+    def is_current(self, file_path):
+        """Whether the catalog was built from `file_path` as it is now"""
+        source = self.header.get('source')
+        return source is not None and os.path.exists(file_path) and source == source_stamp(file_path)
+
+    def _decode_product(self, i):
+        return json.loads(bytes(self._products[self._offsets[i]:self._offsets[i + 1]]))
+
+    def price(self, i):
+        return self._prices[i]
+
+    @property
+    def attribute_to_asins(self):
+        """The ASINs of every attribute, decoded on first access"""
+        if self._attribute_to_asins is None:
+            attribute_to_asins = json.loads(bytes(self._sections['attribute_to_asins']))
+            self._attribute_to_asins = {a: set(asins) for a, asins in attribute_to_asins.items()}
+        return self._attribute_to_asins
+
+    @property
+    def goals(self):
+        """A new copy of the goals, as returned by `get_goals`"""
+        return json.loads(bytes(self._sections['goals']))
+
+    def close(self):
+        self.product.cache_clear()
+        self._sections = self._asins = self._asin_order = None
+        self._offsets = self._prices = self._products = None
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+
+class MappedProducts(Sequence):
+    """The products of a `MappedCatalog` in catalog order, like the `all_products` list of `load_products`"""
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.catalog.product(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('product index out of range')
+        return self.catalog.product(i)
+
+
+class MappedProductDict(Mapping):
+    """ASIN to product of a `MappedCatalog`, like the `product_item_dict` of `load_products`"""
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, asin):
+        i = self.catalog.index(asin)
+        if i == -1:
+            raise KeyError(asin)
+        return self.catalog.product(i)
+
+    def __contains__(self, asin):
+        return self.catalog.index(asin) != -1
+
+    def __iter__(self):
+        return (self.catalog.asin(i) for i in range(len(self.catalog)))
+
+    def __len__(self):
+        return len(self.catalog)
+
+
+class MappedPrices(MappedProductDict):
+    """ASIN to price of a `MappedCatalog`, like the `product_prices` of `load_products`"""
+    def __getitem__(self, asin):
+        i = self.catalog.index(asin)
+        if i == -1:
+            raise KeyError(asin)
+        return self.catalog.price(i)
+
+
+def open_catalog(file_path=DEFAULT_FILE_PATH, num_products=None, human_goals=0):
+    """
+    Map the catalog built from `file_path` with these arguments, or return None if there
+    is none or the items file changed since it was built
+    """
+    path = catalog_path(file_path, num_products, human_goals)
+    if not os.path.exists(path):
+        return None
+    catalog = MappedCatalog(path)
+    if not catalog.is_current(file_path):
+        print(f'{path} is older than {file_path}; loading the products instead. Rebuild it with build_catalog.')
+        catalog.close()
+        return None
+    return catalog
+
+
+def load_catalog(path):
+    """Map a catalog file and return what `load_products` returns for it"""
+    catalog = MappedCatalog(path)
+    return catalog.products, catalog.product_item_dict, catalog.product_prices, catalog.attribute_to_asins
+
+
+def _align(n):
+    return (n + 7) // 8 * 8
+
+
+def _json_default(o):
+    # `load_products` leaves sets in products only through user code; store them as lists
+    if isinstance(o, set):
+        return sorted(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a memory-mapped WebShop catalog.')
+    parser.add_argument('--file_path', default=DEFAULT_FILE_PATH, help='The items JSON file')
+    parser.add_argument('--num_products', type=int, default=None, help='Use the first products only, e.g. 1000')
+    parser.add_argument('--human_goals', action='store_true', help='Build human goals instead of synthetic ones')
+    parser.add_argument('--output', default=None, help='Defaults to the path the server looks for')
+    args = parser.parse_args()
+    build_catalog(args.file_path, args.num_products, args.human_goals, args.output)
@@ -11,7 +11,8 @@ from decimal import Decimal
 import cleantext
 from tqdm import tqdm
 from rank_bm25 import BM25Okapi
-from flask import render_template_string
+from flask import render_template
+from jinja2 import FileSystemLoader
 from rich import print
 from pyserini.search.lucene import LuceneSearcher
 
@@ -41,19 +42,22 @@ ACTION_TO_TEMPLATE = {
     'Attributes': 'attributes_page.html',
 }
 
-def map_action_to_html(action, **kwargs):
+def map_action_to_html(action, templates=None, **kwargs):
+    """
+    Render the page of `action`. Without `templates` (a `TemplateRegistry`), the templates are
+    rendered by the current Flask app and need its request context.
+    """
+    render = render_template if templates is None else templates.render
     action_name, action_arg = parse_action(action)
     if action_name == 'start':
-        path = os.path.join(TEMPLATE_DIR, 'search_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render(
+            'search_page.html',
             session_id=kwargs['session_id'],
             instruction_text=kwargs['instruction_text'],
         )
     elif action_name == 'search':
-        path = os.path.join(TEMPLATE_DIR, 'results_page.html')
-        html = render_template_string(
-            read_html_template(path=path),
+        html = render(
+            'results_page.html',
             session_id=kwargs['session_id'],
             products=kwargs['products'],
             keywords=kwargs['keywords'],
@@ -62,9 +66,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs['instruction_text'],
         )
     elif action_name == 'click' and action_arg == END_BUTTON:
-        path = os.path.join(TEMPLATE_DIR, 'done_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render(
+            'done_page.html',
             session_id=kwargs['session_id'],
             reward=kwargs['reward'],
             asin=kwargs['asin'],
@@ -79,9 +82,8 @@ def map_action_to_html(action, **kwargs):
             product_category=kwargs.get('product_category'),
         )
     elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
-        path = os.path.join(TEMPLATE_DIR, ACTION_TO_TEMPLATE[action_arg])
-        html = render_template_string(
-            read_html_template(path),
+        html = render(
+            ACTION_TO_TEMPLATE[action_arg],
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -91,9 +93,8 @@ def map_action_to_html(action, **kwargs):
             instruction_text=kwargs.get('instruction_text')
         )
     elif action_name == 'click':
-        path = os.path.join(TEMPLATE_DIR, 'item_page.html')
-        html = render_template_string(
-            read_html_template(path),
+        html = render(
+            'item_page.html',
             session_id=kwargs['session_id'],
             product_info=kwargs['product_info'],
             keywords=kwargs['keywords'],
@@ -108,6 +109,27 @@ def map_action_to_html(action, **kwargs):
     return html
 
 
+class TemplateRegistry:
+    """
+    Page templates, loaded and compiled once and rendered without a Flask request context.
+    `url_for` builds the links from the routes of `app` as it does in a request to http://localhost/
+    """
+    def __init__(self, app, template_dir=TEMPLATE_DIR):
+        self.app = app
+        self.env = app.jinja_env.overlay(loader=FileSystemLoader(template_dir), auto_reload=False)
+        self.env.globals = dict(app.jinja_env.globals, url_for=self.url_for)
+        self._url_adapter = None
+
+    def url_for(self, endpoint, **values):
+        # bound on first use, once all routes of `app` are registered
+        if self._url_adapter is None:
+            self._url_adapter = self.app.url_map.bind('localhost', url_scheme='http')
+        return self._url_adapter.build(endpoint, values)
+
+    def render(self, name, **context):
+        return self.env.get_template(name).render(context)
+
+
 def read_html_template(path):
     with open(path) as f:
         template = f.read()
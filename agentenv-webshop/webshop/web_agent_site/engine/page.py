@@ -0,0 +1,268 @@
+"""
+Structured WebShop pages. A `Page` holds the action and arguments a page is rendered
+from with `map_action_to_html`, and builds the text observation, clickables and
+instruction of the page from them without rendering and parsing its HTML.
+
+The text nodes follow the templates: what BeautifulSoup's html.parser yields for the
+rendered page, with whitespace-only strings collapsed to '\n' or ' ' outside <pre>.
+"""
+from pprint import pformat
+
+from jinja2.utils import htmlsafe_json_dumps
+
+from web_agent_site.engine.engine import (
+    map_action_to_html,
+    parse_action,
+    ACTION_TO_TEMPLATE,
+    END_BUTTON,
+)
+
+# whitespace for BeautifulSoup (`BeautifulSoup.ASCII_SPACES`)
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+_DELETE_SPACES = str.maketrans('', '', ASCII_SPACES)
+_MISSING = object()
+
+SEARCH_BUTTON = {'class': ['btn', 'btn-success'], 'type': 'submit'}
+BACK_TO_SEARCH_BUTTON = {'class': ['btn', 'btn-success'], 'type': 'submit'}
+PREV_BUTTON = {'class': ['btn', 'btn-primary'], 'type': 'submit'}
+NEXT_BUTTON = {'class': ['btn', 'btn-primary'], 'type': 'submit'}
+SUB_PAGE_BUTTON = {'class': ['btn', 'btn-primary'], 'type': 'submit'}
+BUY_BUTTON = {'class': ['btn', 'btn-lg', 'purchase'], 'type': 'submit'}
+
+
+class Page:
+    """A WebShop page as the structured data it is rendered from"""
+    def __init__(self, action, templates, **kwargs):
+        """
+        Arguments:
+        action (`str`) -- The action of the page, as for `map_action_to_html`
+        templates (`TemplateRegistry`) -- Renders the page when its HTML is needed
+        kwargs -- The arguments of `map_action_to_html`
+        """
+        self.action = action
+        self.templates = templates
+        self.kwargs = kwargs
+        self._html = None
+        self._texts = None
+        self._clickables = None
+
+        action_name, action_arg = parse_action(action)
+        if action_name == 'start':
+            self.name = 'search_page'
+        elif action_name == 'search':
+            self.name = 'results_page'
+        elif action_name == 'click' and action_arg == END_BUTTON:
+            self.name = 'done_page'
+        elif action_name == 'click' and action_arg in ACTION_TO_TEMPLATE:
+            self.name = 'item_sub_page'
+            self.sub_page = action_arg
+        elif action_name == 'click':
+            self.name = 'item_page'
+        else:
+            raise ValueError('Action name not recognized.')
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._html = map_action_to_html(self.action, templates=self.templates, **self.kwargs)
+        return self._html
+
+    @property
+    def has_search_bar(self):
+        return self.name == 'search_page'
+
+    def text(self):
+        """The observation of `observation_mode='text'`"""
+        return ' [SEP] '.join(t.strip() for t in self.texts() if t != '\n')
+
+    def texts(self):
+        """The visible text nodes of the page, in order"""
+        if self._texts is None:
+            self._texts = getattr(self, f'_{self.name}_texts')()
+        return self._texts
+
+    def clickables(self):
+        """
+        Clickable text to the attributes of its element, as the `text_to_clickable` of
+        `WebAgentTextEnv` maps it to the element: buttons and product links, then options
+        """
+        if self._clickables is None:
+            self._clickables = getattr(self, f'_{self.name}_clickables')()
+        return dict(self._clickables)
+
+    def instruction_text(self):
+        """The text of the instruction heading, or None on the done page"""
+        instruction_text = _str(self.kwargs.get('instruction_text', _MISSING))
+        if self.name == 'search_page':
+            return f'Instruction: {instruction_text}'
+        if self.name == 'done_page':
+            return None
+        return f'Instruction:{instruction_text}'
+
+    def _header_texts(self):
+        # instruction, back to search and prev of the results, item and item sub pages
+        texts = ['Instruction:', *_node(_str(self.kwargs.get('instruction_text', _MISSING))), 'Back to Search']
+        if self.name != 'results_page':
+            texts.append('< Prev')
+        return texts
+
+    def _search_page_texts(self):
+        return [
+            'WebShop', 'Instruction: ', *_node(_str(self.kwargs['instruction_text'])), 'Search'
+        ]
+
+    def _results_page_texts(self):
+        page = self.kwargs['page']
+        texts = self._header_texts()
+        texts += _node(f"Page {_str(page)} (Total results: {_str(self.kwargs['total'])})")
+        if page > 1:
+            texts.append('< Prev')
+        texts.append('Next >')
+        for item in self.kwargs['products']:
+            texts += _node(_str(_attr(item, 'asin')))
+            texts += _node(_str(_attr(item, 'Title')))
+            texts += _node(_str(_attr(item, 'Price')))
+        return texts
+
+    def _item_page_texts(self):
+        product_info = self.kwargs['product_info']
+        texts = self._header_texts()
+        for option_name, option_contents in _attr(product_info, 'options').items():
+            texts += _node(_str(option_name))
+            for option_content in option_contents:
+                texts += _node(_str(option_content))
+        texts += _node(_str(_attr(product_info, 'Title')))
+        texts += _node(f"Price: {_str(_attr(product_info, 'Price'))}")
+        texts += _node(f"Rating: {_str(_attr(product_info, 'Rating'))}")
+        texts += ['Description', 'Features', 'Reviews']
+        if self.kwargs['show_attrs']:
+            texts.append('Attributes')
+        texts.append('Buy Now')
+        return texts
+
+    def _item_sub_page_texts(self):
+        product_info = self.kwargs['product_info']
+        texts = self._header_texts()
+        if self.sub_page == 'Description':
+            texts += _node(_str(_attr(product_info, 'Description')))
+        elif self.sub_page == 'Features':
+            for bulletpoint in _iter(_attr(product_info, 'BulletPoints')):
+                texts += _node(f' {_str(bulletpoint)}')
+        elif self.sub_page == 'Reviews':
+            for review in _iter(_attr(product_info, 'Reviews')):
+                texts += _node(f'"{_str(_attr(review, "title"))}"')
+                texts += _node(_str(_attr(review, 'score')))
+                texts += _node(_str(_attr(review, 'body')))
+        elif self.sub_page == 'Attributes':
+            for attribute in _iter(_attr(product_info, 'Attributes')):
+                texts += _node(f' {_str(attribute)}')
+            for key in ('category', 'query', 'product_category'):
+                texts += _node(_str(_attr(product_info, key)))
+        return texts
+
+    def _done_page_texts(self):
+        kwargs = self.kwargs
+        goal = kwargs.get('goal')
+        policies = self.templates.env.policies
+        options = htmlsafe_json_dumps(
+            kwargs['options'], dumps=policies['json.dumps_function'], **policies['json.dumps_kwargs']
+        )
+        texts = ['Thank you for shopping with us!', 'Your code: ']
+        texts += _node(_str(kwargs.get('mturk_code')), pre=True)
+        texts += [' (Paste it in your MTurk interface.)', 'Purchased', 'asin']
+        texts += _node(_str(kwargs['asin']), pre=True)
+        texts.append('options')
+        texts += _node(str(options), pre=True)
+        for title, value in [
+            ('attrs', kwargs.get('purchased_attrs')),
+            ('category', kwargs.get('category')),
+            ('query', kwargs.get('query')),
+            ('product category', kwargs.get('product_category')),
+        ]:
+            texts.append(title)
+            texts += _node(_str(value), pre=True)
+        texts.append('Target')
+        for title, key in [
+            ('asin', 'asin'),
+            ('options', 'goal_options'),
+            ('attrs', 'attributes'),
+            ('price upper', 'price_upper'),
+            ('instuction text', 'instruction_text'),
+            ('category', 'category'),
+            ('product category', 'product_category'),
+            ('query', 'query'),
+        ]:
+            texts.append(title)
+            texts += _node(_str(_attr(goal, key)), pre=True)
+        texts.append('Goal ')
+        texts += _node(pformat(goal), pre=True)
+        texts += ['Reward', 'Your score (min 0.0, max 1.0)']
+        texts += _node(_str(kwargs['reward']), pre=True)
+        texts.append('Reward Details ')
+        texts += _node(pformat(kwargs.get('reward_info')), pre=True)
+        return texts
+
+    def _search_page_clickables(self):
+        return {'search': SEARCH_BUTTON}
+
+    def _results_page_clickables(self):
+        clickables = {'back to search': BACK_TO_SEARCH_BUTTON}
+        if self.kwargs['page'] > 1:
+            clickables['< prev'] = PREV_BUTTON
+        clickables['next >'] = NEXT_BUTTON
+        for item in self.kwargs['products']:
+            # the text of the link, as `get_text` returns it
+            asin = ''.join(_node(_str(_attr(item, 'asin'))))
+            clickables[asin.lower()] = {'class': ['product-link']}
+        return clickables
+
+    def _item_page_clickables(self):
+        product_info = self.kwargs['product_info']
+        clickables = {'back to search': BACK_TO_SEARCH_BUTTON, '< prev': PREV_BUTTON}
+        for sub_page in ('Description', 'Features', 'Reviews'):
+            clickables[sub_page.lower()] = SUB_PAGE_BUTTON
+        if self.kwargs['show_attrs']:
+            clickables['attributes'] = SUB_PAGE_BUTTON
+        clickables['buy now'] = BUY_BUTTON
+        for option_name, option_contents in _attr(product_info, 'options').items():
+            for option_content in option_contents:
+                clickables[_str(option_content)] = {
+                    'type': 'radio', 'name': _str(option_name), 'value': _str(option_content)
+                }
+        return clickables
+
+    def _item_sub_page_clickables(self):
+        return {'back to search': BACK_TO_SEARCH_BUTTON, '< prev': PREV_BUTTON}
+
+    def _done_page_clickables(self):
+        return {}
+
+
+def _attr(obj, name):
+    """`obj.name` in a template: the attribute, else the item, else undefined"""
+    try:
+        return getattr(obj, name)
+    except AttributeError:
+        pass
+    try:
+        return obj[name]
+    except (TypeError, LookupError):
+        return _MISSING
+
+
+def _str(value):
+    """`{{ value }}` in a template"""
+    return '' if value is _MISSING else str(value)
+
+
+def _iter(value):
+    return () if value is _MISSING else value
+
+
+def _node(text, pre=False):
+    """The text nodes of `text` rendered as the only content of an element"""
+    if text == '':
+        return []
+    if not pre and text.translate(_DELETE_SPACES) == '':
+        return ['\n'] if '\n' in text else [' ']
+    return [text]
@@ -2,24 +2,28 @@ import gym
 import json
 import random
 import string
+import threading
 import time
 import torch
 
 from bs4 import BeautifulSoup
 from bs4.element import Comment
 from collections import defaultdict
+from functools import lru_cache
 from flask import Flask
 from web_agent_site.engine.engine import (
     load_products,
     init_search_engine,
     get_top_n_product_from_keywords,
-    map_action_to_html,
+    TemplateRegistry,
     parse_action,
     get_product_per_page,
     ACTION_TO_TEMPLATE,
     END_BUTTON, NEXT_PAGE, PREV_PAGE, BACK_TO_SEARCH,
 )
+from web_agent_site.engine.catalog import open_catalog
 from web_agent_site.engine.goal import get_reward, get_goals
+from web_agent_site.engine.page import Page
 from web_agent_site.utils import (
     DEFAULT_FILE_PATH,
     FEAT_CONV,
@@ -28,6 +32,8 @@ from web_agent_site.utils import (
 )
 
 app = Flask(__name__)
+# the pages of all `SimServer`s, compiled once; their links are built from the routes of `app`
+page_templates = TemplateRegistry(app)
 class WebAgentTextEnv(gym.Env):
     """Gym environment for Text mode of WebShop environment"""
     def __init__(
@@ -41,7 +47,8 @@ class WebAgentTextEnv(gym.Env):
         Constructor for text environment
 
         Arguments:
-        observation_mode (`str`) -- ['html' | 'text'] (default 'html')
+        observation_mode (`str`) -- ['html' | 'text' | 'text_rich' | 'text_structured' | 'url'] (default 'html').
+            'text_structured' is the 'text' observation, built from the structured page instead of its HTML
         get_image
         filter_goals
         limit_goals
@@ -58,23 +65,27 @@ class WebAgentTextEnv(gym.Env):
         self.file_path = file_path
 
         self.base_url = 'http://127.0.0.1:3000'
-        self.server = SimServer(
-            self.base_url,
-            self.file_path,
-            self.kwargs.get('filter_goals'),
-            self.kwargs.get('limit_goals', -1),
-            self.kwargs.get('num_products'),
-            self.kwargs.get('human_goals'),
-            self.kwargs.get('show_attrs', False),
-        ) if server is None else server
+        if server is None:
+            server = SimServer(
+                self.base_url,
+                self.file_path,
+                self.kwargs.get('filter_goals'),
+                self.kwargs.get('limit_goals', -1),
+                self.kwargs.get('num_products'),
+                self.kwargs.get('human_goals'),
+                self.kwargs.get('show_attrs', False),
+            )
+            # `text_structured` builds observations from the pages, rendering only if the HTML is asked for
+            server.render_html = observation_mode != 'text_structured'
+        self.server = server
         self.browser = SimBrowser(self.server)
+        # (html, parsed html, what is derived from it) of the last page parsed
+        self._parsed_page = None
 
         self.session = self.kwargs.get('session')
         self.session_prefix = self.kwargs.get('session_prefix')
         if self.kwargs.get('get_image', 0):
-            self.feats = torch.load(FEAT_CONV)
-            self.ids = torch.load(FEAT_IDS)
-            self.ids = {url: idx for idx, url in enumerate(self.ids)}
+            self.feats, self.ids = load_image_features()
         self.prev_obs = []
         self.prev_actions = []
         self.num_prev_obs = self.kwargs.get('num_prev_obs', 0)
@@ -124,22 +135,31 @@ class WebAgentTextEnv(gym.Env):
 
     def get_available_actions(self):
         """Returns list of available actions at the current step"""
-        html_obj = self._parse_html()
-
-        # Collect search bar, buttons, links, and options as clickables
-        search_bar = html_obj.find(id='search_input')
-        has_search_bar = True if search_bar is not None else False
-        buttons = html_obj.find_all(class_='btn')
-        product_links  = html_obj.find_all(class_='product-link')
-        buying_options = html_obj.select('input[type="radio"]')
-
-        self.text_to_clickable = {
-            f'{b.get_text()}'.lower(): b
-            for b in buttons + product_links
-        }
-        for opt in buying_options:
-            opt_value = opt.get('value')
-            self.text_to_clickable[f'{opt_value}'] = opt
+        if self.observation_mode == 'text_structured':
+            self.text_to_clickable = self.browser.page.clickables()
+            return dict(
+                has_search_bar=self.browser.page.has_search_bar,
+                clickables=list(self.text_to_clickable.keys()),
+            )
+        html_obj, derived = self._parse_page(self.state['html'])
+        if 'available_actions' not in derived:
+            # Collect search bar, buttons, links, and options as clickables
+            search_bar = html_obj.find(id='search_input')
+            has_search_bar = True if search_bar is not None else False
+            buttons = html_obj.find_all(class_='btn')
+            product_links  = html_obj.find_all(class_='product-link')
+            buying_options = html_obj.select('input[type="radio"]')
+
+            text_to_clickable = {
+                f'{b.get_text()}'.lower(): b
+                for b in buttons + product_links
+            }
+            for opt in buying_options:
+                opt_value = opt.get('value')
+                text_to_clickable[f'{opt_value}'] = opt
+            derived['available_actions'] = has_search_bar, text_to_clickable
+
+        has_search_bar, self.text_to_clickable = derived['available_actions']
         return dict(
             has_search_bar=has_search_bar,
             clickables=list(self.text_to_clickable.keys()),
@@ -159,9 +179,12 @@ class WebAgentTextEnv(gym.Env):
 
     def get_instruction_text(self):
         """Get corresponding instruction text for current environment session"""
-        html_obj = self._parse_html(self.browser.page_source)
-        instruction_text = html_obj.find(id='instruction-text').h4.text
-        return instruction_text
+        if self.observation_mode == 'text_structured':
+            return self.browser.page.instruction_text()
+        html_obj, derived = self._parse_page(self.browser.page_source)
+        if 'instruction_text' not in derived:
+            derived['instruction_text'] = html_obj.find(id='instruction-text').h4.text
+        return derived['instruction_text']
 
     def _parse_html(self, html=None):
         """
@@ -173,17 +196,32 @@ class WebAgentTextEnv(gym.Env):
         """
         if html is None:
             html = self.state['html']
-        html_obj = BeautifulSoup(html, 'html.parser')
+        html_obj, _ = self._parse_page(html)
         return html_obj
+
+    def _parse_page(self, html):
+        """
+        Returns the BeautifulSoup object of `html` and a dict for what is derived from it.
+        Both are kept until another page is parsed, so a page is parsed once.
+        """
+        # pages are new strings, so identity tells them apart without comparing them
+        if self._parsed_page is None or self._parsed_page[0] is not html:
+            self._parsed_page = (html, BeautifulSoup(html, 'html.parser'), dict())
+        return self._parsed_page[1], self._parsed_page[2]
     
     @property
     def observation(self):
         """Compiles state into either the `html` or `text` observation mode"""
+        if self.observation_mode == 'text_structured':
+            return self.browser.page.text()
         html = self.state['html']
         if self.observation_mode == 'html':
             return html
         elif self.observation_mode == 'text':
-            return self.convert_html_to_text(html, simple=True)
+            _, derived = self._parse_page(html)
+            if 'text' not in derived:
+                derived['text'] = self.convert_html_to_text(html, simple=True)
+            return derived['text']
         elif self.observation_mode == 'text_rich':
             return self.convert_html_to_text(html, simple=False)
         elif self.observation_mode == 'url':
@@ -215,18 +253,20 @@ class WebAgentTextEnv(gym.Env):
         else:
             # Otherwise, return an observation with tags mapped to specific, unique separators
             observation = ''
+            url = self.browser.current_url
+            clicked_asins = self.server.user_sessions[self.session]['asins']
             for t in visible_texts:
                 if t == '\n': continue
                 if t.parent.name == 'button':  # button
                     processed_t = f'[button] {t} [button_]'
                 elif t.parent.name == 'label':  # options
-                    if f'"{t}"' in self.state['url']:
+                    if f'"{t}"' in url:
                         processed_t = f'  [clicked button] {t} [clicked button_]'
                         observation = f'You have clicked {t}.\n' + observation
                     else:
                         processed_t = f'  [button] {t} [button_]'
                 elif t.parent.get('class') == ["product-link"]: # product asins
-                    if f'{t}' in self.server.user_sessions[self.session]['asins']:
+                    if f'{t}' in clicked_asins:
                         processed_t = f'\n[clicked button] {t} [clicked button_]'
                     else:
                         processed_t = f'\n[button] {t} [button_]'
@@ -271,34 +311,45 @@ def tag_visible(element):
     )
 
 
-class SimServer:
-    """Lightweight simulator of WebShop Flask application for generating HTML observations"""
+@lru_cache(maxsize=None)
+def load_image_features():
+    """Load the image features once per process; they are shared by all environments"""
+    feats = torch.load(FEAT_CONV)
+    ids = torch.load(FEAT_IDS)
+    return feats, {url: idx for idx, url in enumerate(ids)}
+
+
+class SimCatalog:
+    """Read-only products, search engine and goals, shared by all `SimServer`s built with the same arguments"""
     def __init__(
         self,
-        base_url,
         file_path,
         filter_goals=None,
         limit_goals=-1,
         num_products=None,
         human_goals=0,
-        show_attrs=False,
     ):
         """
-        Constructor for simulated server serving WebShop application
-        
+        Constructor for the catalog of the simulated server
+
         Arguments:
         filter_goals (`func`) -- Select specific goal(s) for consideration based on criteria of custom function
         limit_goals (`int`) -- Limit to number of goals available
         num_products (`int`) -- Number of products to search across
         human_goals (`bool`) -- If true, load human goals; otherwise, load synthetic goals
         """
-        # Load all products, goals, and search engine
-        self.base_url = base_url
-        self.all_products, self.product_item_dict, self.product_prices, _ = \
-            load_products(filepath=file_path, num_products=num_products, human_goals=human_goals)
+        # Load all products, goals, and search engine; map a prebuilt catalog file if there is one
+        self.prebuilt = open_catalog(file_path, num_products, human_goals)
+        if self.prebuilt is not None:
+            self.all_products = self.prebuilt.products
+            self.product_item_dict = self.prebuilt.product_item_dict
+            self.product_prices = self.prebuilt.product_prices
+            self.goals = self.prebuilt.goals
+        else:
+            self.all_products, self.product_item_dict, self.product_prices, _ = \
+                load_products(filepath=file_path, num_products=num_products, human_goals=human_goals)
+            self.goals = get_goals(self.all_products, self.product_prices, human_goals)
         self.search_engine = init_search_engine(num_products=num_products)
-        self.goals = get_goals(self.all_products, self.product_prices, human_goals)
-        self.show_attrs = show_attrs
         print(f'Loaded {len(self.goals)} goals.')
 
 
@@ -333,16 +384,101 @@ class SimServer:
         self.cum_weights = [0]
         for w in self.weights:
             self.cum_weights.append(self.cum_weights[-1] + w)
+
+
+_catalogs = dict()
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(
+    file_path=DEFAULT_FILE_PATH,
+    filter_goals=None,
+    limit_goals=-1,
+    num_products=None,
+    human_goals=0,
+):
+    """Return the catalog for these arguments, loading it on first use"""
+    # `human_goals` is only tested for truth, e.g. None and 0 load the same goals
+    key = (file_path, filter_goals, limit_goals, num_products, bool(human_goals))
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = SimCatalog(*key)
+        return _catalogs[key]
+
+
+class SimServer:
+    """Lightweight simulator of WebShop Flask application for generating HTML observations"""
+    # Render the HTML of every page. If off, `receive` returns None for the HTML and
+    # browsers render the recorded `Page` when its HTML is asked for
+    render_html = True
+
+    def __init__(
+        self,
+        base_url,
+        file_path,
+        filter_goals=None,
+        limit_goals=-1,
+        num_products=None,
+        human_goals=0,
+        show_attrs=False,
+        catalog=None,
+    ):
+        """
+        Constructor for simulated server serving WebShop application. Products, search
+        engine and goals come from a shared `SimCatalog`; the server itself only holds
+        the user sessions.
+        
+        Arguments:
+        filter_goals (`func`) -- Select specific goal(s) for consideration based on criteria of custom function
+        limit_goals (`int`) -- Limit to number of goals available
+        num_products (`int`) -- Number of products to search across
+        human_goals (`bool`) -- If true, load human goals; otherwise, load synthetic goals
+        catalog (`SimCatalog`) -- Catalog to use instead of the shared one for these arguments
+        """
+        self.base_url = base_url
+        if catalog is None:
+            catalog = get_catalog(file_path, filter_goals, limit_goals, num_products, human_goals)
+        self.catalog = catalog
+        self.show_attrs = show_attrs
         self.user_sessions = dict()
+        self.pages = dict()
         self.search_time = 0
         self.render_time = 0
         self.sample_time = 0
         self.assigned_instruction_text = None  # TODO: very hacky, should remove
+
+    @property
+    def all_products(self):
+        return self.catalog.all_products
+
+    @property
+    def product_item_dict(self):
+        return self.catalog.product_item_dict
+
+    @property
+    def product_prices(self):
+        return self.catalog.product_prices
+
+    @property
+    def search_engine(self):
+        return self.catalog.search_engine
+
+    @property
+    def goals(self):
+        return self.catalog.goals
+
+    @property
+    def weights(self):
+        return self.catalog.weights
+
+    @property
+    def cum_weights(self):
+        return self.catalog.cum_weights
         
     @app.route('/', methods=['GET', 'POST'])
     def index(self, session_id, **kwargs):
         """Redirect to the search page with the given session ID"""
-        html = map_action_to_html(
+        html = self.render_page(
             'start',
             session_id=session_id,
             instruction_text=kwargs['instruction_text'],
@@ -384,7 +520,7 @@ class SimServer:
 
         # Render HTML search page and record amount of time taken
         old_time = time.time()
-        html = map_action_to_html(
+        html = self.render_page(
             'search',
             session_id=session_id,
             products=products,
@@ -426,7 +562,7 @@ class SimServer:
             f'{session["page"]}/{option_string}'
         )
 
-        html = map_action_to_html(
+        html = self.render_page(
             'click',
             session_id=session_id,
             product_info=product_info,
@@ -458,7 +594,7 @@ class SimServer:
             f'{session["asin"]}/{keywords_url_string}/{session["page"]}/'
             f'{clickable_name}/{session["options"]}'
         )
-        html = map_action_to_html(
+        html = self.render_page(
             f'click[{clickable_name}]',
             session_id=session_id,
             product_info=product_info,
@@ -496,7 +632,7 @@ class SimServer:
             f'{self.base_url}/done/{session_id}/'
             f'{session["asin"]}/{session["options"]}'
         )
-        html = map_action_to_html(
+        html = self.render_page(
             f'click[{END_BUTTON}]',
             session_id=session_id,
             reward=reward,
@@ -506,94 +642,103 @@ class SimServer:
         )
         return html, url, reward
     
+    def render_page(self, action, **kwargs):
+        """Record the page of the session and return its HTML (None if `render_html` is off)"""
+        page = Page(action, page_templates, **kwargs)
+        self.pages[kwargs['session_id']] = page
+        return page.html if self.render_html else None
+
     def receive(self, session_id, current_url, session_int=None, **kwargs):
         """Map action to the corresponding page"""
         status = dict(reward=0.0, done=False)
 
-        with app.app_context(), app.test_request_context():
-            # Create/determine goal, instruction_text from current session
-            if session_id not in self.user_sessions:
-                idx = session_int if (session_int is not None and isinstance(session_int, int)) else random_idx(self.cum_weights) 
-                print(f"---------------1----------------")
-                goal = self.goals[idx]
-                instruction_text = goal['instruction_text']
-                self.user_sessions[session_id] = {'goal': goal, 'done': False}
-            else:
-                print(f"---------------2----------------")
-                instruction_text = \
-                    self.user_sessions[session_id]['goal']['instruction_text']
-            if self.assigned_instruction_text is not None:
-                print(f"---------------3----------------")
-                instruction_text = self.assigned_instruction_text  # TODO: very hacky, should remove
-                self.user_sessions[session_id]['goal']['instruction_text'] = instruction_text
-            session = self.user_sessions[session_id]
-
-            if not kwargs:
-                print(f"---------------4----------------")
-                # If no action, reset the session variables
-                kwargs['instruction_text'] = instruction_text
-                html, url = self.index(session_id, **kwargs)
-                self.user_sessions[session_id].update(
-                    {
-                        'keywords': None,
-                        'page': None,
-                        'asin': None,
-                        'asins': set(),
-                        'options': dict(),
-                        'actions': defaultdict(int)
-                    }
+        # Create/determine goal, instruction_text from current session
+        if session_id not in self.user_sessions:
+            idx = session_int if (session_int is not None and isinstance(session_int, int)) else random_idx(self.cum_weights) 
+            print(f"---------------1----------------")
+            goal = self.goals[idx]
+            instruction_text = goal['instruction_text']
+            self.user_sessions[session_id] = {'goal': goal, 'done': False}
+        else:
+            print(f"---------------2----------------")
+            instruction_text = \
+                self.user_sessions[session_id]['goal']['instruction_text']
+        if self.assigned_instruction_text is not None:
+            print(f"---------------3----------------")
+            instruction_text = self.assigned_instruction_text  # TODO: very hacky, should remove
+            # goals are shared with the other servers, so the session gets its own copy
+            self.user_sessions[session_id]['goal'] = dict(
+                self.user_sessions[session_id]['goal'],
+                instruction_text=instruction_text,
+            )
+        session = self.user_sessions[session_id]
+
+        if not kwargs:
+            print(f"---------------4----------------")
+            # If no action, reset the session variables
+            kwargs['instruction_text'] = instruction_text
+            html, url = self.index(session_id, **kwargs)
+            self.user_sessions[session_id].update(
+                {
+                    'keywords': None,
+                    'page': None,
+                    'asin': None,
+                    'asins': set(),
+                    'options': dict(),
+                    'actions': defaultdict(int)
+                }
+            )
+        elif 'keywords' in kwargs:
+            # If search keywords are available, run a search
+            html, url = self.search_results(session_id, **kwargs)
+        elif 'clickable_name' in kwargs:
+            clickable_name = kwargs['clickable_name'].lower()
+            if clickable_name == END_BUTTON.lower():
+                # If "buy now" clicked, calculate reward and flag session as terminated
+                html, url, reward = self.done(session_id, **kwargs)
+                status['reward'] = reward
+                status['done'] = True
+            elif clickable_name == BACK_TO_SEARCH.lower():
+                # If "back to search" clicked, recursively reset the session back to search page
+                html, url, status = self.receive(session_id, current_url)
+            elif (clickable_name == NEXT_PAGE.lower() and 
+                  self.get_page_name(current_url) == 'search_results'):
+                # If "next page" clicked from search results, re-render with `page` enumerated
+                html, url, status = self.receive(
+                    session_id,
+                    current_url,
+                    keywords=session["keywords"],
+                    page=session["page"] + 1,
+                )
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  self.get_page_name(current_url) == 'search_results'):
+                # If "prev page" clicked from search results, re-render with `page` denumerated
+                html, url, status = self.receive(
+                    session_id,
+                    current_url,
+                    keywords=session["keywords"],
+                    page=session["page"] - 1,
                 )
-            elif 'keywords' in kwargs:
-                # If search keywords are available, run a search
-                html, url = self.search_results(session_id, **kwargs)
-            elif 'clickable_name' in kwargs:
-                clickable_name = kwargs['clickable_name'].lower()
-                if clickable_name == END_BUTTON.lower():
-                    # If "buy now" clicked, calculate reward and flag session as terminated
-                    html, url, reward = self.done(session_id, **kwargs)
-                    status['reward'] = reward
-                    status['done'] = True
-                elif clickable_name == BACK_TO_SEARCH.lower():
-                    # If "back to search" clicked, recursively reset the session back to search page
-                    html, url, status = self.receive(session_id, current_url)
-                elif (clickable_name == NEXT_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'search_results'):
-                    # If "next page" clicked from search results, re-render with `page` enumerated
-                    html, url, status = self.receive(
-                        session_id,
-                        current_url,
-                        keywords=session["keywords"],
-                        page=session["page"] + 1,
-                    )
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'search_results'):
-                    # If "prev page" clicked from search results, re-render with `page` denumerated
-                    html, url, status = self.receive(
-                        session_id,
-                        current_url,
-                        keywords=session["keywords"],
-                        page=session["page"] - 1,
-                    )
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'item_sub_page'):
-                    # If "prev page" clicked from sub page, return to corresponding item page
-                    html, url = self.item_page(session_id, **kwargs)
-                elif (clickable_name == PREV_PAGE.lower() and 
-                      self.get_page_name(current_url) == 'item_page'):
-                    # If "prev page" clicked from item page, return to search results page
-                    html, url = self.search_results(
-                        session_id,
-                        keywords=session["keywords"],
-                        page=session["page"],
-                        **kwargs
-                    )
-                elif clickable_name in [k.lower() for k in ACTION_TO_TEMPLATE]:
-                    # Render item_sub_page if clickable is description, features, or reviews
-                    html, url = self.item_sub_page(session_id, **kwargs)
-                else:
-                    # Otherwise, render current item page
-                    html, url = self.item_page(session_id, **kwargs)
-            return html, url, status
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  self.get_page_name(current_url) == 'item_sub_page'):
+                # If "prev page" clicked from sub page, return to corresponding item page
+                html, url = self.item_page(session_id, **kwargs)
+            elif (clickable_name == PREV_PAGE.lower() and 
+                  self.get_page_name(current_url) == 'item_page'):
+                # If "prev page" clicked from item page, return to search results page
+                html, url = self.search_results(
+                    session_id,
+                    keywords=session["keywords"],
+                    page=session["page"],
+                    **kwargs
+                )
+            elif clickable_name in [k.lower() for k in ACTION_TO_TEMPLATE]:
+                # Render item_sub_page if clickable is description, features, or reviews
+                html, url = self.item_sub_page(session_id, **kwargs)
+            else:
+                # Otherwise, render current item page
+                html, url = self.item_page(session_id, **kwargs)
+        return html, url, status
     
     def get_page_name(self, url):
         """Determine which page (i.e. item_page, search_results) the given URL is pointing at"""
@@ -616,35 +761,44 @@ class SimBrowser:
     def __init__(self, server):
         self.server = server
         self.current_url = None
-        self.page_source = None
+        self.page = None
+        self._page_source = None
         self.session_id = None
 
+    @property
+    def page_source(self):
+        """HTML of the current page, rendered on first access if the server did not render it"""
+        if self._page_source is None and self.page is not None:
+            self._page_source = self.page.html
+        return self._page_source
+
+    def _receive(self, **kwargs):
+        html, url, status = self.server.receive(self.session_id, **kwargs)
+        self.page = self.server.pages[self.session_id]
+        self._page_source = html
+        return url, status
+
     def get(self, url, session_id=None, session_int=None):
         """Set browser variables to corresponding link, page HTML for URL"""
         self.session_id = url.split('/')[-1] if session_id is None else session_id
-        self.page_source, _, _ = \
-            self.server.receive(self.session_id, self.current_url, session_int=session_int)
+        self._receive(current_url=self.current_url, session_int=session_int)
         self.current_url = url
     
     def click(self, clickable_name, text_to_clickable):
         """Wrapper for `receive` handler for performing click action on current page"""
-        self.page_source, self.current_url, status = \
-            self.server.receive(
-                self.session_id,
-                current_url=self.current_url,
-                clickable_name=clickable_name,
-                text_to_clickable=text_to_clickable,
-            )
+        self.current_url, status = self._receive(
+            current_url=self.current_url,
+            clickable_name=clickable_name,
+            text_to_clickable=text_to_clickable,
+        )
         return status
     
     def search(self, keywords):
         """Wrapper for `receive` handler for performing search action on current page"""
         if isinstance(keywords, str):
             keywords = keywords.split(' ')
-        self.page_source, self.current_url, status = \
-            self.server.receive(
-                self.session_id,
-                current_url=self.current_url,
-                keywords=keywords,
+        self.current_url, status = self._receive(
+            current_url=self.current_url,
+            keywords=keywords,
         )
         return status
@@ -0,0 +1,18 @@
+from .mock_agent import (
+    MockAgent,
+    MockAPIAgent,
+    MockAsyncAPIAgent,
+    byte_tokenizer,
+)
+from .mock_env import AsyncMockEnvClient, MockEnvClient, MockEnvServer, MockTask
+from .runner import (
+    SCENARIOS,
+    BenchConfig,
+    BenchResult,
+    compare_results,
+    format_results,
+    load_results,
+    run_benchmarks,
+    run_scenario,
+    save_results,
+)
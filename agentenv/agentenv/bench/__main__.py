@@ -0,0 +1,56 @@
+"""
+Run the rollout benchmarks and compare them against a baseline:
+
+    python -m agentenv.bench --output bench.json
+    python -m agentenv.bench --baseline bench.json  # exits with 1 on a regression
+"""
+
+import argparse
+import sys
+from dataclasses import asdict, fields
+
+from .runner import (
+    SCENARIOS,
+    BenchConfig,
+    compare_results,
+    format_results,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rollout throughput benchmarks.")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    for f in fields(BenchConfig):
+        parser.add_argument(
+            f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default
+        )
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file.")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.1, help="The drop of a rate that is a regression."
+    )
+    args = parser.parse_args()
+
+    config = BenchConfig(**{f.name: getattr(args, f.name) for f in fields(BenchConfig)})
+    results = run_benchmarks(config, args.scenarios)
+    print(format_results(results))
+    if args.output:
+        save_results(args.output, results, config)
+    if args.baseline:
+        baseline = load_results(args.baseline)
+        if baseline["config"] not in (None, asdict(config)):
+            print(f"{args.baseline} was run with a different config: {baseline['config']}")
+        regressions = compare_results(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
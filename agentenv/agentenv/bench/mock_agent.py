@@ -0,0 +1,185 @@
+"""
+Deterministic agents that stand in for a model or an API: every generation sleeps for a
+configurable latency and answers a fixed ReAct turn of `new_tokens` tokens.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional, Sequence, Tuple
+
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import GenerationConfig, PreTrainedTokenizerBase, PreTrainedTokenizerFast
+
+from agentenv.controller import Agent, APIAgent, AsyncAPIAgent, BaseChatTemplate
+from agentenv.controller.types import APIConversationMessage
+
+
+def byte_tokenizer() -> PreTrainedTokenizerFast:
+    """
+    A tokenizer with one token per byte and the special tokens of the chat templates,
+    built without downloading anything.
+    """
+    specials = ["<unk>", "<s>", "</s>", "[INST]", "[/INST]", "<|im_start|>", "<|im_end|>"]
+    vocab = {token: i for i, token in enumerate(specials)}
+    for char in pre_tokenizers.ByteLevel.alphabet():
+        vocab[char] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[], unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.add_special_tokens(specials)
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="<unk>",
+    )
+
+
+def mock_reply(n_chars: int) -> str:
+    """
+    The ReAct turn the mock agents answer, padded with thought to `n_chars` characters
+    where possible.
+    """
+    action = "\n\nAction:\nnext"
+    filler = max(n_chars - len("Thought:\n") - len(action), 0)
+    return "Thought:\n" + "x" * filler + action
+
+
+class _TokenCounter:
+    def __init__(self) -> None:
+        self.generated_tokens = 0
+        self.generations = 0
+        self._lock = threading.Lock()
+
+    def count(self, n_tokens: int) -> None:
+        with self._lock:
+            self.generated_tokens += n_tokens
+            self.generations += 1
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.generated_tokens = 0
+            self.generations = 0
+
+
+class _MockModel:
+    # what Agent.generate_batch reads of the model
+    def __init__(self, generation_config: GenerationConfig) -> None:
+        self.generation_config = generation_config
+
+
+class MockAgent(Agent, _TokenCounter):
+    """
+    An `Agent` whose engine is a sleep: a batch of prompts takes `latency` plus
+    `token_latency` per new token, as a batched engine decodes all prompts together.
+    """
+
+    def __init__(
+        self,
+        new_tokens: int = 64,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        tokenizer: Optional[PreTrainedTokenizerBase] = None,
+        chat_template: Optional[BaseChatTemplate] = None,
+    ) -> None:
+        """
+        Args:
+            new_tokens (int, optional): The number of tokens of every generation, eos included. Defaults to 64.
+            latency (float, optional): Seconds every engine call takes before decoding. Defaults to 0.
+            token_latency (float, optional): Seconds every decoded token adds to an engine call. Defaults to 0.
+            tokenizer (PreTrainedTokenizerBase, optional): The tokenizer of the prompts. Defaults to `byte_tokenizer()`.
+            chat_template (BaseChatTemplate, optional): Defaults to Llama2Template.
+        """
+        tokenizer = tokenizer or byte_tokenizer()
+        Agent.__init__(
+            self,
+            _MockModel(GenerationConfig(max_length=4096)),
+            tokenizer,
+            chat_template,
+            kv_cache_size=0,
+        )
+        _TokenCounter.__init__(self)
+        self.new_tokens = new_tokens
+        self.latency = latency
+        self.token_latency = token_latency
+        tokens = tokenizer.encode(mock_reply(new_tokens - 1), add_special_tokens=False)
+        self._reply = tokens[: max(new_tokens - 1, 0)] + [tokenizer.eos_token_id]
+
+    def _generate_batch(
+        self,
+        model: _MockModel,
+        prompts: Sequence[Sequence[int]],
+        generation_configs: Sequence[GenerationConfig],
+        refresh_engine: bool = False,
+    ) -> list[list[int]]:
+        time.sleep(self.latency + self.token_latency * len(self._reply))
+        for _ in prompts:
+            self.count(len(self._reply))
+        return [list(self._reply) for _ in prompts]
+
+
+class MockAPIAgent(APIAgent, _TokenCounter):
+    """
+    An `APIAgent` whose requests sleep for `latency` plus `token_latency` per new token
+    instead of calling an API. A token is taken as four characters.
+    """
+
+    def __init__(
+        self,
+        new_tokens: int = 64,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+    ) -> None:
+        APIAgent.__init__(self, "mock", "http://mock.invalid/v1", "mock", max_tokens=new_tokens)
+        _TokenCounter.__init__(self)
+        self.new_tokens = new_tokens
+        self.latency = latency
+        self.token_latency = token_latency
+
+    def _generate(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Optional[Sequence[str]] = None,
+    ) -> Tuple[str, str | None]:
+        self.count(self.new_tokens)
+        time.sleep(self.latency + self.token_latency * self.new_tokens)
+        return mock_reply(self.new_tokens * 4), None
+
+
+class MockAsyncAPIAgent(AsyncAPIAgent, _TokenCounter):
+    """
+    The `AsyncAPIAgent` counterpart of `MockAPIAgent`, sleeping in the event loop.
+    """
+
+    def __init__(
+        self,
+        new_tokens: int = 64,
+        latency: float = 0.0,
+        token_latency: float = 0.0,
+        max_concurrency: int = 64,
+    ) -> None:
+        AsyncAPIAgent.__init__(
+            self,
+            "mock",
+            "http://mock.invalid/v1",
+            "mock",
+            max_tokens=new_tokens,
+            max_concurrency=max_concurrency,
+        )
+        _TokenCounter.__init__(self)
+        self.new_tokens = new_tokens
+        self.latency = latency
+        self.token_latency = token_latency
+
+    _generate = MockAPIAgent._generate
+
+    async def _agenerate(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Optional[Sequence[str]] = None,
+    ) -> Tuple[str, str | None]:
+        self.count(self.new_tokens)
+        await asyncio.sleep(self.latency + self.token_latency * self.new_tokens)
+        return mock_reply(self.new_tokens * 4), None
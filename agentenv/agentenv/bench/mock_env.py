@@ -0,0 +1,256 @@
+"""
+An in-process env server and its clients, for measuring the rollout path without a
+real environment. Every episode takes `episode_length` steps and is scored 1.
+"""
+
+import itertools
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Mapping, Optional
+from urllib.parse import parse_qs, urlparse
+
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
+from agentenv.controller.types import ConversationMessage, StepOutput
+
+
+class MockEnvServer:
+    """
+    A threaded HTTP env server with the create/reset/step/observation/close endpoints of
+    the agentenv env servers, running in a daemon thread of this process.
+
+        with MockEnvServer(step_latency=0.01, observation_size=512) as server:
+            task = MockTask({"env_server_base": server.url, "data_len": 100})
+    """
+
+    def __init__(
+        self,
+        step_latency: float = 0.0,
+        observation_size: int = 256,
+        episode_length: int = 5,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Args:
+            step_latency (float, optional): Seconds every step (and reset) sleeps before it answers. Defaults to 0.
+            observation_size (int, optional): The number of characters of every observation. Defaults to 256.
+            episode_length (int, optional): The number of steps after which an episode is done. Defaults to 5.
+            host (str, optional): The address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): The port to listen on, 0 for a free one. Defaults to 0.
+        """
+        self.step_latency = step_latency
+        self.observation_size = observation_size
+        self.episode_length = episode_length
+        # env id -> [data idx, steps taken]
+        self.envs: dict[int, list[int]] = {}
+        self.n_steps = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_cls())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def observation(self, idx: int, step: int) -> str:
+        text = f"Observation {step} of task {idx}. "
+        return (text * (self.observation_size // len(text) + 1))[: self.observation_size]
+
+    def handle(self, path: str, data: dict[str, Any]) -> Any:
+        if path == "create":
+            with self._lock:
+                env_id = next(self._ids)
+                self.envs[env_id] = [0, 0]
+            return {"id": env_id, "observation": self.observation(0, 0)}
+        env = self.envs[int(data["id"])]
+        if path == "reset":
+            time.sleep(self.step_latency)
+            env[:] = [int(data["data_idx"]), 0]
+            return {"observation": self.observation(env[0], 0)}
+        if path == "step":
+            time.sleep(self.step_latency)
+            env[1] += 1
+            with self._lock:
+                self.n_steps += 1
+            done = env[1] >= self.episode_length
+            return {
+                "observation": self.observation(env[0], env[1]),
+                "reward": 1 if done else 0,
+                "done": done,
+            }
+        if path == "observation":
+            return self.observation(*env)
+        if path == "close":
+            with self._lock:
+                self.envs.pop(int(data["id"]), None)
+            return {"closed": True}
+        raise KeyError(path)
+
+    def _handler_cls(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, as the transports pool connections
+
+            def setup(self) -> None:
+                super().setup()
+                # headers and body are written separately; without this, Nagle's
+                # algorithm holds the body back for the ACK of the headers
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def _respond(self, data: dict[str, Any]) -> None:
+                url = urlparse(self.path)
+                try:
+                    body = json.dumps(server.handle(url.path.strip("/"), data)).encode()
+                    status = 200
+                except (KeyError, ValueError) as e:
+                    body = json.dumps({"error": repr(e)}).encode()
+                    status = 404
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                query = parse_qs(urlparse(self.path).query)
+                self._respond({k: v[0] for k, v in query.items()})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                self._respond(json.loads(self.rfile.read(length) or b"{}"))
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> "MockEnvServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockEnvServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def _parse_action(text: str) -> str:
+    return text.rsplit("Action:", 1)[-1].strip()
+
+
+class MockEnvClient(BaseEnvClient):
+    conversation_start = (
+        ConversationMessage(
+            {
+                "from": "human",
+                "loss": None,
+                "value": "You are a benchmark agent. Every round I will give you an observation, and you respond with an action.\nYour output must strictly follow this format:\"Thought:\nyour thoughts.\n\nAction:\nyour next action\"",
+            }
+        ),
+        ConversationMessage(
+            {
+                "from": "gpt",
+                "loss": False,
+                "value": "OK. I'll follow your instructions and try my best to solve the task.",
+            }
+        ),
+    )
+
+    def __init__(
+        self,
+        env_server_base: str,
+        data_len: int,
+        *args,
+        timeout: int = 300,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.env_server_base = env_server_base
+        self.timeout = timeout
+        self.data_len = data_len
+
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", json={}, timeout=self.timeout)
+        self.env_id = ok["id"]
+        self.info = {"observation": ok["observation"], "reward": 0, "done": False}
+
+    def __len__(self):
+        return self.data_len
+
+    def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
+        data["id"] = self.env_id
+        return self.transport.post(path, json=data, timeout=self.timeout)
+
+    def observe(self) -> str:
+        return self.info["observation"]
+
+    def step(self, action: str) -> StepOutput:
+        response = self._post("step", {"action": _parse_action(action)})
+        self.info = response
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    def reset(self, idx: int = 0) -> dict[str, Any]:
+        response = self._post("reset", {"data_idx": idx})
+        self.info = {"observation": response["observation"], "reward": 0, "done": False}
+        return response
+
+    def close(self):
+        return self._post("close", {})
+
+
+class AsyncMockEnvClient(AsyncBaseEnvClient):
+    conversation_start = MockEnvClient.conversation_start
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create", json={})
+        self.env_id = ok["id"]
+        self.info = {"observation": ok["observation"], "reward": 0, "done": False}
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        response = await self._post("step", {"action": _parse_action(action)})
+        self.info = response
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, idx: int = 0) -> dict[str, Any]:
+        response = await self._post("reset", {"data_idx": idx})
+        self.info = {"observation": response["observation"], "reward": 0, "done": False}
+        return response
+
+
+class MockTask(BaseTask):
+    env_client_cls = MockEnvClient
+    async_env_client_cls = AsyncMockEnvClient
+    env_name = "Mock"
+
+    def __init__(
+        self, client_args: Mapping[str, Any], *args, n_clients: int = 1, **kwargs
+    ) -> None:
+        super().__init__(client_args, n_clients, *args, **kwargs)
@@ -0,0 +1,278 @@
+"""
+Rollout throughput benchmarks over the mock agents and env servers. Every scenario rolls
+out the same episodes through one entry point of the controller and reports episodes,
+steps (as counted by the env server) and generated tokens per second.
+
+    config = BenchConfig(episodes=64, step_latency=0.01)
+    results = run_benchmarks(config)
+    save_results("bench.json", results, config)
+    regressions = compare_results(results, load_results("baseline.json")["results"])
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional, Sequence
+
+from transformers import GenerationConfig
+
+from agentenv.controller import Evaluator, close_async_sessions
+from agentenv.controller.utils import BaseTrainer
+
+from .mock_agent import MockAgent, MockAPIAgent, MockAsyncAPIAgent
+from .mock_env import MockEnvServer, MockTask
+
+# the rates compared against a baseline
+METRICS = ("episodes_per_s", "steps_per_s", "tokens_per_s")
+
+
+@dataclass
+class BenchConfig:
+    episodes: int = 64
+    episode_length: int = 5
+    n_clients: int = 8
+    observation_size: int = 256
+    step_latency: float = 0.0
+    new_tokens: int = 64
+    agent_latency: float = 0.0
+    token_latency: float = 0.0
+    # runs of every scenario; the fastest one is reported
+    repeat: int = 3
+
+
+@dataclass
+class BenchResult:
+    scenario: str
+    episodes: int
+    steps: int
+    tokens: int
+    seconds: float
+    episodes_per_s: float = field(init=False)
+    steps_per_s: float = field(init=False)
+    tokens_per_s: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        seconds = max(self.seconds, 1e-9)
+        self.episodes_per_s = self.episodes / seconds
+        self.steps_per_s = self.steps / seconds
+        self.tokens_per_s = self.tokens / seconds
+
+
+def _generation_config(agent: MockAgent) -> GenerationConfig:
+    return GenerationConfig(
+        max_length=4096,
+        do_sample=False,
+        eos_token_id=agent.tokenizer.eos_token_id,
+        pad_token_id=agent.tokenizer.pad_token_id,
+    )
+
+
+def _task(server: MockEnvServer, config: BenchConfig, n_clients: int) -> MockTask:
+    return MockTask(
+        {"env_server_base": server.url, "data_len": config.episodes}, n_clients=n_clients
+    )
+
+
+def _task_sequential(server: MockEnvServer, config: BenchConfig) -> tuple[int, MockAgent]:
+    agent = MockAgent(config.new_tokens, config.agent_latency, config.token_latency)
+    with _task(server, config, 1) as task:
+        exps = task.generate_experience(
+            agent, list(range(config.episodes)), _generation_config(agent)
+        )
+    return len(exps), agent
+
+
+def _task_concurrent(server: MockEnvServer, config: BenchConfig) -> tuple[int, MockAgent]:
+    agent = MockAgent(config.new_tokens, config.agent_latency, config.token_latency)
+    with _task(server, config, config.n_clients) as task:
+        exps = task.generate_experience(
+            agent, list(range(config.episodes)), _generation_config(agent)
+        )
+    return len(exps), agent
+
+
+def _task_api(server: MockEnvServer, config: BenchConfig) -> tuple[int, MockAPIAgent]:
+    agent = MockAPIAgent(config.new_tokens, config.agent_latency, config.token_latency)
+    with _task(server, config, config.n_clients) as task:
+        exps = task.generate_experience(agent, list(range(config.episodes)))
+    return len(exps), agent
+
+
+def _task_async(server: MockEnvServer, config: BenchConfig) -> tuple[int, MockAsyncAPIAgent]:
+    agent = MockAsyncAPIAgent(
+        config.new_tokens,
+        config.agent_latency,
+        config.token_latency,
+        max_concurrency=config.n_clients,
+    )
+
+    async def run() -> int:
+        with _task(server, config, 1) as task:
+            try:
+                exps = await task.agenerate_experience(agent, list(range(config.episodes)))
+                await asyncio.gather(*(client.close() for client in task.async_clients))
+            finally:
+                await close_async_sessions()
+        return len(exps)
+
+    return asyncio.run(run()), agent
+
+
+def _evaluator_multitask(
+    server: MockEnvServer, config: BenchConfig
+) -> tuple[int, MockAgent]:
+    agent = MockAgent(config.new_tokens, config.agent_latency, config.token_latency)
+    half = config.n_clients // 2 or 1
+    tasks = [_task(server, config, half), _task(server, config, half)]
+    evaluator = Evaluator(agent, tasks)
+    idxs = list(range(config.episodes))
+    try:
+        output = evaluator.eval(
+            _generation_config(agent), idxs=[idxs[::2], idxs[1::2]]
+        )
+    finally:
+        evaluator.close()
+    return len(output.experiences), agent
+
+
+def _trainer_eval_loop(server: MockEnvServer, config: BenchConfig) -> tuple[int, MockAgent]:
+    """
+    The evaluation loop of the trainers without accelerate: `BaseTrainer.eval` per batch
+    of `n_clients` idxs, then the compact experiences written to an inference file.
+    """
+    from agentenv.trainer.utils import experience_sink, trajectory_writer
+
+    agent = MockAgent(config.new_tokens, config.agent_latency, config.token_latency)
+    trainer = BaseTrainer(agent, [_task(server, config, config.n_clients)])
+    n_episodes = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inference.jsonl")
+        sink = experience_sink(path)
+        for start in range(0, config.episodes, config.n_clients):
+            idxs = list(range(start, min(start + config.n_clients, config.episodes)))
+            exps = trainer.eval(_generation_config(agent), idxs=idxs)
+            with trajectory_writer(path, sink) as f:
+                for idx, exp in zip(idxs, [exp.to_compact() for exp in exps.experiences]):
+                    f.write(
+                        {
+                            "conversations": exp.conversation,
+                            "item_id": f"mock_{idx}",
+                            "reward": exp.reward,
+                            "success": 1 if exp.reward == 1 else 0,
+                        },
+                        exp,
+                    )
+            n_episodes += len(exps.experiences)
+        if sink is not None:
+            sink.close()
+    trainer.close()
+    return n_episodes, agent
+
+
+SCENARIOS: dict[str, Callable[[MockEnvServer, BenchConfig], tuple[int, Any]]] = {
+    "task_sequential": _task_sequential,
+    "task_concurrent": _task_concurrent,
+    "task_api": _task_api,
+    "task_async": _task_async,
+    "evaluator_multitask": _evaluator_multitask,
+    "trainer_eval_loop": _trainer_eval_loop,
+}
+
+
+def run_scenario(name: str, config: BenchConfig) -> BenchResult:
+    """
+    Run a scenario `config.repeat` times on a fresh mock env server and return its
+    fastest run.
+    """
+    best = None
+    for _ in range(max(config.repeat, 1)):
+        with MockEnvServer(
+            config.step_latency, config.observation_size, config.episode_length
+        ) as server:
+            start = time.perf_counter()
+            n_episodes, agent = SCENARIOS[name](server, config)
+            seconds = time.perf_counter() - start
+            result = BenchResult(
+                name, n_episodes, server.n_steps, agent.generated_tokens, seconds
+            )
+        if best is None or result.seconds < best.seconds:
+            best = result
+    return best
+
+
+def run_benchmarks(
+    config: BenchConfig, scenarios: Optional[Sequence[str]] = None
+) -> dict[str, BenchResult]:
+    """
+    Run `scenarios` (default all). A scenario whose optional dependencies are missing
+    is skipped with a message.
+    """
+    results = {}
+    for name in scenarios or SCENARIOS:
+        try:
+            results[name] = run_scenario(name, config)
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+    return results
+
+
+def save_results(
+    path: str, results: dict[str, BenchResult], config: Optional[BenchConfig] = None
+) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "config": asdict(config) if config is not None else None,
+                "results": {name: asdict(result) for name, result in results.items()},
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_results(path: str) -> dict[str, Any]:
+    """
+    The `{"config", "results"}` saved by `save_results`.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare_results(
+    results: dict[str, BenchResult],
+    baseline: dict[str, dict[str, Any]],
+    tolerance: float = 0.1,
+) -> list[str]:
+    """
+    Print the change of every rate against `baseline` and return the regressions:
+    the rates that dropped by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: not in the baseline")
+            continue
+        for metric in METRICS:
+            old, new = baseline[name][metric], getattr(result, metric)
+            change = (new - old) / old if old else 0.0
+            line = f"{name:<22} {metric:<15} {old:12.1f} -> {new:12.1f} ({change:+.1%})"
+            if change < -tolerance:
+                line += "  REGRESSION"
+                regressions.append(line)
+            print(line)
+    return regressions
+
+
+def format_results(results: dict[str, BenchResult]) -> str:
+    lines = [
+        f"{'scenario':<22} {'episodes/s':>12} {'steps/s':>12} {'tokens/s':>12} {'seconds':>9}"
+    ]
+    for name, r in results.items():
+        lines.append(
+            f"{name:<22} {r.episodes_per_s:12.1f} {r.steps_per_s:12.1f} "
+            f"{r.tokens_per_s:12.1f} {r.seconds:9.3f}"
+        )
+    return "\n".join(lines)
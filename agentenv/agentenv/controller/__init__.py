@@ -1,15 +1,51 @@
 from .agent import (
     Agent,
     APIAgent,
+    AsyncAPIAgent,
     BaseChatTemplate,
     ChatGLM4Template,
     ChatMLTemplate,
     Llama2Template,
     Llama3Template,
+    RateLimiter,
+)
+from .cache import GenerationCache
+from .env import AsyncBaseEnvClient, BaseEnvClient, StepOutput
+from .transport import (
+    CircuitBreaker,
+    CircuitOpenError,
+    EnvServerError,
+    EnvTransport,
+    RetryPolicy,
+    close_async_sessions,
+    get_transport,
+    transport_stats,
+)
+from .inproc import AppDispatcher, InProcessTransport, PipeTransport
+from .vector import CoalescingTransport, RequestCoalescer, VectorEnvClient
+from .profiler import (
+    ChromeTraceExporter,
+    RolloutProfiler,
+    Span,
+    SpanAggregator,
+)
+from .pool import EnvClientPool
+from .store import TrajectoryStore, iter_trajectories
+from .arrow_writer import (
+    ArrowExperienceWriter,
+    load_experience_dataset,
+    read_experience_table,
 )
-from .env import BaseEnvClient, StepOutput
 from .task import BaseTask
-from .types import ActionFormat, ActionWithTought, ConversationMessage
+from .scheduler import MultiTaskScheduler
+from .types import (
+    ActionFormat,
+    ActionWithTought,
+    CompactExperienceOutput,
+    ConversationMessage,
+    ExperienceOutput,
+    TaskExperienceOutput,
+)
 from .utils import (
     BaseAdapter,
     Evaluator,
@@ -1,9 +1,16 @@
+import asyncio
+import copy
+import hashlib
 import gc
+import json
 import math
 import os
 import random
 import shutil
+import threading
+import weakref
 from abc import ABCMeta, abstractmethod
+from array import array
 from pathlib import Path
 
 import torch
@@ -11,11 +18,18 @@ from torch.nn.parallel import DistributedDataParallel
 from transformers import GenerationConfig, PreTrainedModel, PreTrainedTokenizerBase
 from transformers.generation.utils import GenerateOutput
 
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers < 4.36
+    DynamicCache = None
+
+from .cache import GenerationCache
 from .types import ConversationMessage, APIConversationMessage, InferenceEngine, TokenizedConversationOutput
 
 import time
-from typing import Tuple
-from openai import OpenAI
+from typing import Sequence, Tuple
+import openai
+from openai import AsyncOpenAI, OpenAI
 
 try:
     import torch_npu
@@ -23,33 +37,102 @@ except ImportError:
     torch_npu = None
 
 
+class TokenizedConversationBuffer:
+    """
+    A growable tokenized conversation. Text is kept as a list of parts and joined on
+    demand; input ids and the action mask live in int arrays, so appending a round
+    does not copy the whole conversation.
+    """
+
+    def __init__(self) -> None:
+        self._text_parts: list[str] = []
+        self.input_ids = array("i")
+        self.action_mask = array("b")
+
+    def __len__(self) -> int:
+        return len(self.input_ids)
+
+    @property
+    def text(self) -> str:
+        if len(self._text_parts) > 1:
+            self._text_parts = ["".join(self._text_parts)]
+        return self._text_parts[0] if self._text_parts else ""
+
+    def append(self, text: str, input_ids: Sequence[int], action_mask: Sequence[int]) -> None:
+        self._text_parts.append(text)
+        self.input_ids.extend(input_ids)
+        self.action_mask.extend(action_mask)
+
+    def extend(self, tokenized: TokenizedConversationOutput) -> None:
+        self.append(tokenized["text"], tokenized["input_ids"], tokenized["action_mask"])
+
+    def copy(self) -> "TokenizedConversationBuffer":
+        buffer = TokenizedConversationBuffer()
+        buffer._text_parts = [self.text]
+        buffer.input_ids = array("i", self.input_ids)
+        buffer.action_mask = array("b", self.action_mask)
+        return buffer
+
+    def to_output(self) -> TokenizedConversationOutput:
+        return TokenizedConversationOutput(
+            {
+                "text": self.text,
+                "input_ids": self.input_ids.tolist(),
+                "action_mask": self.action_mask.tolist(),
+            }
+        )
+
+
 class BaseChatTemplate(metaclass=ABCMeta):
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # runs before ABCMeta collects the abstract methods: a template that tokenizes
+        # messages itself does not have to render them
+        if "tokenize_conversation_one" in cls.__dict__ and getattr(
+            cls.render_conversation_one, "__isabstractmethod__", False
+        ):
+
+            def render_conversation_one(self, message, idx=-1, add_generation_prompt=False):
+                raise NotImplementedError(
+                    f"{type(self).__name__} tokenizes messages without rendering them."
+                )
+
+            cls.render_conversation_one = render_conversation_one
+
     @abstractmethod
-    def tokenize_conversation_one(
+    def render_conversation_one(
         self,
         message: ConversationMessage,
-        tokenizer: PreTrainedTokenizerBase,
-        idx: int,
+        idx: int = -1,
         add_generation_prompt: bool = False,
-    ) -> TokenizedConversationOutput:
+    ) -> Tuple[str, str]:
+        """
+        Return the text to encode for the message and the text to record for it.
+        Templates that implement this get `tokenize_conversation_one` for free and
+        batched encoding in `tokenize_conversation_batch`; templates that need the
+        tokenizer can override `tokenize_conversation_one` instead.
+        """
         raise NotImplementedError
 
-    def tokenize_conversation(
+    def tokenize_conversation_one(
         self,
-        conversation: list[ConversationMessage],
+        message: ConversationMessage,
         tokenizer: PreTrainedTokenizerBase,
+        idx: int = -1,
         add_generation_prompt: bool = False,
     ) -> TokenizedConversationOutput:
-        text = ""
-        input_ids = []
-        action_mask = []
-        for idx, message in enumerate(conversation):
-            res = self.tokenize_conversation_one(
-                message, tokenizer, idx, add_generation_prompt and idx == len(conversation) - 1
-            )
-            text += res["text"]
-            input_ids += res["input_ids"]
-            action_mask += res["action_mask"]
+        encode_text, text = self.render_conversation_one(message, idx, add_generation_prompt)
+        input_ids = tokenizer.encode(encode_text, add_special_tokens=False)
+        return self._tokenized_output(message, text, input_ids)
+
+    @staticmethod
+    def _tokenized_output(
+        message: ConversationMessage, text: str, input_ids: list[int]
+    ) -> TokenizedConversationOutput:
+        if message["loss"]:
+            action_mask = [1] * len(input_ids)
+        else:
+            action_mask = [0] * len(input_ids)
         return TokenizedConversationOutput(
             {
                 "text": text,
@@ -58,6 +141,158 @@ class BaseChatTemplate(metaclass=ABCMeta):
             }
         )
 
+    def tokenize_conversation_batch(
+        self,
+        messages: Sequence[ConversationMessage],
+        tokenizer: PreTrainedTokenizerBase,
+        idx: int = -1,
+        add_generation_prompt: bool = False,
+    ) -> list[TokenizedConversationOutput]:
+        """
+        Tokenize one message from each of several conversations, e.g. the new env
+        observations of concurrent episodes, with a single call to the tokenizer.
+        """
+        if (
+            type(self).tokenize_conversation_one is not BaseChatTemplate.tokenize_conversation_one
+            or not messages
+        ):
+            return [
+                self.tokenize_conversation_one(message, tokenizer, idx, add_generation_prompt)
+                for message in messages
+            ]
+        rendered = [
+            self.render_conversation_one(message, idx, add_generation_prompt)
+            for message in messages
+        ]
+        batch_input_ids = tokenizer(
+            [encode_text for encode_text, _ in rendered], add_special_tokens=False
+        )["input_ids"]
+        return [
+            self._tokenized_output(message, text, input_ids)
+            for message, (_, text), input_ids in zip(messages, rendered, batch_input_ids)
+        ]
+
+    def tokenize_conversation(
+        self,
+        conversation: list[ConversationMessage],
+        tokenizer: PreTrainedTokenizerBase,
+        add_generation_prompt: bool = False,
+    ) -> TokenizedConversationOutput:
+        buffer = TokenizedConversationBuffer()
+        for idx, message in enumerate(conversation):
+            buffer.extend(
+                self.tokenize_conversation_one(
+                    message, tokenizer, idx, add_generation_prompt and idx == len(conversation) - 1
+                )
+            )
+        return buffer.to_output()
+
+
+class TokenizationCache:
+    """
+    Memoises the tokenized `conversation_start` of each env client, per template class
+    and tokenizer. The start messages are the same for every episode of an env and are
+    often several KB long.
+    """
+
+    def __init__(self) -> None:
+        self._cache: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def conversation_start(
+        self,
+        chat_template: BaseChatTemplate,
+        tokenizer: PreTrainedTokenizerBase,
+        conversation_start: Sequence[ConversationMessage],
+    ) -> TokenizedConversationBuffer:
+        """
+        Return a fresh buffer holding the tokenized `conversation_start`.
+        """
+        # the vocabulary size guards against tokens added to the tokenizer later on
+        key = (type(chat_template), id(conversation_start), len(tokenizer))
+        with self._lock:
+            entries = self._cache.setdefault(tokenizer, {})
+            cached = entries.get(key)
+        # the stored start is compared by identity, so a recycled id() cannot collide
+        if cached is None or cached[0] is not conversation_start:
+            buffer = TokenizedConversationBuffer()
+            for idx, message in enumerate(conversation_start):
+                buffer.extend(
+                    chat_template.tokenize_conversation_one(message, tokenizer, idx)
+                )
+            cached = (conversation_start, buffer)
+            with self._lock:
+                entries[key] = cached
+        return cached[1].copy()
+
+
+tokenization_cache = TokenizationCache()
+
+
+class PrefixKVCache:
+    """
+    Keeps the `past_key_values` of the last `max_entries` HF generate calls together
+    with the token ids they cover. A prompt that extends one of them, like the next turn
+    of an episode, is generated from that cache and only prefills its new tokens. A cache
+    that covers more than the common prefix (e.g. the conversation was truncated) is
+    cropped, and all caches are dropped when the model weights change.
+    """
+
+    def __init__(self, max_entries: int = 1) -> None:
+        self.max_entries = max_entries if DynamicCache is not None else 0
+        self._entries: list[tuple[list[int], DynamicCache]] = []
+        self._weights_version = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def weights_version(model: PreTrainedModel) -> tuple:
+        # in-place updates (optimizer steps) bump `_version`, moves change `data_ptr`
+        return tuple((p.data_ptr(), p._version) for p in model.parameters())
+
+    def clear(self) -> None:
+        self._entries = []
+
+    def take(self, input_ids: Sequence[int], weights_version: tuple) -> DynamicCache:
+        """
+        Remove and return the cache sharing the longest prefix with `input_ids`, cropped
+        to that prefix, or a new empty cache.
+        """
+        if weights_version != self._weights_version:
+            self.clear()
+            self._weights_version = weights_version
+
+        best, best_length = None, 0
+        for i, (cached_ids, _) in enumerate(self._entries):
+            length = 0
+            for a, b in zip(cached_ids, input_ids):
+                if a != b:
+                    break
+                length += 1
+            if length > best_length:
+                best, best_length = i, length
+        if best is None:
+            return DynamicCache()
+        cached_ids, cache = self._entries.pop(best)
+
+        # at least one prompt token has to be fed to the model
+        best_length = min(best_length, len(input_ids) - 1)
+        if best_length < cache.get_seq_length():
+            if best_length == 0 or not hasattr(cache, "crop"):
+                return DynamicCache()
+            cache.crop(best_length - cache.get_seq_length())  # negative: drop from the end
+        return cache
+
+    def put(self, token_ids: list[int], cache: DynamicCache) -> None:
+        """
+        Store `cache`, which covers the first tokens of `token_ids`.
+        """
+        self._entries.append((token_ids[: cache.get_seq_length()], cache))
+        if len(self._entries) > self.max_entries:
+            self._entries.pop(0)
+
 
 class Agent:
     def __init__(
@@ -66,132 +301,422 @@ class Agent:
         tokenizer: PreTrainedTokenizerBase,
         chat_template: BaseChatTemplate | None = None,
         inference_engine: InferenceEngine = "default",
+        vllm_weight_sync: bool = True,
+        kv_cache_size: int = 1,
+        generation_cache: GenerationCache | None = None,
     ) -> None:
+        """
+        Args:
+            vllm_weight_sync (bool, optional): On `refresh_engine`, load the current weights into the running vLLM engine instead of saving the model to /dev/shm and building a new engine. The engine is still rebuilt when the architecture changed or the engine does not support it. Defaults to True.
+            kv_cache_size (int, optional): The number of `past_key_values` the default engine keeps between single-prompt calls, so that the next turn of an episode only prefills its new tokens. 0 disables the reuse. Defaults to 1.
+            generation_cache (GenerationCache, optional): An on-disk cache of generations keyed by the weights, prompt and generation config. Defaults to None.
+        """
         self.model = model
         self.tokenizer = tokenizer
         self.chat_template = chat_template or Llama2Template()
         self.inference_engine = InferenceEngine(inference_engine)
+        self.vllm_weight_sync = vllm_weight_sync
         self._vllm = None
+        self._vllm_tp_size = 1
+        self._vllm_fingerprint = None
+        self._kv_cache = PrefixKVCache(kv_cache_size)
+        self.generation_cache = generation_cache
+        self._weights_fingerprint = (None, None)
+        self._refresh_pending = False
+
+    @staticmethod
+    def _architecture_fingerprint(model: PreTrainedModel) -> tuple:
+        """
+        Everything about `model` except its weight values that the vLLM engine depends on.
+        """
+        config = model.config.to_diff_dict()
+        for key in ("_name_or_path", "torch_dtype", "transformers_version", "use_cache"):
+            config.pop(key, None)
+        shapes = tuple(
+            (name, tuple(tensor.shape)) for name, tensor in model.state_dict().items()
+        )
+        return type(model).__name__, json.dumps(config, sort_keys=True, default=str), shapes
+
+    def _build_vllm(self, model: PreTrainedModel):
+        from vllm import LLM
+
+        print("Initializing vLLM engine.")
+        self._vllm = None
+        gc.collect()
+        if model.device != torch.cpu:
+            model.to("cpu")
+
+        while shm_path := Path(
+            f"/dev/shm/agentgym/inference_model_cache/{str(random.randint(0, 2**32))}"
+        ):
+            if not shm_path.exists():
+                break
+        model.save_pretrained(shm_path)
+        self.tokenizer.save_pretrained(shm_path)
+
+        if torch.cuda.is_available():
+            num_devices = torch.cuda.device_count()
+            torch.cuda.empty_cache()
+        elif torch_npu:
+            num_devices = torch_npu.npu.device_count()
+        else:
+            num_devices = 1
+
+        try:
+            num_heads = self.model.config.num_attention_heads
+            vocab_size = self.model.config.vocab_size
+            n = math.gcd(num_heads, vocab_size)
+        except:
+            n = 1
+
+        for tp_size in range(num_devices, 0, -1):
+            if n % tp_size == 0:
+                break
+        print(f"{num_devices=}, {n=}, {tp_size=}.")
+        try:
+            llm = LLM(
+                str(shm_path),
+                tensor_parallel_size=tp_size,
+                enable_prefix_caching=bool(not torch_npu),
+                use_v2_block_manager=True,
+                disable_custom_all_reduce=True,
+                trust_remote_code=True,
+            )
+        except Exception as e:
+            print(e)
+            print("Fail to create vLLM engine.")
+            exit(-1)
+
+        self._vllm = llm
+        self._vllm_tp_size = tp_size
+        self._vllm_fingerprint = self._architecture_fingerprint(model)
+        shutil.rmtree(shm_path)
+        return llm
+
+    def _sync_vllm_weights(self, model: PreTrainedModel) -> bool:
+        """
+        Load the weights of `model` into the running vLLM engine.
+        Return False if the engine has to be rebuilt instead.
+        """
+        if self._architecture_fingerprint(model) != self._vllm_fingerprint:
+            print("Model architecture changed, rebuilding vLLM engine.")
+            return False
+        # with tensor parallelism the other shards live in worker processes
+        if self._vllm_tp_size > 1:
+            return False
+        llm_engine = self._vllm.llm_engine
+        try:
+            vllm_model = llm_engine.model_executor.driver_worker.model_runner.model
+        except AttributeError:
+            return False
+        # cached prefix blocks hold KV computed with the old weights
+        reset_prefix_cache = getattr(llm_engine, "reset_prefix_cache", None)
+        if reset_prefix_cache is None and llm_engine.cache_config.enable_prefix_caching:
+            return False
+
+        vllm_model.load_weights(
+            (name, tensor.detach()) for name, tensor in model.state_dict().items()
+        )
+        if reset_prefix_cache is not None:
+            reset_prefix_cache()
+        print("Synced model weights into the vLLM engine.")
+        return True
+
+    @staticmethod
+    def _max_new_tokens(generation_config: GenerationConfig, prompt_length: int) -> int | None:
+        """
+        The number of tokens that may be generated after a prompt of `prompt_length`
+        tokens, from `max_new_tokens` and the context left under `max_length`.
+        """
+        limits = []
+        if generation_config.max_new_tokens:
+            limits.append(generation_config.max_new_tokens)
+        if generation_config.max_length:
+            limits.append(max(generation_config.max_length - prompt_length, 1))
+        return min(limits) if limits else None
+
+    def _vllm_sampling_params(self, generation_config: GenerationConfig, prompt_length: int):
+        from vllm import SamplingParams
+
+        generation_config = {
+            "repetition_penalty": generation_config.repetition_penalty,
+            "temperature": generation_config.temperature,
+            "top_p": generation_config.top_p,
+            "top_k": generation_config.top_k,
+            "min_p": generation_config.min_p,
+            # "length_penalty": generation_config.length_penalty,
+            "early_stopping": generation_config.early_stopping,
+            "max_tokens": self._max_new_tokens(generation_config, prompt_length),
+            "min_new_tokens": generation_config.min_new_tokens,
+            "stop_token_ids": [self.tokenizer.eos_token_id],
+            # the token ids run up to and including the stop string either way; keep it
+            # in the text too, as HF generate does
+            "stop": list(generation_config.stop_strings or []),
+            "include_stop_str_in_output": bool(generation_config.stop_strings),
+        }
+        # temperature 0 is greedy decoding, not unset
+        generation_config = {
+            k: v
+            for k, v in generation_config.items()
+            if v or (k == "temperature" and v == 0)
+        }
+        return SamplingParams.from_optional(
+            **generation_config,
+            # stop strings are matched on the detokenized text
+            detokenize="stop" in generation_config,
+        )
 
     @torch.no_grad()
     def generate(
         self,
-        input_ids: list[int],
+        input_ids: list[list[int]],
         generation_config: GenerationConfig,
         refresh_engine: bool = False,
-    ) -> torch.Tensor:
+    ) -> list[list[int]]:
+        return self.generate_batch(input_ids, generation_config, refresh_engine)
+
+    @torch.no_grad()
+    def generate_batch(
+        self,
+        prompts: Sequence[Sequence[int]],
+        generation_configs: GenerationConfig | Sequence[GenerationConfig] | None = None,
+        refresh_engine: bool = False,
+    ) -> list[list[int]]:
+        """
+        Generate a continuation for each of `prompts` (token ids) in one engine call.
+        `generation_configs` is one config for all prompts or one per prompt; the number
+        of new tokens is capped per prompt by the context it has left, and generation
+        stops after any of its `stop_strings`. Returns the generated token ids of each
+        prompt, in order.
+        """
         if isinstance(self.model, DistributedDataParallel):
             model = self.model.module
         else:
             model = self.model
+        if generation_configs is None or isinstance(generation_configs, GenerationConfig):
+            generation_configs = [generation_configs] * len(prompts)
+        generation_configs = [config or model.generation_config for config in generation_configs]
+        if not prompts:
+            return []
+        if self.generation_cache is None:
+            return self._generate_batch(model, prompts, generation_configs, refresh_engine)
+
+        keys = [
+            self._generation_cache_key(model, prompt, config)
+            for prompt, config in zip(prompts, generation_configs)
+        ]
+        generated_tokens = [
+            self.generation_cache.get(key) if key is not None else None for key in keys
+        ]
+        missing = [i for i, tokens in enumerate(generated_tokens) if tokens is None]
+        if not missing:
+            # apply the refresh on the next call that reaches the engine
+            self._refresh_pending |= refresh_engine
+            return generated_tokens
+        outputs = self._generate_batch(
+            model,
+            [prompts[i] for i in missing],
+            [generation_configs[i] for i in missing],
+            refresh_engine or self._refresh_pending,
+        )
+        self._refresh_pending = False
+        for i, output in zip(missing, outputs):
+            generated_tokens[i] = output
+            if keys[i] is not None:
+                self.generation_cache.put(keys[i], output)
+        return generated_tokens
+
+    def _weights_digest(self, model: PreTrainedModel) -> str:
+        """
+        A hash of the raw bytes of the weights, recomputed only when the weights were
+        modified. Summaries such as sums miss updates that keep them (e.g. swapped
+        values), and a stale key would return generations of the old weights.
+        """
+        version = PrefixKVCache.weights_version(model)
+        if self._weights_fingerprint[0] != version:
+            digest = hashlib.sha256(type(model).__name__.encode())
+            for name, tensor in model.state_dict().items():
+                tensor = tensor.detach()
+                digest.update(f"{name}{tuple(tensor.shape)}{tensor.dtype}".encode())
+                # viewed as bytes, as numpy has no bfloat16; copied to the host one tensor at a time
+                digest.update(
+                    tensor.contiguous().reshape(-1).view(torch.uint8).cpu().numpy().tobytes()
+                )
+            self._weights_fingerprint = (version, digest.hexdigest())
+        return self._weights_fingerprint[1]
+
+    def _generation_cache_key(
+        self,
+        model: PreTrainedModel,
+        prompt: Sequence[int],
+        generation_config: GenerationConfig,
+    ) -> str | None:
+        """
+        The cache key of a generation, or None if it is sampled and not to be cached.
+        """
+        if self.inference_engine == InferenceEngine.VLLM:
+            deterministic = generation_config.temperature == 0
+        else:
+            deterministic = not generation_config.do_sample
+        if not (deterministic or self.generation_cache.cache_sampled):
+            return None
+        return GenerationCache.make_key(
+            self.inference_engine.value,
+            self._weights_digest(model),
+            list(prompt),
+            generation_config.to_json_string(),
+        )
+
+    def _generate_batch(
+        self,
+        model: PreTrainedModel,
+        prompts: Sequence[Sequence[int]],
+        generation_configs: Sequence[GenerationConfig],
+        refresh_engine: bool = False,
+    ) -> list[list[int]]:
         if self.inference_engine == InferenceEngine.VLLM:
             os.environ["VLLM_WORKER_MULTIPROC_METHOD"] = "spawn"
-            from vllm import LLM, SamplingParams, TokensPrompt
 
-            if not refresh_engine and self._vllm is not None:
-                llm = self._vllm
+            if self._vllm is None:
+                llm = self._build_vllm(model)
+            elif refresh_engine and not (
+                self.vllm_weight_sync and self._sync_vllm_weights(model)
+            ):
+                llm = self._build_vllm(model)
             else:
-                print("Initializing vLLM engine.")
-                self._vllm = None
-                gc.collect()
-                if model.device != torch.cpu:
-                    model.to("cpu")
-
-                while shm_path := Path(
-                    f"/dev/shm/agentgym/inference_model_cache/{str(random.randint(0, 2**32))}"
-                ):
-                    if not shm_path.exists():
-                        break
-                model.save_pretrained(shm_path)
-                self.tokenizer.save_pretrained(shm_path)
-
-                if torch.cuda.is_available():
-                    num_devices = torch.cuda.device_count()
-                    torch.cuda.empty_cache()
-                elif torch_npu:
-                    num_devices = torch_npu.npu.device_count()
-                else:
-                    num_devices = 1
+                llm = self._vllm
 
-                try:
-                    num_heads = self.model.config.num_attention_heads
-                    vocab_size = self.model.config.vocab_size
-                    n = math.gcd(num_heads, vocab_size)
-                except:
-                    n = 1
-
-                for tp_size in range(num_devices, 0, -1):
-                    if n % tp_size == 0:
-                        break
-                print(f"{num_devices=}, {n=}, {tp_size=}.")
-                try:
-                    llm = LLM(
-                        str(shm_path),
-                        tensor_parallel_size=tp_size,
-                        enable_prefix_caching=bool(not torch_npu),
-                        use_v2_block_manager=True,
-                        disable_custom_all_reduce=True,
-                        trust_remote_code=True,
-                    )
-                except Exception as e:
-                    print(e)
-                    print("Fail to create vLLM engine.")
-                    exit(-1)
-
-                self._vllm = llm
-                shutil.rmtree(shm_path)
-
-            INF = float("inf")
-            max_tokens = generation_config.max_new_tokens or INF
-            if generation_config.max_length:
-                max_length = generation_config.max_length - len(input_ids)
-            else:
-                max_length = INF
-            max_tokens = min(max_tokens, max_length)
-            if max_tokens == INF:
-                max_tokens = None
-
-            generation_config = {
-                "repetition_penalty": generation_config.repetition_penalty,
-                "temperature": generation_config.temperature,
-                "top_p": generation_config.top_p,
-                "top_k": generation_config.top_k,
-                "min_p": generation_config.min_p,
-                # "length_penalty": generation_config.length_penalty,
-                "early_stopping": generation_config.early_stopping,
-                "max_tokens": max_tokens,
-                "min_new_tokens": generation_config.min_new_tokens,
-                "stop_token_ids": [self.tokenizer.eos_token_id],
-            }
-            generation_config = {k: v for k, v in generation_config.items() if v}
             output = llm.generate(
                 # prompts=TokensPrompt(prompt_token_ids=input_ids),
-                prompt_token_ids=input_ids,
-                sampling_params=SamplingParams.from_optional(
-                    **generation_config,
-                    detokenize=False,
-                ),
+                prompt_token_ids=[list(prompt) for prompt in prompts],
+                sampling_params=[
+                    self._vllm_sampling_params(config, len(prompt))
+                    for prompt, config in zip(prompts, generation_configs)
+                ],
                 use_tqdm=False,
             )
+            return [list(o.outputs[0].token_ids) for o in output]
 
-            generated_tokens = []
+        if refresh_engine:
+            self._kv_cache.clear()
+        # HF generate takes a single config, so prompts are batched per distinct config
+        groups: dict[str, list[int]] = {}
+        for i, config in enumerate(generation_configs):
+            groups.setdefault(config.to_json_string(), []).append(i)
+        generated_tokens = [None] * len(prompts)
+        for positions in groups.values():
+            outputs = self._hf_generate(
+                model,
+                [prompts[i] for i in positions],
+                generation_configs[positions[0]],
+            )
+            for i, output in zip(positions, outputs):
+                generated_tokens[i] = output
+        return generated_tokens
 
-            for o in output:
-                generated_tokens.append(list(o.outputs[0].token_ids))
+    def _hf_generate(
+        self,
+        model: PreTrainedModel,
+        prompts: Sequence[Sequence[int]],
+        generation_config: GenerationConfig,
+    ) -> list[list[int]]:
+        """
+        Generate for a left-padded batch of prompts with a shared config.
+        """
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+        max_prompt_length = max(len(prompt) for prompt in prompts)
+        input_ids = torch.tensor(
+            [[pad_token_id] * (max_prompt_length - len(p)) + list(p) for p in prompts],
+            device=model.device,
+        )
+        attention_mask = torch.tensor(
+            [[0] * (max_prompt_length - len(p)) + [1] * len(p) for p in prompts],
+            device=model.device,
+        )
+        # generate up to the largest per-prompt limit, then cut each output to its own
+        max_new_tokens = [self._max_new_tokens(generation_config, len(p)) for p in prompts]
+        generation_config = copy.deepcopy(generation_config)
+        if all(max_new_tokens):
+            generation_config.max_new_tokens = max(max_new_tokens)
+            generation_config.max_length = None
+        if generation_config.pad_token_id is None:
+            generation_config.pad_token_id = pad_token_id
 
-        else:
-            output = model.generate(
-                inputs=torch.tensor(input_ids, device=model.device),
-                generation_config=generation_config,
-            )
-            if isinstance(output, GenerateOutput):
-                output = output.sequences
-            generated_tokens = [
-                o[len(input_ids[0]) :].cpu().numpy().tolist() for o in output
-            ]
+        reuse_kv = (
+            len(prompts) == 1
+            and self._kv_cache.enabled
+            and generation_config.use_cache is not False
+            and (generation_config.num_beams or 1) == 1
+        )
+        kwargs = {}
+        if reuse_kv:
+            weights_version = PrefixKVCache.weights_version(model)
+            kwargs["past_key_values"] = self._kv_cache.take(prompts[0], weights_version)
+            generation_config.return_dict_in_generate = True
+        if generation_config.stop_strings:
+            kwargs["tokenizer"] = self.tokenizer
+        output = model.generate(
+            inputs=input_ids,
+            attention_mask=attention_mask,
+            generation_config=generation_config,
+            **kwargs,
+        )
+        if reuse_kv and getattr(output, "past_key_values", None) is not None:
+            self._kv_cache.put(output.sequences[0].tolist(), output.past_key_values)
+        if isinstance(output, GenerateOutput):
+            output = output.sequences
 
+        eos_token_ids = generation_config.eos_token_id
+        if eos_token_ids is None:
+            eos_token_ids = self.tokenizer.eos_token_id
+        if not isinstance(eos_token_ids, (list, tuple)):
+            eos_token_ids = [eos_token_ids]
+        generated_tokens = []
+        for tokens, limit in zip(output[:, max_prompt_length:].tolist(), max_new_tokens):
+            tokens = tokens[:limit]
+            # finished sequences are padded up to the longest one in the batch
+            for i, token in enumerate(tokens):
+                if token in eos_token_ids:
+                    tokens = tokens[: i + 1]
+                    break
+            if generation_config.stop_strings:
+                tokens = self._truncate_at_stop_strings(tokens, generation_config.stop_strings)
+            generated_tokens.append(tokens)
         return generated_tokens
 
+    def _truncate_at_stop_strings(
+        self, tokens: list[int], stop_strings: str | Sequence[str]
+    ) -> list[int]:
+        """
+        The shortest prefix of `tokens` whose text contains one of `stop_strings`, or all
+        of `tokens`. Sequences that stopped early are padded up to the longest one in the
+        batch, with tokens that need not be eos.
+        """
+        if isinstance(stop_strings, str):
+            stop_strings = [stop_strings]
+
+        def contains_stop(n: int) -> bool:
+            text = self.tokenizer.decode(tokens[:n])
+            return any(stop in text for stop in stop_strings)
+
+        if not contains_stop(len(tokens)):
+            return tokens
+        low, high = 1, len(tokens)
+        while low < high:
+            middle = (low + high) // 2
+            if contains_stop(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return tokens[:low]
+
+
+def _stop_kwargs(stop: Sequence[str] | None) -> dict:
+    # `stop` is left out when empty; not every API accepts it
+    return {"stop": list(stop)[:4]} if stop else {}
+
 
 class APIAgent:
     def __init__(
@@ -202,17 +727,60 @@ class APIAgent:
         max_tokens: int = 4096,
         temperature: float = 1,
         top_p: float = 1,
+        generation_cache: GenerationCache | None = None,
     ) -> None:
         self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.base_url = base_url
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.top_p = top_p
+        self.generation_cache = generation_cache
         # self.role = {"system": "system", "human": "user", "gpt": "assistant"}
 
+    def _generation_cache_key(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Sequence[str] | None = None,
+    ) -> str | None:
+        """
+        The cache key of a request, or None if it is sampled and not to be cached.
+        """
+        if self.generation_cache is None or not (
+            self.temperature == 0 or self.generation_cache.cache_sampled
+        ):
+            return None
+        return GenerationCache.make_key(
+            self.base_url,
+            self.model,
+            [{"role": c["role"], "content": c["content"]} for c in conversation],
+            self.max_tokens,
+            self.temperature,
+            self.top_p,
+            *([list(stop)] if stop else []),
+        )
+
     def generate(
         self,
         conversation: list[APIConversationMessage],
+        stop: Sequence[str] | None = None,
+    ) -> Tuple[str, str | None]:
+        """
+        The next assistant message of `conversation` as (content, reasoning content).
+        The completion ends before any of `stop`; APIs accept up to four.
+        """
+        key = self._generation_cache_key(conversation, stop)
+        if key is not None and (cached := self.generation_cache.get(key)) is not None:
+            return tuple(cached)
+        content, reasoning_content = self._generate(conversation, stop)
+        if key is not None:
+            self.generation_cache.put(key, [content, reasoning_content])
+        return content, reasoning_content
+
+    def _generate(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Sequence[str] | None = None,
     ) -> Tuple[str, str | None]:
         while True:
             try:
@@ -223,7 +791,8 @@ class APIAgent:
                     messages=[{"role": c["role"], "content": c["content"]} for c in conversation],
                     max_tokens=self.max_tokens,
                     temperature=self.temperature,
-                    top_p=self.top_p
+                    top_p=self.top_p,
+                    **_stop_kwargs(stop),
                 )
                 return response.choices[0].message.content, response.choices[0].message.reasoning_content if hasattr(response.choices[0].message, "reasoning_content") else None
             except Exception as e:
@@ -231,47 +800,215 @@ class APIAgent:
                 time.sleep(1)
 
 
+class RateLimiter:
+    """
+    Token buckets on requests per minute and tokens per minute. Share one instance
+    between agents that use the same API key.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute or 0.0
+        self._tokens = tokens_per_minute or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _try_acquire(self, tokens: int) -> float:
+        """
+        Take one request and `tokens` tokens if both are available and return 0,
+        otherwise return how long to wait.
+        """
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            if self.requests_per_minute and self._requests < 1:
+                wait = (1 - self._requests) * 60 / self.requests_per_minute
+            if self.tokens_per_minute:
+                # a request larger than the bucket waits for a full bucket
+                tokens = min(tokens, self.tokens_per_minute)
+                if self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+            if wait == 0:
+                self._requests -= 1
+                self._tokens -= tokens
+            return wait
+
+    async def acquire(self, tokens: int = 0) -> None:
+        while wait := self._try_acquire(tokens):
+            await asyncio.sleep(wait)
+
+    def adjust(self, tokens: int) -> None:
+        """
+        Correct the token count of an earlier `acquire` once the actual usage is known.
+        """
+        with self._lock:
+            self._tokens -= tokens
+
+
+class AsyncAPIAgent(APIAgent):
+    """
+    An APIAgent with a coroutine `agenerate`, for running many episodes concurrently
+    in one process (see `BaseTask.agenerate_experience`). Requests are limited to
+    `max_concurrency` in flight and by `rate_limiter`, and failed requests are retried
+    with exponential backoff, honouring `Retry-After`, up to `max_retries` times.
+    The blocking `generate` of APIAgent stays available.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str,
+        max_tokens: int = 4096,
+        temperature: float = 1,
+        top_p: float = 1,
+        max_concurrency: int = 64,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        rate_limiter: RateLimiter | None = None,
+        generation_cache: GenerationCache | None = None,
+    ) -> None:
+        super().__init__(
+            api_key, base_url, model, max_tokens, temperature, top_p, generation_cache
+        )
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # the client and semaphore are bound to the event loop they are first used in
+        self._loop_state: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _get_loop_state(self) -> tuple[AsyncOpenAI, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        state = self._loop_state.get(loop)
+        if state is None:
+            state = (
+                AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+            self._loop_state[loop] = state
+        return state
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        if isinstance(
+            e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+        ):
+            return True
+        return isinstance(e, openai.APIStatusError) and e.status_code in (408, 409)
+
+    def _retry_delay(self, e: Exception, attempt: int) -> float:
+        delay = self.backoff_base * 2**attempt * random.uniform(0.5, 1.5)
+        response = getattr(e, "response", None)
+        if response is not None:
+            headers = response.headers
+            try:
+                if "retry-after-ms" in headers:
+                    delay = float(headers["retry-after-ms"]) / 1000
+                elif "retry-after" in headers:
+                    delay = float(headers["retry-after"])
+            except ValueError:
+                pass  # an HTTP date; keep the backoff delay
+        return min(max(delay, 0.0), self.backoff_max)
+
+    async def agenerate(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Sequence[str] | None = None,
+    ) -> Tuple[str, str | None]:
+        key = self._generation_cache_key(conversation, stop)
+        if key is not None and (cached := self.generation_cache.get(key)) is not None:
+            return tuple(cached)
+        content, reasoning_content = await self._agenerate(conversation, stop)
+        if key is not None:
+            self.generation_cache.put(key, [content, reasoning_content])
+        return content, reasoning_content
+
+    async def _agenerate(
+        self,
+        conversation: list[APIConversationMessage],
+        stop: Sequence[str] | None = None,
+    ) -> Tuple[str, str | None]:
+        client, semaphore = self._get_loop_state()
+        messages = [{"role": c["role"], "content": c["content"]} for c in conversation]
+        # rough prompt size (4 characters per token) plus the completion budget
+        estimated_tokens = sum(len(m["content"] or "") for m in messages) // 4 + self.max_tokens
+        attempt = 0
+        async with semaphore:
+            while True:
+                await self.rate_limiter.acquire(estimated_tokens)
+                try:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        temperature=self.temperature,
+                        top_p=self.top_p,
+                        **_stop_kwargs(stop),
+                    )
+                except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                    self.rate_limiter.adjust(-estimated_tokens)
+                    if attempt >= self.max_retries or not self._is_retryable(e):
+                        raise
+                    delay = self._retry_delay(e, attempt)
+                    print(f"{e!r}, retrying in {delay:.1f}s.")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                if response.usage is not None:
+                    self.rate_limiter.adjust(response.usage.total_tokens - estimated_tokens)
+                message = response.choices[0].message
+                return message.content, getattr(message, "reasoning_content", None)
+
+
 class Llama2Template(BaseChatTemplate):
-    def tokenize_conversation_one(
+    def render_conversation_one(
         self,
         message: ConversationMessage,
-        tokenizer: PreTrainedTokenizerBase,
         idx: int = -1,
         add_generation_prompt: bool = False,
-    ) -> TokenizedConversationOutput:
+    ) -> Tuple[str, str]:
         """
         This function applied Llama Chat template on the given vicuna-styled conversation message.
         You can provide your own _tokenize_conversation_one to adapt to your own task.
         """
         if message["from"] == "human":
             text = f"<s>[INST] {message['value']} [/INST]"
-            input_ids = tokenizer.encode(text, add_special_tokens=False)
+            return text, text
         else:
             text = f"{message['value']}</s>"
-            input_ids = tokenizer.encode(text, add_special_tokens=False)
-            text = f" {text}"
-        if message["loss"]:
-            action_mask = [1] * len(input_ids)
-        else:
-            action_mask = [0] * len(input_ids)
-
-        return TokenizedConversationOutput(
-            {
-                "text": text,
-                "input_ids": input_ids,
-                "action_mask": action_mask,
-            }
-        )
+            return text, f" {text}"
 
 
 class ChatMLTemplate(BaseChatTemplate):
-    def tokenize_conversation_one(
+    def render_conversation_one(
         self,
         message: ConversationMessage,
-        tokenizer: PreTrainedTokenizerBase,
         idx: int = -1,
         add_generation_prompt: bool = False,
-    ) -> TokenizedConversationOutput:
+    ) -> Tuple[str, str]:
         """
         This function applied Llama Chat template on the given vicuna-styled conversation message.
         You can provide your own _tokenize_conversation_one to adapt to your own task.
@@ -283,45 +1020,26 @@ class ChatMLTemplate(BaseChatTemplate):
         if add_generation_prompt:
             if message["from"] == "human":
                 text += f"<|im_start|>user\n{message['value']}<|im_end|>\n<|im_start|>assistant\n"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
             else:
                 text += f"{message['value']}<|im_end|>"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
                 # text = f" {text}"
         else:
             if message["from"] == "human":
                 text += f"<|im_start|>user\n{message['value']}<|im_end|>\n"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
             else:
                 text += f"<|im_start|>assistant\n{message['value']}<|im_end|>"
-                input_ids = tokenizer.encode(text, add_special_tokens=False)
                 # text = f" {text}"
-
-        if message["loss"]:
-            action_mask = [1] * len(input_ids)
-        else:
-            action_mask = [0] * len(input_ids)
-
-        return TokenizedConversationOutput(
-            {
-                "text": text,
-                "input_ids": input_ids,
-                "action_mask": action_mask,
-            }
-        )
+        return text, text
 
 
 class Llama3Template(BaseChatTemplate):
-    def tokenize_conversation_one(
+    def render_conversation_one(
         self,
         message: ConversationMessage,
-        tokenizer: PreTrainedTokenizerBase,
         idx: int = -1,
         add_generation_prompt: bool = False,
-    ) -> TokenizedConversationOutput:
-        val = message["value"]
-        while len(val) and val[-1] in [" ", "\n", "\t"]:
-            val = val[:-1]
+    ) -> Tuple[str, str]:
+        val = message["value"].rstrip(" \n\t")
         mfrom = message["from"]
         if add_generation_prompt:
             mfrom = message["from"]
@@ -342,29 +1060,16 @@ class Llama3Template(BaseChatTemplate):
                 text = f"<|begin_of_text|><|start_header_id|>{mfrom}<|end_header_id|>\n\n{val}<|eot_id|>"
             else:
                 text = f"<|start_header_id|>{mfrom}<|end_header_id|>\n\n{val}<|eot_id|>"
-
-        input_ids = tokenizer.encode(text, add_special_tokens=False)
-        if message["loss"]:
-            action_mask = [1] * len(input_ids)
-        else:
-            action_mask = [0] * len(input_ids)
-        return TokenizedConversationOutput(
-            {
-                "text": text,
-                "input_ids": input_ids,
-                "action_mask": action_mask,
-            }
-        )
+        return text, text
 
 
 class ChatGLM4Template(BaseChatTemplate):
-    def tokenize_conversation_one(
+    def render_conversation_one(
         self,
         message: ConversationMessage,
-        tokenizer: PreTrainedTokenizerBase,
         idx: int = -1,
         add_generation_prompt: bool = False,
-    ) -> TokenizedConversationOutput:
+    ) -> Tuple[str, str]:
         val = message["value"]
         if add_generation_prompt:
             mfrom = message["from"]
@@ -386,15 +1091,4 @@ class ChatGLM4Template(BaseChatTemplate):
                 text = f"[gMASK]<sop><|{mfrom}|>\n{val}"
             else:
                 text = f"<|{mfrom}|>\n{val}"
-        input_ids = tokenizer.encode(text, add_special_tokens=False)
-        if message["loss"]:
-            action_mask = [1] * len(input_ids)
-        else:
-            action_mask = [0] * len(input_ids)
-        return TokenizedConversationOutput(
-            {
-                "text": text,
-                "input_ids": input_ids,
-                "action_mask": action_mask,
-            }
-        )
+        return text, text
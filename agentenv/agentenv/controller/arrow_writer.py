@@ -0,0 +1,317 @@
+"""
+Columnar experience files: a directory of Arrow IPC stream shards, each holding record
+batches of experiences (item_id, reward, success, conversation, token ids, action mask).
+
+    with ArrowExperienceWriter("outputs/inference.arrow") as writer:
+        for batch in batches:
+            for item_id, exp in batch:
+                row = {"conversations": exp.conversation, "item_id": item_id, "reward": exp.reward}
+                writer.write(row, exp)
+            writer.flush()  # one record batch per flush; nothing written is rewritten
+    ArrowExperienceWriter.compact("outputs/inference.arrow")  # merge the shards into one
+
+    dataset = load_experience_dataset("outputs/inference.arrow")  # memory-mapped
+
+Every writer session appends a new shard, as a closed IPC stream cannot be appended to.
+The shards are in the format of `datasets` cache files, so `datasets.Dataset.from_file`
+maps them without copying.
+
+The schema grows with the rows: a key first seen in a later batch becomes a new column,
+and a column that was all None gets the type of its first values. As the schema of an
+IPC stream is fixed, the writer then continues in a new shard; `read_experience_table`
+fills the columns missing from older shards with nulls.
+"""
+
+import glob
+import os
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from .types import APIExperienceOutput, CompactExperienceOutput, ExperienceOutput
+
+SHARD_PATTERN = "shard-{:05d}.arrow"
+
+# the arrow types of the known conversation message fields; other fields are strings
+MESSAGE_FIELD_TYPES = {
+    "from": "string",
+    "loss": "bool",
+    "value": "string",
+    "role": "string",
+    "content": "string",
+    "reasoning_content": "string",
+}
+
+# the arrow types of the known row columns, so that e.g. the rewards of the first batch
+# being all integers does not make the reward column an integer column
+ROW_FIELD_TYPES = {
+    "item_id": "string",
+    "reward": "float64",
+    "success": "int8",
+}
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError(
+            "Arrow experience files need pyarrow. Install it with `pip install agentenv[arrow]`."
+        )
+
+
+def _shards(path: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(path, SHARD_PATTERN.replace("{:05d}", "*"))))
+
+
+def _merge_schemas(schema: "pa.Schema", other: "pa.Schema") -> "pa.Schema":
+    """
+    `schema` extended by `other`: its new columns and conversation message fields are
+    added, and its types replace the null types of `schema`.
+    """
+    fields = []
+    for field in schema:
+        if field.name not in other.names:
+            fields.append(field)
+            continue
+        other_type = other.field(field.name).type
+        if pa.types.is_null(field.type):
+            field = field.with_type(other_type)
+        elif field.name == "conversations":
+            message, other_message = field.type.value_type, other_type.value_type
+            names = {message.field(i).name for i in range(message.num_fields)}
+            new = [
+                other_message.field(i)
+                for i in range(other_message.num_fields)
+                if other_message.field(i).name not in names
+            ]
+            if new:
+                message = pa.struct(
+                    [message.field(i) for i in range(message.num_fields)] + new
+                )
+                field = field.with_type(pa.list_(message))
+        fields.append(field)
+    fields += [field for field in other if field.name not in schema.names]
+    return pa.schema(fields)
+
+
+def _conform(table: "pa.Table", schema: "pa.Schema") -> "pa.Table":
+    """
+    `table` with the columns of `schema`, missing ones filled with nulls.
+    """
+    columns = []
+    for field in schema:
+        if field.name not in table.column_names:
+            columns.append(pa.nulls(len(table), field.type))
+            continue
+        column = table.column(field.name)
+        if column.type != field.type:
+            try:
+                column = column.cast(field.type)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                # messages that gained fields; older pyarrow cannot cast such structs
+                column = pa.array(column.to_pylist(), type=field.type)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _list_array(arrays: list[Optional[np.ndarray]], value_type: "pa.DataType") -> "pa.Array":
+    """
+    Build a list array from one numpy array (or None) per row without a Python loop
+    over the elements.
+    """
+    lengths = np.array([0 if a is None else len(a) for a in arrays], dtype=np.int32)
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    present = [a for a in arrays if a is not None]
+    values = pa.array(
+        np.concatenate(present) if present else np.array([]), type=value_type
+    )
+    mask = pa.array([a is None for a in arrays])
+    return pa.ListArray.from_arrays(pa.array(offsets), values, mask=mask)
+
+
+class ArrowExperienceWriter:
+    def __init__(self, path: str) -> None:
+        """
+        Open the experience directory `path` for appending, creating it if needed.
+
+        Args:
+            path (str): The directory of the shards. The rows written keep the schema of its existing shards.
+        """
+        _require_pyarrow()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        shards = _shards(path)
+        self.schema: Optional[pa.Schema] = None
+        if shards:
+            with pa.memory_map(shards[-1]) as source:
+                self.schema = pa.ipc.open_stream(source).schema
+        n = int(os.path.basename(shards[-1])[6:11]) + 1 if shards else 0
+        self.shard_path = os.path.join(path, SHARD_PATTERN.format(n))
+        self._writer: Optional[pa.ipc.RecordBatchStreamWriter] = None
+        self._rows: list[dict[str, Any]] = []
+        self._tokens: list[tuple[Optional[np.ndarray], Optional[np.ndarray]]] = []
+
+    def write(
+        self,
+        row: dict[str, Any],
+        experience: Optional[
+            ExperienceOutput | CompactExperienceOutput | APIExperienceOutput
+        ] = None,
+    ) -> None:
+        """
+        Buffer a `{"conversations": [...], **data}` row, as written to JSON lines files,
+        with the token ids and action mask of `experience` if it has them.
+        """
+        seq_ids = action_mask = None
+        if isinstance(experience, (ExperienceOutput, CompactExperienceOutput)):
+            seq_ids = np.asarray(experience.seq_ids, dtype=np.int32)
+            action_mask = np.asarray(experience.action_mask, dtype=bool)
+        self._rows.append(row)
+        self._tokens.append((seq_ids, action_mask))
+
+    def _infer_schema(self) -> "pa.Schema":
+        """
+        The schema of the buffered rows: every key of any row, in order of appearance.
+        """
+        fields = []
+        for key in dict.fromkeys(key for row in self._rows for key in row):
+            if key == "conversations":
+                names = dict.fromkeys(
+                    k for row in self._rows for m in row.get(key) or () for k in m
+                )
+                message = pa.struct(
+                    [(k, MESSAGE_FIELD_TYPES.get(k, "string")) for k in names]
+                )
+                fields.append(pa.field("conversations", pa.list_(message)))
+            elif key in ROW_FIELD_TYPES:
+                fields.append(pa.field(key, ROW_FIELD_TYPES[key]))
+            else:
+                values = [row.get(key) for row in self._rows]
+                fields.append(pa.field(key, pa.array(values).type))
+        fields.append(pa.field("input_ids", pa.list_(pa.int32())))
+        fields.append(pa.field("action_mask", pa.list_(pa.bool_())))
+        return pa.schema(fields)
+
+    def flush(self) -> None:
+        """
+        Write the buffered rows as one record batch. Raises `ValueError` if a value does
+        not fit the type of its column, e.g. a fractional reward in an integer column.
+        """
+        if not self._rows:
+            return
+        schema = self._infer_schema()
+        if self.schema is not None:
+            schema = _merge_schemas(self.schema, schema)
+            if not schema.equals(self.schema) and self._writer is not None:
+                # the rows brought new columns or types: continue in a new shard
+                self._writer.close()
+                self._writer = None
+                n = int(os.path.basename(self.shard_path)[6:11]) + 1
+                self.shard_path = os.path.join(self.path, SHARD_PATTERN.format(n))
+        self.schema = schema
+        columns = []
+        for field in self.schema:
+            if field.name == "input_ids":
+                columns.append(_list_array([t[0] for t in self._tokens], pa.int32()))
+            elif field.name == "action_mask":
+                columns.append(_list_array([t[1] for t in self._tokens], pa.bool_()))
+            elif field.name == "conversations":
+                columns.append(
+                    pa.array([row.get(field.name) for row in self._rows], type=field.type)
+                )
+            else:
+                columns.append(self._column(field))
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
+        if self._writer is None:
+            self._writer = pa.ipc.new_stream(self.shard_path, self.schema)
+        self._writer.write_batch(batch)
+        self._rows, self._tokens = [], []
+
+    def _column(self, field: "pa.Field") -> "pa.Array":
+        # `pa.array(values, type=...)` truncates floats to integers silently; a safe
+        # cast of the inferred array raises instead
+        values = pa.array([row.get(field.name) for row in self._rows])
+        try:
+            return values.cast(field.type, safe=True)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(
+                f"Column {field.name!r} of {self.path} is {field.type}; "
+                f"cannot write {values.type} values to it without loss: {e}"
+            ) from e
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self) -> "ArrowExperienceWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def compact(path: str, max_batch_rows: int = 1024) -> None:
+        """
+        Merge the shards of `path` into a single shard of batches of up to
+        `max_batch_rows` rows. No writer may have the directory open meanwhile.
+        """
+        _require_pyarrow()
+        shards = _shards(path)
+        if len(shards) <= 1:
+            return
+        table = read_experience_table(path)
+        tmp_path = os.path.join(path, "compact.arrow.tmp")
+        with pa.ipc.new_stream(tmp_path, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max_batch_rows)
+        del table  # release the memory maps before removing the shards
+        for shard in shards:
+            os.remove(shard)
+        os.replace(tmp_path, os.path.join(path, SHARD_PATTERN.format(0)))
+
+
+def read_experience_table(path: str) -> "pa.Table":
+    """
+    The experiences of `path` as one memory-mapped table.
+    """
+    _require_pyarrow()
+    tables = []
+    for shard in _shards(path):
+        # the map stays open as long as the table references it
+        tables.append(pa.ipc.open_stream(pa.memory_map(shard)).read_all())
+    if not tables:
+        raise FileNotFoundError(f"No experience shards in {path}.")
+    schema = tables[0].schema
+    for table in tables[1:]:
+        schema = _merge_schemas(schema, table.schema)
+    return pa.concat_tables([_conform(table, schema) for table in tables])
+
+
+def load_experience_dataset(path: str) -> "datasets.Dataset":
+    """
+    The experiences of `path` as a `datasets.Dataset` memory-mapping its shards.
+    """
+    import datasets
+
+    _require_pyarrow()
+    shards = _shards(path)
+    if not shards:
+        raise FileNotFoundError(f"No experience shards in {path}.")
+    schemas = []
+    for shard in shards:
+        with pa.memory_map(shard) as source:
+            schemas.append(pa.ipc.open_stream(source).schema)
+    if any(not schema.equals(schemas[0]) for schema in schemas[1:]):
+        raise ValueError(
+            f"The shards of {path} have different columns; merge them with "
+            "`ArrowExperienceWriter.compact` first."
+        )
+    return datasets.concatenate_datasets(
+        [datasets.Dataset.from_file(shard) for shard in shards]
+    )
@@ -0,0 +1,172 @@
+"""
+On-disk cache of generations, so that re-running an evaluation (e.g. after an env-side
+fix) replays the LLM calls it already made.
+
+    cache = GenerationCache("~/.cache/agentgym/generations.sqlite", max_size=2**30)
+    agent = APIAgent(..., temperature=0, generation_cache=cache)
+
+Entries are keyed by a hash of the model identity (API model name or a fingerprint of
+the weights), the prompt and the sampling parameters, and evicted least recently used
+first once the cache grows past `max_size` bytes, down to `EVICT_TO` of it. Only
+deterministic requests (greedy decoding, temperature 0) are cached unless `cache_sampled`
+is set.
+
+Hits do not write to the file: their access times are buffered and written with the next
+put, or every `ACCESS_FLUSH_SIZE` hits. The size of the cache is kept in memory; it is
+recounted from the file only after another process wrote to it, and before evicting.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+# the fraction of `max_size` an eviction shrinks the cache to, so that a full cache is not
+# recounted and evicted from on every put
+EVICT_TO = 0.9
+ACCESS_FLUSH_SIZE = 256
+
+
+class GenerationCache:
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 2**30,
+        cache_sampled: bool = False,
+    ) -> None:
+        """
+        Args:
+            path (str): The sqlite file to store the cache in. It may be shared by several processes.
+            max_size (int, optional): The size in bytes of the stored generations above which the least recently used ones are evicted. Defaults to 1 GiB.
+            cache_sampled (bool, optional): Also cache sampled generations. Replays then return the same sample for a repeated prompt. Defaults to False.
+        """
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "accessed REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS generations_accessed ON generations (accessed)"
+        )
+        self._conn.commit()
+        self._data_version = self._read_data_version()
+        self._size = self._count_size()
+        self._accessed: dict[str, float] = {}
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Hash JSON-serialisable `parts` into a cache key.
+        """
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._write_accessed()
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            if self._read_data_version() != self._data_version:
+                self._data_version = self._read_data_version()
+                self._size = self._count_size()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            # a replaced entry is counted twice until the next recount
+            self._size += len(data)
+            self._write_accessed()
+            if self._size > self.max_size:
+                self._evict()
+            self._conn.commit()
+
+    def _read_data_version(self) -> int:
+        # changes whenever another connection commits to the file
+        (version,) = self._conn.execute("PRAGMA data_version").fetchone()
+        return version
+
+    def _count_size(self) -> int:
+        (size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM generations"
+        ).fetchone()
+        return size
+
+    def _write_accessed(self) -> None:
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE generations SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed = {}
+
+    def _evict(self) -> None:
+        # other processes sharing the file add and evict entries too
+        total = self._count_size()
+        if total > self.max_size:
+            target = self.max_size * EVICT_TO
+            evicted = []
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM generations ORDER BY accessed"
+            ):
+                if total <= target:
+                    break
+                evicted.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM generations WHERE key = ?", evicted)
+        self._size = total
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            self._write_accessed()
+            self._conn.commit()
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size": size,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM generations")
+            self._conn.commit()
+            self._size = 0
+            self._accessed = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._write_accessed()
+            self._conn.commit()
+            self._conn.close()
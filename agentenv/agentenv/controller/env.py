@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
+from typing import Any, Optional
 
+from .transport import get_transport
 from .types import ActionFormat, ConversationMessage, StepOutput
 
 # Each environment client class inherits BaseEnvClient
@@ -35,3 +37,92 @@ class BaseEnvClient(metaclass=ABCMeta):
         """
         Reset the environment.
         """
+
+
+# Async counterpart of BaseEnvClient. The constructor does no I/O, so clients are
+# created with `await Client.open(...)`, which also runs `create` on the env server.
+# Requests share the pooled aiohttp session of the server's transport.
+# Must implement: create, observe, step, reset
+
+class AsyncBaseEnvClient(metaclass=ABCMeta):
+    conversation_start: tuple[ConversationMessage]
+    # name of the field that carries the env id in requests to the env server
+    env_id_key: str = "id"
+
+    def __init__(
+        self,
+        env_server_base: str,
+        data_len: int,
+        *args,
+        timeout: int = 300,
+        action_format: ActionFormat = "react",
+        **kwargs,
+    ) -> None:
+        self.env_server_base = env_server_base
+        self.timeout = timeout
+        self.data_len = data_len
+        self.action_format = ActionFormat(action_format)
+        self.env_id = None
+        self.transport = get_transport(env_server_base)
+        adapter_cls = getattr(self, "adapter_cls", None)
+        if adapter_cls is not None:
+            self.conversation_start = adapter_cls.conversation_start_dict[
+                self.action_format
+            ]
+
+    @classmethod
+    async def open(cls, *args, **kwargs) -> "AsyncBaseEnvClient":
+        """
+        Construct a client and create its environment on the env server.
+        """
+        client = cls(*args, **kwargs)
+        await client.create()
+        return client
+
+    def __len__(self) -> int:
+        return self.data_len
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+    ) -> Any:
+        return await self.transport.arequest(
+            method, path, json=json, params=params, timeout=self.timeout
+        )
+
+    async def _post(self, path: str, data: dict[str, Any]) -> Any:
+        data[self.env_id_key] = self.env_id
+        return await self._request("POST", path, json=data)
+
+    async def _get(self, path: str) -> Any:
+        return await self._request("GET", path, params={self.env_id_key: self.env_id})
+
+    @abstractmethod
+    async def create(self) -> None:
+        """
+        Create the environment on the env server and store its id in `self.env_id`.
+        """
+
+    @abstractmethod
+    async def observe(self) -> str:
+        """
+        Parse env server response and give a text message to prompt the LLM.
+        """
+
+    @abstractmethod
+    async def step(self, action) -> StepOutput:
+        """
+        Parse model output from the action and call the env server.
+        """
+
+    @abstractmethod
+    async def reset(self, idx: int) -> None:
+        """
+        Reset the environment.
+        """
+
+    async def close(self) -> Any:
+        return await self._post("close", {})
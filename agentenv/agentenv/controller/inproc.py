@@ -0,0 +1,417 @@
+"""
+Transports that call the FastAPI app of an env server without HTTP, for envs whose logic
+is plain Python. The env server base of the clients names the app instead of a URL:
+
+    TextCraftTask({"env_server_base": "inproc://agentenv_textcraft.server:app", ...})
+    TextCraftTask({"env_server_base": "pipe://agentenv_textcraft.server:app", ...})
+
+`inproc://` imports the app into this process and calls its route handlers directly.
+`pipe://` starts a worker process that imports the app and serves the requests sent over
+a pipe, which keeps the env out of the process (and the GIL) of the trainer. A worker
+that died is restarted on the next request; the envs it held are lost, as they are when
+an env server restarts. The worker is started with `spawn`, so the main module must
+guard its entry point with `if __name__ == "__main__"`. The part after `:` defaults
+to `app`.
+
+Requests reach the route handlers with the arguments FastAPI would pass them, and the
+responses are what FastAPI would serialise to JSON, so the env clients are unchanged.
+Middlewares and dependencies of the app are not run.
+"""
+
+import asyncio
+import functools
+import importlib
+import inspect
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Optional
+
+from .profiler import mark_env_request
+from .transport import EnvServerError, LatencyStats
+
+INPROC_SCHEMES = ("inproc://", "pipe://")
+
+
+def load_app(spec: str) -> Any:
+    """
+    Import the app named by `module.path:attribute`.
+    """
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+class _Route:
+    def __init__(self, endpoint: Callable) -> None:
+        from pydantic import BaseModel
+
+        self.endpoint = endpoint
+        self.is_coroutine = inspect.iscoroutinefunction(endpoint)
+        # (name, is a request body model, annotation)
+        self.params: list[tuple[str, bool, Any]] = []
+        for name, param in inspect.signature(endpoint).parameters.items():
+            annotation = param.annotation
+            is_body = inspect.isclass(annotation) and issubclass(annotation, BaseModel)
+            self.params.append((name, is_body, annotation))
+        # a single body model is the whole request body, several are embedded by name
+        self.embed = sum(is_body for _, is_body, _ in self.params) > 1
+
+    def arguments(
+        self, json: Optional[dict[str, Any]], params: Optional[dict[str, Any]]
+    ) -> dict[str, Any]:
+        kwargs = {}
+        for name, is_body, annotation in self.params:
+            if is_body:
+                data = (json or {}).get(name) if self.embed else json
+                kwargs[name] = annotation(**(data or {}))
+            elif params is not None and name in params:
+                value = params[name]
+                if annotation in (int, float, str) and not isinstance(value, annotation):
+                    value = annotation(value)
+                kwargs[name] = value
+        return kwargs
+
+
+def _server_error(method: str, path: str, e: Exception) -> EnvServerError:
+    from fastapi import HTTPException
+
+    if isinstance(e, EnvServerError):
+        return e
+    if isinstance(e, HTTPException):
+        return EnvServerError(
+            f"{method} {path} returned {e.status_code}: {e.detail}", status_code=e.status_code
+        )
+    return EnvServerError(f"{method} {path} failed: {e!r}", status_code=500)
+
+
+class AppDispatcher:
+    """
+    Calls the route handlers of a FastAPI app. Handlers defined with `async def` run on
+    one event loop in a daemon thread, the others in the calling thread, as FastAPI runs
+    them on its event loop and in its thread pool.
+    """
+
+    def __init__(self, app: Any) -> None:
+        from fastapi.routing import APIRoute
+
+        self.app = app
+        self.routes: dict[tuple[str, str], _Route] = {}
+        for route in app.routes:
+            if isinstance(route, APIRoute):
+                for method in route.methods:
+                    self.routes[(method, route.path.strip("/"))] = _Route(route.endpoint)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    def _resolve(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]],
+        params: Optional[dict[str, Any]],
+    ) -> tuple[_Route, dict[str, Any]]:
+        route = self.routes.get((method, path.strip("/")))
+        if route is None:
+            raise EnvServerError(f"{method} {path} is not a route of the app.", status_code=404)
+        try:
+            return route, route.arguments(json, params)
+        except (TypeError, ValueError) as e:  # pydantic's ValidationError is a ValueError
+            raise EnvServerError(f"{method} {path}: {e}", status_code=422) from e
+
+    def call(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+    ) -> Any:
+        from fastapi.encoders import jsonable_encoder
+
+        route, kwargs = self._resolve(method, path, json, params)
+        try:
+            if route.is_coroutine:
+                result = asyncio.run_coroutine_threadsafe(
+                    route.endpoint(**kwargs), self._event_loop()
+                ).result()
+            else:
+                result = route.endpoint(**kwargs)
+            # a copy, so the env state returned by a handler is not shared with the client
+            return jsonable_encoder(result)
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            raise _server_error(method, path, e) from e
+
+    async def acall(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+    ) -> Any:
+        from fastapi.encoders import jsonable_encoder
+
+        route, kwargs = self._resolve(method, path, json, params)
+        if not route.is_coroutine:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(self.call, method, path, json, params)
+            )
+        try:
+            result = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(route.endpoint(**kwargs), self._event_loop())
+            )
+            return jsonable_encoder(result)
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            raise _server_error(method, path, e) from e
+
+
+class _LocalTransport:
+    """
+    The request methods of `EnvTransport` over `_call` and `_acall`.
+    """
+
+    def __init__(self, env_server_base: str) -> None:
+        self.env_server_base = env_server_base
+        self.spec = env_server_base.split("://", 1)[1]
+        self.latency = LatencyStats()
+
+    def _call(self, method, path, json, params, timeout) -> Any:
+        raise NotImplementedError
+
+    async def _acall(self, method, path, json, params, timeout) -> Any:
+        raise NotImplementedError
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        mark_env_request()
+        start = time.perf_counter()
+        try:
+            result = self._call(method, path, json, params, timeout)
+        except EnvServerError:
+            self.latency.record(path, time.perf_counter() - start, error=True)
+            raise
+        self.latency.record(path, time.perf_counter() - start)
+        return result
+
+    async def arequest(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        mark_env_request()
+        start = time.perf_counter()
+        try:
+            result = await self._acall(method, path, json, params, timeout)
+        except EnvServerError:
+            self.latency.record(path, time.perf_counter() - start, error=True)
+            raise
+        self.latency.record(path, time.perf_counter() - start)
+        return result
+
+    def post(self, path: str, json: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("POST", path, json=json, timeout=timeout)
+
+    def get(self, path: str, params: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("GET", path, params=params, timeout=timeout)
+
+    async def apost(self, path: str, json: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return await self.arequest("POST", path, json=json, timeout=timeout)
+
+    async def aget(self, path: str, params: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return await self.arequest("GET", path, params=params, timeout=timeout)
+
+    async def aclose(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class InProcessTransport(_LocalTransport):
+    """
+    Calls the route handlers of the app in this process. `timeout` is not enforced; a
+    step that must not hang needs `BaseTask.step_timeout`.
+    """
+
+    def __init__(self, env_server_base: str) -> None:
+        super().__init__(env_server_base)
+        self.dispatcher = AppDispatcher(load_app(self.spec))
+
+    def _call(self, method, path, json, params, timeout) -> Any:
+        return self.dispatcher.call(method, path, json, params)
+
+    async def _acall(self, method, path, json, params, timeout) -> Any:
+        return await self.dispatcher.acall(method, path, json, params)
+
+
+def _serve_pipe(spec: str, conn: Any, max_threads: int) -> None:
+    """
+    The loop of a pipe worker: `(id, method, path, json, params)` requests in,
+    `(id, ok, result or (message, status))` replies out, handled by a thread pool.
+    """
+    try:
+        dispatcher = AppDispatcher(load_app(spec))
+    except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+        conn.send(f"Failed to load {spec}: {e!r}")
+        return
+    conn.send(None)
+    send_lock = threading.Lock()
+
+    def handle(request_id: int, method: str, path: str, json: Any, params: Any) -> None:
+        try:
+            reply = (request_id, True, dispatcher.call(method, path, json, params))
+        except EnvServerError as e:
+            reply = (request_id, False, (str(e), e.status_code))
+        with send_lock:
+            conn.send(reply)
+
+    with ThreadPoolExecutor(max_threads) as executor:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                break
+            if request is None:
+                break
+            executor.submit(handle, *request)
+
+
+class _PipeWorker:
+    def __init__(self, spec: str, max_threads: int) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_serve_pipe, args=(spec, child_conn, max_threads), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.pending: dict[int, Future] = {}
+        self.alive = True
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        try:
+            error = self.conn.recv()
+        except EOFError:
+            error = f"The worker for {spec} exited on start."
+        if error is not None:
+            self.close()
+            raise EnvServerError(error)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(EnvServerError(*result))
+        with self._lock:
+            self.alive = False
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(EnvServerError("The env worker process died."))
+
+    def submit(self, method: str, path: str, json: Any, params: Any) -> Future:
+        future = Future()
+        with self._lock:
+            if not self.alive:
+                raise EnvServerError("The env worker process died.")
+            request_id = next(self._ids)
+            self.pending[request_id] = future
+            try:
+                self.conn.send((request_id, method, path, json, params))
+            except (OSError, ValueError) as e:
+                self.pending.pop(request_id)
+                self.alive = False
+                raise EnvServerError(f"The env worker process died: {e!r}") from e
+        return future
+
+    def close(self) -> None:
+        with self._lock:
+            self.alive = False
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class PipeTransport(_LocalTransport):
+    """
+    Sends the requests to the app in a worker process, which handles up to
+    `max_threads` of them at a time.
+    """
+
+    def __init__(self, env_server_base: str, max_threads: int = 64) -> None:
+        super().__init__(env_server_base)
+        self.max_threads = max_threads
+        self._worker: Optional[_PipeWorker] = None
+        self._worker_lock = threading.Lock()
+
+    def _submit(self, method: str, path: str, json: Any, params: Any) -> Future:
+        with self._worker_lock:
+            if self._worker is None or not self._worker.alive:
+                if self._worker is not None:
+                    print(f"Restarting the env worker for {self.spec}.")
+                    self._worker.close()
+                self._worker = None  # not reused if the start fails
+                self._worker = _PipeWorker(self.spec, self.max_threads)
+            worker = self._worker
+        return worker.submit(method, path, json, params)
+
+    def _call(self, method, path, json, params, timeout) -> Any:
+        try:
+            return self._submit(method, path, json, params).result(timeout)
+        except FutureTimeoutError as e:
+            raise EnvServerError(f"{method} {path} timed out after {timeout}s.") from e
+
+    async def _acall(self, method, path, json, params, timeout) -> Any:
+        future = asyncio.wrap_future(self._submit(method, path, json, params))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as e:
+            raise EnvServerError(f"{method} {path} timed out after {timeout}s.") from e
+
+    def close(self) -> None:
+        with self._worker_lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.close()
+
+
+def local_transport(env_server_base: str, **kwargs) -> _LocalTransport:
+    """
+    The transport for an `inproc://` or `pipe://` env server base.
+    """
+    if env_server_base.startswith("inproc://"):
+        return InProcessTransport(env_server_base, **kwargs)
+    if env_server_base.startswith("pipe://"):
+        return PipeTransport(env_server_base, **kwargs)
+    raise ValueError(f"{env_server_base} is not an in-process env server.")
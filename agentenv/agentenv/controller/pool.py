@@ -0,0 +1,119 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from .env import BaseEnvClient
+
+
+class EnvClientPool:
+    """
+    The env clients of a task. Clients (and so env instances on the server) are created
+    on first use, up to `max_clients`. A client whose env died is swapped for a new one
+    with `replace`, and `close` releases every env on the server.
+    """
+
+    def __init__(
+        self, client_factory: Callable[[], BaseEnvClient], max_clients: int
+    ) -> None:
+        if max_clients < 1:
+            raise ValueError("An env client pool needs at least one client.")
+        self.client_factory = client_factory
+        self.max_clients = max_clients
+        self.clients: list[BaseEnvClient] = []
+        self._idle: list[BaseEnvClient] = []
+        self._creating = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> int:
+        """
+        The number of clients that can be acquired without waiting for a release.
+        """
+        with self._lock:
+            return self.max_clients - len(self.clients) - self._creating + len(self._idle)
+
+    def acquire(self, overflow: bool = False) -> BaseEnvClient:
+        """
+        Take an idle client, or create one if the pool is not full. With `overflow`, a
+        client is created past `max_clients` too, e.g. for a short-lived duplicate.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if not overflow and len(self.clients) + self._creating >= self.max_clients:
+                raise RuntimeError("All env clients of the pool are in use.")
+            self._creating += 1
+        try:
+            client = self.client_factory()
+        finally:
+            with self._lock:
+                self._creating -= 1
+        with self._lock:
+            self.clients.append(client)
+        return client
+
+    def release(self, client: BaseEnvClient) -> None:
+        """
+        Return an acquired client. Clients dropped from the pool in the meantime are ignored.
+        """
+        with self._lock:
+            if client in self.clients:
+                self._idle.append(client)
+
+    def discard(self, client: BaseEnvClient, pending: Optional[Future] = None) -> None:
+        """
+        Drop a client from the pool, e.g. one whose call hangs, and close its env once
+        `pending` (the call still running on it) is done. Its slot is free at once.
+        """
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            if client in self._idle:
+                self._idle.remove(client)
+        if pending is None:
+            self._close_client(client)
+        else:
+            pending.add_done_callback(lambda _: self._close_client(client))
+
+    def replace(self, client: BaseEnvClient) -> BaseEnvClient:
+        """
+        Swap an acquired client whose env died for a new, acquired client. If creating
+        the new client raises, the old one is dropped from the pool all the same, so the
+        call can be repeated with it.
+        """
+        with self._lock:
+            if client not in self.clients:
+                client = None
+            else:
+                self.clients.remove(client)
+        if client is not None:
+            self._close_client(client)
+        with self._lock:
+            self._creating += 1
+        try:
+            new_client = self.client_factory()
+        finally:
+            with self._lock:
+                self._creating -= 1
+        with self._lock:
+            self.clients.append(new_client)
+        return new_client
+
+    @staticmethod
+    def _close_client(client: BaseEnvClient) -> None:
+        close = getattr(client, "close", None)
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            print(f"Failed to close env: {e}")
+
+    def close(self) -> None:
+        """
+        Close the envs of all clients on the env server.
+        """
+        with self._lock:
+            clients, self.clients, self._idle = self.clients, [], []
+        for client in clients:
+            self._close_client(client)
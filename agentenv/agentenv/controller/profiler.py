@@ -0,0 +1,221 @@
+"""
+Opt-in timing of rollouts. Attach a profiler to a task and every episode records spans
+for its phases:
+
+    profiler = RolloutProfiler(SpanAggregator(), ChromeTraceExporter())
+    task.profiler = profiler
+    task.generate_experience(agent, idxs)
+    print(profiler.sinks[0].summary())           # p50/p95/p99 per env and phase
+    profiler.sinks[1].save("rollout_trace.json")  # open in chrome://tracing or Perfetto
+
+Phases:
+    reset, observe   env client calls at the start of an episode
+    tokenize         chat-template tokenization and detokenization of generations
+    generate         the agent call; one span per batched call in concurrent rollouts
+    parse            client-side work in `client.step` before it calls the env server
+                     (action parsing)
+    step             the rest of `client.step`: env server requests and their handling
+    recover          recreating a dead env and replaying the actions of its episode
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterator, Optional
+
+import numpy as np
+
+
+@dataclass
+class Span:
+    phase: str
+    env: str
+    start: float
+    end: float
+    # data idx of the episode, None for spans shared by several episodes
+    idx: Optional[int] = None
+    round: Optional[int] = None
+    # the timeline row: an env client, or e.g. "engine" for batched generation
+    lane: Hashable = None
+    args: Optional[dict[str, Any]] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class SpanAggregator:
+    """
+    Collects span durations per env and phase.
+    """
+
+    def __init__(self) -> None:
+        self._durations: dict[tuple[str, str], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self._durations.setdefault((span.env, span.phase), []).append(
+                span.duration
+            )
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        """
+        `{env: {phase: {count, total, mean, p50, p95, p99, max}}}`, in seconds.
+        """
+        with self._lock:
+            durations = {key: np.array(d) for key, d in self._durations.items()}
+        summary = {}
+        for (env, phase), d in sorted(durations.items()):
+            p50, p95, p99 = np.percentile(d, [50, 95, 99])
+            summary.setdefault(env, {})[phase] = {
+                "count": len(d),
+                "total": float(d.sum()),
+                "mean": float(d.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(d.max()),
+            }
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+
+
+class ChromeTraceExporter:
+    """
+    Keeps the spans and writes them in the Chrome trace event format, one process per
+    env and one thread per lane, which Perfetto and chrome://tracing show as a timeline.
+    """
+
+    def __init__(self) -> None:
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        if not spans:
+            return []
+        t0 = min(span.start for span in spans)
+        pids: dict[str, int] = {}
+        tids: dict[tuple[str, Hashable], int] = {}
+        events = []
+        for span in spans:
+            if span.env not in pids:
+                pids[span.env] = len(pids) + 1
+                events.append(
+                    {"ph": "M", "name": "process_name", "pid": pids[span.env],
+                     "args": {"name": span.env}}
+                )
+            lane = (span.env, span.lane)
+            if lane not in tids:
+                tids[lane] = len(tids) + 1
+                name = span.lane if isinstance(span.lane, str) else f"client {tids[lane]}"
+                events.append(
+                    {"ph": "M", "name": "thread_name", "pid": pids[span.env],
+                     "tid": tids[lane], "args": {"name": name}}
+                )
+            args = {"idx": span.idx, "round": span.round, **(span.args or {})}
+            events.append(
+                {
+                    "name": span.phase,
+                    "cat": span.env,
+                    "ph": "X",
+                    "ts": (span.start - t0) * 1e6,
+                    "dur": span.duration * 1e6,
+                    "pid": pids[span.env],
+                    "tid": tids[lane],
+                    "args": {k: v for k, v in args.items() if v is not None},
+                }
+            )
+        return events
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.trace_events()}, f)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+# the client.step span running in this thread or asyncio task, see `RolloutProfiler.step`
+_current_step: ContextVar[Optional[dict]] = ContextVar("_current_step", default=None)
+
+
+def mark_env_request() -> None:
+    """
+    Called by the env transport before each request, to split `client.step` into its
+    parse and step phases.
+    """
+    step = _current_step.get()
+    if step is not None and step["request_start"] is None:
+        step["request_start"] = time.perf_counter()
+
+
+class RolloutProfiler:
+    def __init__(self, *sinks) -> None:
+        """
+        Args:
+            sinks: Objects with a `record(span)` method. Defaults to a single SpanAggregator.
+        """
+        self.sinks = list(sinks) or [SpanAggregator()]
+
+    def record(self, span: Span) -> None:
+        for sink in self.sinks:
+            sink.record(span)
+
+    @contextmanager
+    def span(
+        self,
+        phase: str,
+        env: str,
+        idx: Optional[int] = None,
+        round: Optional[int] = None,
+        lane: Hashable = None,
+        **args,
+    ) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(
+                Span(phase, env, start, time.perf_counter(), idx, round, lane, args or None)
+            )
+
+    @contextmanager
+    def step(
+        self,
+        env: str,
+        idx: Optional[int] = None,
+        round: Optional[int] = None,
+        lane: Hashable = None,
+    ) -> Iterator[None]:
+        """
+        Time a `client.step` call as a parse span up to its first env server request
+        and a step span from there on.
+        """
+        step = {"request_start": None}
+        token = _current_step.set(step)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _current_step.reset(token)
+            split = step["request_start"] or end
+            self.record(Span("parse", env, start, split, idx, round, lane))
+            if step["request_start"] is not None:
+                self.record(Span("step", env, split, end, idx, round, lane))
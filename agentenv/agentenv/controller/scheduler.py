@@ -0,0 +1,182 @@
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Mapping, Optional, Sequence
+
+from transformers import GenerationConfig
+
+from . import Agent, APIAgent, BaseTask
+from .task import EpisodeState
+from .types import TaskExperienceOutput
+
+
+class MultiTaskScheduler:
+    """
+    Rolls out episodes of several tasks at once, so that every env server and the
+    inference engine stay busy instead of working through the tasks one by one.
+
+    At most `max_concurrency` episodes are live in total, and at most
+    `task_concurrency[i]` (default: the client cap of the task) of task i. Free slots go to
+    the task with the fewest live episodes relative to its weight in `task_weights`.
+    Episodes do not wait for each other: every env call runs in a worker thread, and
+    for an `Agent` all episodes waiting for their next turn are generated in one
+    batched call while the other envs keep stepping.
+    """
+
+    def __init__(
+        self,
+        tasks: Sequence[BaseTask],
+        max_concurrency: Optional[int] = None,
+        task_concurrency: Optional[Sequence[int] | Mapping[int, int]] = None,
+        task_weights: Optional[Sequence[float] | Mapping[int, float]] = None,
+    ) -> None:
+        self.tasks = tasks
+        caps = [task.pool.max_clients for task in tasks]
+        if task_concurrency is not None:
+            if not isinstance(task_concurrency, Mapping):
+                task_concurrency = dict(enumerate(task_concurrency))
+            for i, cap in task_concurrency.items():
+                caps[i] = min(caps[i], cap)
+        if any(cap < 1 for cap in caps):
+            raise ValueError("Every task needs a concurrency of at least 1.")
+        self.task_concurrency = caps
+        self.max_concurrency = max_concurrency or sum(caps)
+        weights = [1.0] * len(tasks)
+        if task_weights is not None:
+            if not isinstance(task_weights, Mapping):
+                task_weights = dict(enumerate(task_weights))
+            for i, weight in task_weights.items():
+                weights[i] = weight
+        self.task_weights = weights
+
+    def generate_experience(
+        self,
+        agent: Agent | APIAgent,
+        idxs: Sequence[Sequence[int]],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[TaskExperienceOutput]:
+        """
+        Roll out `idxs[i]` on `self.tasks[i]` for every task. Returns the experiences
+        in the order of `idxs`, task by task.
+        """
+        if not isinstance(agent, (Agent, APIAgent)):
+            raise NotImplementedError
+        tasks = self.tasks
+        if len(idxs) != len(tasks):
+            raise ValueError(
+                f"Got item indices for {len(idxs)} tasks, but the scheduler has {len(tasks)} tasks."
+            )
+        offsets = [0]
+        for task_idxs in idxs:
+            offsets.append(offsets[-1] + len(task_idxs))
+        pending = [deque(enumerate(task_idxs)) for task_idxs in idxs]
+        live = [0] * len(tasks)
+        result: list[Optional[TaskExperienceOutput]] = [None] * offsets[-1]
+
+        # each in-flight future maps to (task index, kind, episode)
+        inflight: dict[Future, tuple[int, str, Optional[EpisodeState]]] = {}
+        # episodes waiting for their next agent turn
+        ready: list[tuple[int, EpisodeState]] = []
+        profilers = {
+            id(task.profiler): task.profiler for task in tasks if task.profiler is not None
+        }.values()
+
+        def retire(t: int, episode: EpisodeState) -> None:
+            task = tasks[t]
+            result[offsets[t] + episode.position] = TaskExperienceOutput(
+                task_index=t,
+                env_name=task.env_name,
+                idx=episode.idx,
+                experience=task._finish_episode(agent, episode),
+            )
+            task.pool.release(episode.client)
+            live[t] -= 1
+
+        def next_task() -> Optional[int]:
+            candidates = [
+                t
+                for t in range(len(tasks))
+                if pending[t] and live[t] < self.task_concurrency[t]
+            ]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda t: live[t] / self.task_weights[t])
+
+        def queue_for_generation(t: int, episode: EpisodeState) -> None:
+            if tasks[t]._exceeds_max_length(episode, generation_config):
+                retire(t, episode)
+            elif isinstance(agent, APIAgent):
+                future = executor.submit(agent.generate, episode.conversation, episode.stop)
+                inflight[future] = (t, "generate", episode)
+            else:
+                ready.append((t, episode))
+
+        def submit_step(t: int, episode: EpisodeState, generated) -> None:
+            action = tasks[t]._add_generation(agent, episode, generated)
+            future = executor.submit(tasks[t]._step, episode, action)
+            inflight[future] = (t, "step", episode)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while any(pending) or inflight or ready:
+                while sum(live) < self.max_concurrency and (t := next_task()) is not None:
+                    position, idx = pending[t].popleft()
+                    live[t] += 1
+                    future = executor.submit(
+                        tasks[t]._open_episode, agent, idx, position
+                    )
+                    inflight[future] = (t, "start", None)
+
+                if ready:
+                    batch, ready = ready, []
+                    episodes = [episode for _, episode in batch]
+                    with ExitStack() as stack:
+                        for profiler in profilers:
+                            stack.enter_context(
+                                profiler.span(
+                                    "generate", "multi-task", lane="engine", n=len(episodes)
+                                )
+                            )
+                        generated = tasks[0]._generate_round(
+                            agent, episodes, generation_config, executor
+                        )
+                    for (t, episode), output in zip(batch, generated):
+                        if output is None:
+                            retire(t, episode)  # generate raised
+                        else:
+                            submit_step(t, episode, output)
+                    # collect the envs that finished meanwhile without blocking
+                    done, _ = wait(list(inflight), timeout=0)
+                elif inflight:
+                    done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                else:
+                    continue
+
+                stepped: list[tuple[int, EpisodeState, object]] = []
+                for future in done:
+                    t, kind, episode = inflight.pop(future)
+                    if kind == "start":
+                        queue_for_generation(t, future.result())
+                    elif kind == "generate":
+                        submit_step(t, episode, future.result())
+                    elif future.result() is None:
+                        retire(t, episode)  # the step timed out
+                    else:
+                        stepped.append((t, episode, future.result()))
+
+                if stepped:
+                    env_messages_tokenized = BaseTask._tokenize_observations(
+                        agent, [step_output for _, _, step_output in stepped]
+                    )
+                    for (t, episode, step_output), env_message_tokenized in zip(
+                        stepped, env_messages_tokenized
+                    ):
+                        tasks[t]._add_observation(
+                            agent, episode, step_output, max_rounds, env_message_tokenized
+                        )
+                        if episode.done:
+                            retire(t, episode)
+                        else:
+                            queue_for_generation(t, episode)
+
+        return result
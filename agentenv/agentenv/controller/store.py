@@ -0,0 +1,176 @@
+"""
+A trajectory file that stores each distinct conversation prefix once. The messages of
+all trajectories form a trie: a message is a node keyed by a hash of itself and its
+parent, so the `conversation_start` prompts shared by every trajectory of a task, and
+the opening turns shared by rollouts of the same idx, are written a single time.
+
+    with TrajectoryStore("inference.trie.jsonl") as store:
+        store.add(exp.conversation, item_id="webshop_3", reward=exp.reward)
+
+    for row in iter_trajectories("inference.trie.jsonl"):
+        row["conversations"], row["item_id"], row["reward"]
+
+The file is JSON lines, append-only and read in one pass: a header, then node records
+`{"id", "parent", "message"}` and trajectory records `{"leaf", ...}`, each node written
+before the first trajectory that ends in or below it. Records are told apart by the
+reserved "leaf" key, which trajectory records write first, so trajectory data may have
+an "id" of its own. `iter_trajectories` reads plain JSON lines files of
+`{"conversations", ...}` rows as well.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Iterator, Optional, Sequence
+
+HEADER = {"format": "agentenv-trajectory-trie", "version": 1}
+
+
+def _node_id(parent: Optional[str], message: Any) -> str:
+    data = json.dumps(message, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update((parent or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TrajectoryStore:
+    def __init__(self, path: str) -> None:
+        """
+        Open the store at `path` for appending, creating it if needed.
+
+        Args:
+            path (str): The store file. Existing trajectories in it are kept, and their messages are shared with the new ones.
+        """
+        self.path = path
+        self._nodes: set[str] = set()
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, "r", encoding="utf-8") as f:
+                line = f.readline()
+                if json.loads(line) != HEADER:
+                    raise ValueError(f"{path} is not a trajectory store.")
+                for line in f:
+                    # node records are written with "id" first, trajectory records with
+                    # "leaf"; a partly written last line (from a crash) is left to the
+                    # reader to skip
+                    if line.startswith('{"id"') and line.endswith("\n"):
+                        self._nodes.add(json.loads(line)["id"])
+                complete = line.endswith("\n")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        if not exists:
+            self._write(HEADER)
+        elif not complete:
+            self._file.write("\n")
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add(self, conversation: Sequence[Any], **data: Any) -> Optional[str]:
+        """
+        Append a trajectory. `data` (e.g. item_id, reward) is stored alongside and
+        returned with the conversation by `iter_trajectories`. Returns the id of the
+        node of the last message.
+        """
+        if "conversations" in data or "leaf" in data:
+            raise ValueError("'conversations' and 'leaf' are reserved keys.")
+        parent = None
+        for message in conversation:
+            node = _node_id(parent, message)
+            if node not in self._nodes:
+                self._nodes.add(node)
+                self._write({"id": node, "parent": parent, "message": message})
+            parent = node
+        self._write({"leaf": parent, **data})
+        return parent
+
+    def write(self, row: dict[str, Any], experience: Any = None) -> None:
+        """
+        Append a `{"conversations": [...], **data}` row, as written to JSON lines files.
+        `experience` is accepted for symmetry with `ArrowExperienceWriter.write`; the
+        store keeps no token ids.
+        """
+        row = dict(row)
+        self.add(row.pop("conversations"), **row)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "TrajectoryStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        self.flush()
+        return iter_trajectories(self.path)
+
+
+def iter_trajectories(path: str, skip_invalid: bool = False) -> Iterator[dict[str, Any]]:
+    """
+    Stream the trajectories of a store, or of a plain JSON lines file, as
+    `{"conversations": [...], **data}` rows.
+
+    Rows of a store share message objects with each other, which is what keeps a loaded
+    corpus small; copy a message before modifying it.
+
+    Args:
+        path (str): The file to read.
+        skip_invalid (bool, optional): Skip lines that are not valid JSON, e.g. a partly written last line, and trajectories whose messages are missing. Defaults to False.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+        if not first:
+            return
+        try:
+            header = json.loads(first)
+        except json.JSONDecodeError:
+            if not skip_invalid:
+                raise
+            header = None
+        if header != HEADER:
+            if header is not None:
+                yield header
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    if not skip_invalid:
+                        raise
+            return
+
+        # node id -> (parent id, message)
+        nodes: dict[str, tuple[Optional[str], Any]] = {}
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if not skip_invalid:
+                    raise
+                continue
+            if "leaf" not in record:
+                nodes[record["id"]] = (record["parent"], record["message"])
+                continue
+            node = record.pop("leaf")
+            conversation = []
+            try:
+                while node is not None:
+                    node, message = nodes[node]
+                    conversation.append(message)
+            except KeyError:
+                if not skip_invalid:
+                    raise
+                continue
+            conversation.reverse()
+            yield {"conversations": conversation, **record}
@@ -1,14 +1,100 @@
+import asyncio
+import contextvars
+import copy
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field, replace
 from typing import Any, Callable, Mapping, Optional, Sequence
 
+from requests import RequestException
 from transformers import GenerationConfig
 
-from . import Agent, APIAgent, BaseEnvClient
-from .types import ConversationMessage, APIConversationMessage, ExperienceOutput, APIExperienceOutput
+from . import Agent, APIAgent, AsyncAPIAgent, AsyncBaseEnvClient, BaseEnvClient
+from .agent import TokenizedConversationBuffer, tokenization_cache
+from .pool import EnvClientPool
+from .profiler import RolloutProfiler
+from .transport import CircuitOpenError
+from .vector import coalesce_requests, run_coalesced
+from .types import (
+    ActionFormat,
+    ConversationMessage,
+    APIConversationMessage,
+    ExperienceOutput,
+    APIExperienceOutput,
+    StepOutput,
+    TokenizedConversationOutput,
+)
+
+
+@dataclass
+class EpisodeState:
+    """
+    The state of one in-flight episode: the client it runs on, the conversation so far
+    and, for local agents, its tokenized form.
+    """
+
+    client: BaseEnvClient
+    idx: int
+    conversation: list
+    conversation_tokenized: Optional[TokenizedConversationBuffer] = None
+    reward: float = 0.0
+    done: bool = False
+    rounds: int = 0
+    # the actions taken so far, replayed on a new env if the current one dies
+    actions: list[str] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic, compare=False)
+    # set when a step ran into the step timeout or the episode deadline
+    timed_out: bool = False
+    # position of the episode in the ``idxs`` passed to ``generate_experience``
+    position: int = field(default=0, compare=False)
+    # where generation of the agent turns stops, from the adapter of the client
+    stop: tuple[str, ...] = ()
+
+
+@dataclass
+class EnvRetryState:
+    """
+    The retries of one env call: attempts used so far and since when the circuit breaker
+    of the env server has kept it from being sent.
+    """
+
+    attempt: int = 0
+    circuit_open_since: Optional[float] = None
 
 
 class BaseTask:
     env_client_cls: Callable
     env_name: str
+    # async counterpart of env_client_cls, used by agenerate_experience
+    async_env_client_cls: Optional[Callable] = None
+    # set to a RolloutProfiler to record the phases of every episode
+    profiler: Optional[RolloutProfiler] = None
+    # errors after which an env is considered dead and recreated
+    env_errors: tuple[type[Exception], ...] = (RequestException,)
+    # attempts to recreate a dead env before an episode fails
+    max_env_retries: int = 3
+    # seconds an env call waits for the open circuit breaker of its env server before it
+    # fails; by default long enough for three half-open trials of the default breaker
+    circuit_open_timeout: float = 90.0
+    # wall-clock seconds an env step may take, independent of the HTTP timeout of the client
+    step_timeout: Optional[float] = None
+    # wall-clock seconds after which an episode ends, whatever its number of rounds
+    episode_timeout: Optional[float] = None
+    # run a duplicate of a step lagging behind `speculation_factor` times the median
+    # step on another client, replaying the episode there, and keep the first to finish;
+    # the client of the other one is closed, so the pool may briefly exceed `n_clients`
+    speculative_steps: bool = False
+    speculation_factor: float = 3.0
+    # send the resets and steps of a round of concurrent episodes to the env server in
+    # one batch request (see `vector`); servers without batch endpoints get single requests
+    batch_env_requests: bool = False
+    # stop generating at the `stop_sequences` of the adapter of the env client, once the
+    # action of a turn is complete
+    use_stop_sequences: bool = True
 
     def __init__(
         self,
@@ -20,133 +106,597 @@ class BaseTask:
 
         Args:
             client_args (Mapping[str, Any]): A mapping of client arguments.
-            n_clients (int, optional): The number of clients. Defaults to 1. Larger than 1 for batch generation. Batch generation is not implemented yet.
+            n_clients (int, optional): The maximum number of clients. Defaults to 1. Larger than 1 for batch generation: up to `n_clients` episodes are then rolled out concurrently, with one batched `Agent.generate` call per round. Clients are created on first use.
         """
         if self.env_client_cls is None or self.env_name is None:
             raise NotImplementedError
-        self.clients = [self.env_client_cls(**client_args) for _ in range(n_clients)]
-        self.len = len(self.clients[0])
+        self.client_args = client_args
+        self.pool = EnvClientPool(self._create_client, n_clients)
+        if "data_len" in client_args:
+            self.len = client_args["data_len"]
+        else:
+            client = self.pool.acquire()
+            self.len = len(client)
+            self.pool.release(client)
+        self.async_clients: list[AsyncBaseEnvClient] = []
+        # durations of recent steps, to tell lagging steps apart
+        self._step_times: deque[float] = deque(maxlen=256)
 
-    def _generate_experience_one(
+    def _create_client(self) -> BaseEnvClient:
+        client = self.env_client_cls(**self.client_args)
+        if self.batch_env_requests:
+            coalesce_requests(client)
+        return client
+
+    def _stop_sequences(self, client: BaseEnvClient | AsyncBaseEnvClient) -> tuple[str, ...]:
+        adapter_cls = getattr(client, "adapter_cls", None)
+        if not self.use_stop_sequences or adapter_cls is None:
+            return ()
+        action_format = ActionFormat(getattr(client, "action_format", ActionFormat.REACT))
+        return tuple(adapter_cls.stop_sequences.get(action_format, ()))
+
+    @property
+    def clients(self) -> list[BaseEnvClient]:
+        """
+        The clients created so far.
+        """
+        return self.pool.clients
+
+    def close(self) -> None:
+        """
+        Close the envs of all clients on the env server.
+        """
+        self.pool.close()
+
+    def __enter__(self) -> "BaseTask":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _env_failed(self, error: Exception, idx: int, retry: EnvRetryState) -> None:
+        """
+        Raise `error` once the retries are used up, else wait before the next attempt.
+        While the circuit breaker of the env server is open, the call is retried as is
+        without using up an attempt, for up to `circuit_open_timeout` seconds.
+        """
+        if isinstance(error, CircuitOpenError):
+            now = time.monotonic()
+            if retry.circuit_open_since is None:
+                retry.circuit_open_since = now
+            if now - retry.circuit_open_since >= self.circuit_open_timeout:
+                raise error
+            time.sleep(1)
+            return
+        retry.attempt += 1
+        if retry.attempt > self.max_env_retries:
+            raise error
+        print(f"{self.env_name} env failed on idx {idx}, recreating it: {error}")
+        time.sleep(min(2 ** (retry.attempt - 1), 30))
+
+    def _span(
+        self,
+        phase: str,
+        client: Any = None,
+        idx: Optional[int] = None,
+        round: Optional[int] = None,
+        lane: Any = None,
+        **args,
+    ):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.span(
+            phase, self.env_name, idx, round, lane if lane is not None else id(client), **args
+        )
+
+    def _client_step(self, episode: EpisodeState, action: str) -> StepOutput:
+        if self.profiler is None:
+            return episode.client.step(action)
+        with self.profiler.step(
+            self.env_name, episode.idx, episode.rounds, id(episode.client)
+        ):
+            return episode.client.step(action)
+
+    def _step_with_recovery(
+        self, episode: EpisodeState, action: str, restore: bool = False
+    ) -> StepOutput:
+        """
+        Step the env of `episode`. If the env died, it is recreated, reset and brought
+        back to the current state by replaying the actions of the episode. With
+        `restore`, the env is brought to the current state before the first attempt too.
+        """
+        retry = EnvRetryState()
+        while True:
+            try:
+                if retry.attempt:
+                    episode.client = self.pool.replace(episode.client)
+                if retry.attempt or restore:
+                    with self._span("recover", episode.client, episode.idx, episode.rounds):
+                        episode.client.reset(episode.idx)
+                        for previous_action in episode.actions:
+                            episode.client.step(previous_action)
+                step_output = self._client_step(episode, action)
+                break
+            except self.env_errors as e:
+                self._env_failed(e, episode.idx, retry)
+        episode.actions.append(action)
+        return step_output
+
+    def _step(self, episode: EpisodeState, action: str) -> Optional[StepOutput]:
+        """
+        Step the env of `episode` within `step_timeout` and the episode deadline, if set.
+        Returns None when the step timed out; the episode is then over.
+        """
+        if (
+            self.step_timeout is None
+            and self.episode_timeout is None
+            and not self.speculative_steps
+        ):
+            return self._step_with_recovery(episode, action)
+
+        start = time.monotonic()
+        deadline = math.inf
+        if self.step_timeout is not None:
+            deadline = start + self.step_timeout
+        if self.episode_timeout is not None:
+            deadline = min(deadline, episode.started + self.episode_timeout)
+        speculate_at = math.inf
+        if self.speculative_steps and len(self._step_times) >= 8:
+            step_times = sorted(self._step_times)
+            speculate_at = start + self.speculation_factor * step_times[len(step_times) // 2]
+
+        # every attempt runs on its own copy of the episode, the winner's is kept
+        attempts: dict[Future, EpisodeState] = {}
+        attempt = replace(episode, actions=list(episode.actions))
+        attempts[_run_in_thread(self._step_with_recovery, attempt, action)] = attempt
+        error = None
+        while attempts:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now >= speculate_at:
+                speculate_at = math.inf
+                try:
+                    client = self.pool.acquire(overflow=True)
+                except self.env_errors as e:
+                    print(f"Failed to create a client for a duplicate step: {e}")
+                else:
+                    attempt = replace(episode, client=client, actions=list(episode.actions))
+                    future = _run_in_thread(self._step_with_recovery, attempt, action, True)
+                    attempts[future] = attempt
+            timeout = min(deadline, speculate_at) - now
+            done, _ = wait(
+                list(attempts),
+                timeout=timeout if timeout != math.inf else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                attempt = attempts.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    self.pool.discard(attempt.client)
+                    continue
+                for other_future, other in attempts.items():
+                    self._abandon(other, other_future)
+                episode.client, episode.actions = attempt.client, attempt.actions
+                self._step_times.append(time.monotonic() - start)
+                return future.result()
+
+        if not attempts:
+            raise error
+        for future, attempt in attempts.items():
+            self._abandon(attempt, future)
+        print(f"{self.env_name} step on idx {episode.idx} timed out, ending the episode.")
+        episode.timed_out = True
+        episode.done = True
+        return None
+
+    def _abandon(self, attempt: EpisodeState, future: Future) -> None:
+        """
+        Give up on a step still running: its client leaves the pool now and is closed
+        when the step returns, along with any client it switched to meanwhile.
+        """
+        client = attempt.client
+        self.pool.discard(client, future)
+        future.add_done_callback(
+            lambda _: attempt.client is not client and self.pool.discard(attempt.client)
+        )
+
+    def _open_episode(
+        self, agent: Agent | APIAgent, idx: int, position: int = 0
+    ) -> EpisodeState:
+        """
+        Start an episode on a client taken from the pool.
+        """
+        return self._start_episode(agent, self.pool.acquire(), idx, position)
+
+    def _start_episode(
         self,
         agent: Agent | APIAgent,
         client: BaseEnvClient,
         idx: int,
-        generation_config: Optional[GenerationConfig] = None,
-        max_rounds: Optional[int] = None,
-    ) -> ExperienceOutput:
-        client.reset(idx)
-        reward = 0.0
-        done = False
-        state = client.observe()
+        position: int = 0,
+    ) -> EpisodeState:
+        retry = EnvRetryState()
+        while True:
+            try:
+                if retry.attempt:
+                    client = self.pool.replace(client)
+                with self._span("reset", client, idx):
+                    client.reset(idx)
+                with self._span("observe", client, idx):
+                    state = client.observe()
+                break
+            except self.env_errors as e:
+                self._env_failed(e, idx, retry)
         if isinstance(agent, Agent):
-            tokenizer = agent.tokenizer
             conversation = list(client.conversation_start)
-            conversation.append(
-                ConversationMessage({"from": "human", "loss": None, "value": state})
-            )
-            conversation_tokenized = agent.chat_template.tokenize_conversation(
-                conversation, tokenizer, add_generation_prompt=True
+            env_message = ConversationMessage(
+                {"from": "human", "loss": None, "value": state}
             )
+            conversation.append(env_message)
+            with self._span("tokenize", client, idx, 0):
+                # the start messages are tokenized once per client and reused
+                conversation_tokenized = tokenization_cache.conversation_start(
+                    agent.chat_template, agent.tokenizer, client.conversation_start
+                )
+                conversation_tokenized.extend(
+                    agent.chat_template.tokenize_conversation_one(
+                        env_message,
+                        agent.tokenizer,
+                        idx=len(client.conversation_start),
+                        add_generation_prompt=True,
+                    )
+                )
         elif isinstance(agent, APIAgent):
-            conversation = [APIConversationMessage({"role": "user", "content": client.conversation_start[0]["value"], "reasoning_content": None}),
-                            APIConversationMessage({"role": "assistant", "content": client.conversation_start[1]["value"], "reasoning_content": None}),
-                            APIConversationMessage({"role": "user", "content": state, "reasoning_content": None})]
+            conversation = self._api_conversation_start(client, state)
+            conversation_tokenized = None
         else:
             raise NotImplementedError
-        rounds = 0
-
-        while not done:
-            if isinstance(agent, Agent):
-                input_length = len(conversation_tokenized["input_ids"])
-                # if input_length exceeds max_length, break
-                if input_length >= (generation_config.max_length or 4096):
-                    break
-                try:
-                    generated_tokens = agent.generate(
-                        [conversation_tokenized["input_ids"]], generation_config
-                    )[0]
-                except Exception as e:  # pylint: disable=W0718:broad-exception-caught
-                    print(e)
-                    break  # break if generate method raises exceptions
+        return EpisodeState(
+            client=client,
+            idx=idx,
+            conversation=conversation,
+            conversation_tokenized=conversation_tokenized,
+            position=position,
+            stop=self._stop_sequences(client),
+        )
+
+    @staticmethod
+    def _api_conversation_start(
+        client: BaseEnvClient | AsyncBaseEnvClient, state: str
+    ) -> list[APIConversationMessage]:
+        return [APIConversationMessage({"role": "user", "content": client.conversation_start[0]["value"], "reasoning_content": None}),
+                APIConversationMessage({"role": "assistant", "content": client.conversation_start[1]["value"], "reasoning_content": None}),
+                APIConversationMessage({"role": "user", "content": state, "reasoning_content": None})]
+
+    @staticmethod
+    def _generation_config(
+        agent: Agent, episode: EpisodeState, generation_config: Optional[GenerationConfig]
+    ) -> Optional[GenerationConfig]:
+        """
+        `generation_config` (or the default config of the model) with the stop sequences
+        of `episode`, unless it sets `stop_strings` itself.
+        """
+        if not episode.stop:
+            return generation_config
+        if generation_config is None:
+            generation_config = getattr(agent.model, "module", agent.model).generation_config
+        if generation_config.stop_strings:
+            return generation_config
+        generation_config = copy.copy(generation_config)
+        generation_config.stop_strings = list(episode.stop)
+        return generation_config
+
+    @staticmethod
+    def _exceeds_max_length(
+        episode: EpisodeState, generation_config: Optional[GenerationConfig]
+    ) -> bool:
+        if episode.conversation_tokenized is None:
+            return False
+        input_length = len(episode.conversation_tokenized)
+        max_length = generation_config.max_length if generation_config else None
+        return input_length >= (max_length or 4096)
 
-                if generated_tokens[-1] != tokenizer.eos_token_id:
-                    generated_tokens += [tokenizer.eos_token_id]
+    def _add_generation(
+        self,
+        agent: Agent | APIAgent,
+        episode: EpisodeState,
+        generated: list[int] | tuple[str, str | None],
+    ) -> str:
+        """
+        Append the agent output of this round to the episode and return its text.
+        `generated` is the token ids produced by an `Agent` or the (content, reasoning)
+        pair produced by an `APIAgent`.
+        """
+        if isinstance(agent, Agent):
+            tokenizer = agent.tokenizer
+            generated_tokens = list(generated)
+            if generated_tokens and generated_tokens[-1] == tokenizer.eos_token_id:
+                generated_tokens.pop()
+            # local engines keep the stop sequence in their output; the turn is trained
+            # on, so it ends where the adapter cuts the action instead
+            generated_tokens = _cut_at_stop(tokenizer, generated_tokens, episode.stop)
+            generated_tokens += [tokenizer.eos_token_id]
 
+            with self._span("tokenize", episode.client, episode.idx, episode.rounds):
                 generated_text = tokenizer.decode(generated_tokens)
-                conversation_tokenized["text"] += f" {generated_text}"
-                conversation_tokenized["input_ids"] += generated_tokens
-                conversation_tokenized["action_mask"] += [1] * len(generated_tokens)
-
-                generated_text = generated_text[
-                    : -len(tokenizer.eos_token)
-                ]  # not endswith eos_token
-                conversation.append(
-                    ConversationMessage(
-                        {"from": "gpt", "loss": True, "value": generated_text}
-                    )
-                )
-            elif isinstance(agent, APIAgent):
-                generated_text, generated_reasoning_text = agent.generate(conversation)
-                conversation.append(
-                    APIConversationMessage(
-                        {"role": "assistant", "content": generated_text, "reasoning_content": generated_reasoning_text}
-                    )
-                )
-            else:
-                raise NotImplementedError
-
-            step_output = client.step(generated_text)
-            state, reward, done = (
-                step_output.state,
-                step_output.reward,
-                step_output.done,
+            episode.conversation_tokenized.append(
+                f" {generated_text}", generated_tokens, [1] * len(generated_tokens)
             )
 
-            if isinstance(agent, Agent):
-                env_message = ConversationMessage(
-                    {"from": "human", "loss": None, "value": state}
+            generated_text = generated_text[
+                : -len(tokenizer.eos_token)
+            ]  # not endswith eos_token
+            episode.conversation.append(
+                ConversationMessage(
+                    {"from": "gpt", "loss": True, "value": generated_text}
                 )
-                env_message_tokenized = agent.chat_template.tokenize_conversation_one(
-                    env_message, tokenizer, add_generation_prompt=True
+            )
+        elif isinstance(agent, APIAgent):
+            generated_text, generated_reasoning_text = generated
+            episode.conversation.append(
+                APIConversationMessage(
+                    {"role": "assistant", "content": generated_text, "reasoning_content": generated_reasoning_text}
                 )
+            )
+        else:
+            raise NotImplementedError
+        return generated_text
+
+    def _add_observation(
+        self,
+        agent: Agent | APIAgent,
+        episode: EpisodeState,
+        step_output: StepOutput,
+        max_rounds: Optional[int] = None,
+        env_message_tokenized: Optional[TokenizedConversationOutput] = None,
+    ) -> None:
+        """
+        Append the env response to `step_output` to the episode. `env_message_tokenized`
+        may be passed when the message was already tokenized, e.g. in a batch.
+        """
+        state, episode.reward, episode.done = (
+            step_output.state,
+            step_output.reward,
+            step_output.done,
+        )
 
-                conversation.append(env_message)
-                conversation_tokenized["text"] += env_message_tokenized["text"]
-                conversation_tokenized["input_ids"] += env_message_tokenized["input_ids"]
-                conversation_tokenized["action_mask"] += env_message_tokenized[
-                    "action_mask"
-                ]
-            elif isinstance(agent, APIAgent):
-                conversation.append(
-                    APIConversationMessage(
-                        {"role": "user", "content": state, "reasoning_content": None}
+        if isinstance(agent, Agent):
+            env_message = ConversationMessage(
+                {"from": "human", "loss": None, "value": state}
+            )
+            if env_message_tokenized is None:
+                with self._span("tokenize", episode.client, episode.idx, episode.rounds):
+                    env_message_tokenized = agent.chat_template.tokenize_conversation_one(
+                        env_message, agent.tokenizer, add_generation_prompt=True
                     )
+            episode.conversation.append(env_message)
+            episode.conversation_tokenized.extend(env_message_tokenized)
+        elif isinstance(agent, APIAgent):
+            episode.conversation.append(
+                APIConversationMessage(
+                    {"role": "user", "content": state, "reasoning_content": None}
                 )
-            else:
-                raise NotImplementedError
+            )
+        else:
+            raise NotImplementedError
 
-            rounds += 1
-            if max_rounds is not None and rounds >= max_rounds:
-                break
+        episode.rounds += 1
+        if max_rounds is not None and episode.rounds >= max_rounds:
+            episode.done = True
+        if (
+            self.episode_timeout is not None
+            and time.monotonic() - episode.started >= self.episode_timeout
+        ):
+            episode.timed_out = episode.done = True
 
+    def _finish_episode(
+        self, agent: Agent | APIAgent, episode: EpisodeState
+    ) -> ExperienceOutput | APIExperienceOutput:
         if isinstance(agent, Agent):
+            conversation_tokenized = episode.conversation_tokenized
             return ExperienceOutput(
-                conversation=conversation,
-                reward=reward,
-                text=conversation_tokenized["text"],
-                seq_ids=conversation_tokenized["input_ids"],
-                attention_mask=[1] * len(conversation_tokenized["input_ids"]),
-                action_mask=conversation_tokenized["action_mask"],
+                conversation=episode.conversation,
+                reward=episode.reward,
+                text=conversation_tokenized.text,
+                seq_ids=conversation_tokenized.input_ids.tolist(),
+                attention_mask=[1] * len(conversation_tokenized),
+                action_mask=conversation_tokenized.action_mask.tolist(),
             )
         elif isinstance(agent, APIAgent):
             return APIExperienceOutput(
-                conversation=conversation,
-                reward=reward,
+                conversation=episode.conversation,
+                reward=episode.reward,
             )
         else:
             raise NotImplementedError
 
+    def _generate_experience_one(
+        self,
+        agent: Agent | APIAgent,
+        idx: int,
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> ExperienceOutput:
+        episode = self._open_episode(agent, idx)
+        try:
+            while not episode.done:
+                if isinstance(agent, Agent):
+                    # if input_length exceeds max_length, break
+                    if self._exceeds_max_length(episode, generation_config):
+                        break
+                    try:
+                        with self._span("generate", episode.client, idx, episode.rounds):
+                            generated = agent.generate(
+                                [episode.conversation_tokenized.input_ids.tolist()],
+                                self._generation_config(agent, episode, generation_config),
+                            )[0]
+                    except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                        print(e)
+                        break  # break if generate method raises exceptions
+                elif isinstance(agent, APIAgent):
+                    with self._span("generate", episode.client, idx, episode.rounds):
+                        generated = agent.generate(episode.conversation, episode.stop)
+                else:
+                    raise NotImplementedError
+
+                generated_text = self._add_generation(agent, episode, generated)
+                step_output = self._step(episode, generated_text)
+                if step_output is None:
+                    break  # timed out
+                self._add_observation(agent, episode, step_output, max_rounds)
+        finally:
+            self.pool.release(episode.client)
+
+        return self._finish_episode(agent, episode)
+
+    def _generate_round(
+        self,
+        agent: Agent | APIAgent,
+        episodes: Sequence[EpisodeState],
+        generation_config: Optional[GenerationConfig],
+        executor: ThreadPoolExecutor,
+    ) -> list:
+        """
+        Generate the next agent turn for every episode in `episodes`.
+        Returns one entry per episode, `None` where generation failed.
+        """
+        if isinstance(agent, APIAgent):
+            return list(
+                executor.map(lambda ep: agent.generate(ep.conversation, ep.stop), episodes)
+            )
+        if not isinstance(agent, Agent):
+            raise NotImplementedError
+
+        prompts = [ep.conversation_tokenized.input_ids.tolist() for ep in episodes]
+        generation_configs = [
+            self._generation_config(agent, ep, generation_config) for ep in episodes
+        ]
+        try:
+            return agent.generate_batch(prompts, generation_configs)
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            print(e)  # fall back to one call per prompt to isolate the failure
+
+        generated = []
+        for prompt, config in zip(prompts, generation_configs):
+            try:
+                generated.append(agent.generate([prompt], config)[0])
+            except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                print(e)
+                generated.append(None)
+        return generated
+
+    @staticmethod
+    def _tokenize_observations(
+        agent: Agent | APIAgent, step_outputs: Sequence[StepOutput]
+    ) -> list[Optional[TokenizedConversationOutput]]:
+        """
+        Tokenize the env messages of a round with one tokenizer call.
+        """
+        if not isinstance(agent, Agent):
+            return [None] * len(step_outputs)
+        env_messages = [
+            ConversationMessage({"from": "human", "loss": None, "value": s.state})
+            for s in step_outputs
+        ]
+        return agent.chat_template.tokenize_conversation_batch(
+            env_messages, agent.tokenizer, add_generation_prompt=True
+        )
+
+    def _generate_experience_concurrent(
+        self,
+        agent: Agent | APIAgent,
+        idxs: Sequence[int],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[ExperienceOutput]:
+        """
+        Roll out `idxs` in lockstep over all clients. Each round, the prompts of all
+        live episodes go to the agent in one call, then the envs are stepped in parallel.
+        A client is handed the next pending idx as soon as its episode finishes.
+        """
+        pending = deque(enumerate(idxs))
+        n_live = 0
+        live: list[EpisodeState] = []
+        result = [None] * len(idxs)
+
+        def retire(episode: EpisodeState) -> None:
+            nonlocal n_live
+            result[episode.position] = self._finish_episode(agent, episode)
+            self.pool.release(episode.client)
+            n_live -= 1
+
+        with ThreadPoolExecutor(max_workers=self.pool.max_clients) as executor:
+            while pending or live:
+                admitted = []
+                while pending and n_live < self.pool.max_clients:
+                    position, idx = pending.popleft()
+                    admitted.append((idx, position))
+                    n_live += 1
+                # new clients are created in the worker threads, in parallel
+                live += self._map_envs(
+                    executor, lambda *args: self._open_episode(agent, *args), admitted
+                )
+
+                ready = []
+                for episode in live:
+                    if self._exceeds_max_length(episode, generation_config):
+                        retire(episode)
+                    else:
+                        ready.append(episode)
+
+                with self._span("generate", lane="engine", n=len(ready)):
+                    generated = self._generate_round(
+                        agent, ready, generation_config, executor
+                    )
+                stepping = []
+                for episode, output in zip(ready, generated):
+                    if output is None:
+                        retire(episode)  # generate raised, as in the sequential path
+                    else:
+                        stepping.append(
+                            (episode, self._add_generation(agent, episode, output))
+                        )
+
+                stepped = []
+                for (episode, _), step_output in zip(
+                    stepping, self._map_envs(executor, self._step, stepping)
+                ):
+                    if step_output is None:
+                        retire(episode)  # timed out
+                    else:
+                        stepped.append((episode, step_output))
+                step_outputs = [step_output for _, step_output in stepped]
+                with self._span("tokenize", lane="controller", n=len(step_outputs)):
+                    env_messages_tokenized = self._tokenize_observations(
+                        agent, step_outputs
+                    )
+                live = []
+                for (episode, step_output), env_message_tokenized in zip(
+                    stepped, env_messages_tokenized
+                ):
+                    self._add_observation(
+                        agent, episode, step_output, max_rounds, env_message_tokenized
+                    )
+                    if episode.done:
+                        retire(episode)
+                    else:
+                        live.append(episode)
+
+        return result
+
+    def _map_envs(
+        self, executor: ThreadPoolExecutor, fn: Callable, args: Sequence[tuple]
+    ) -> list[Any]:
+        """
+        `fn(*a)` for every `a` of `args`, run on `executor`. With `batch_env_requests`,
+        the env requests of the calls are batched.
+        """
+        if not self.batch_env_requests:
+            return list(executor.map(lambda call_args: fn(*call_args), args))
+        return [future.result() for future in run_coalesced(executor, fn, args)]
+
     def _generate_experience_batch(
         self,
         agent: Agent | APIAgent,
@@ -154,11 +704,17 @@ class BaseTask:
         generation_config: Optional[GenerationConfig] = None,
         max_rounds: Optional[int] = None,
     ) -> list[ExperienceOutput]:
-        client = self.clients[0]
+        if self.pool.max_clients > 1 and len(idxs) > 1:
+            return self._generate_experience_concurrent(
+                agent=agent,
+                idxs=idxs,
+                generation_config=generation_config,
+                max_rounds=max_rounds,
+            )
+
         result = [
             self._generate_experience_one(
                 agent=agent,
-                client=client,
                 idx=idx,
                 generation_config=generation_config,
                 max_rounds=max_rounds,
@@ -167,6 +723,99 @@ class BaseTask:
         ]
         return result
 
+    async def _astep(self, episode: EpisodeState, action: str) -> StepOutput:
+        if self.profiler is None:
+            return await episode.client.step(action)
+        with self.profiler.step(
+            self.env_name, episode.idx, episode.rounds, id(episode.client)
+        ):
+            return await episode.client.step(action)
+
+    async def _agenerate_experience_one(
+        self,
+        agent: AsyncAPIAgent,
+        client: AsyncBaseEnvClient,
+        idx: int,
+        max_rounds: Optional[int] = None,
+    ) -> APIExperienceOutput:
+        with self._span("reset", client, idx):
+            await client.reset(idx)
+        with self._span("observe", client, idx):
+            state = await client.observe()
+        episode = EpisodeState(
+            client=client,
+            idx=idx,
+            conversation=self._api_conversation_start(client, state),
+            stop=self._stop_sequences(client),
+        )
+
+        while not episode.done:
+            try:
+                with self._span("generate", client, idx, episode.rounds):
+                    generated = await agent.agenerate(episode.conversation, episode.stop)
+            except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                print(e)
+                break  # retries are exhausted or the request is invalid
+            generated_text = self._add_generation(agent, episode, generated)
+            timeout = self.step_timeout
+            if self.episode_timeout is not None:
+                remaining = episode.started + self.episode_timeout - time.monotonic()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                step_output = await asyncio.wait_for(
+                    self._astep(episode, generated_text), timeout
+                )
+            except asyncio.TimeoutError:
+                print(f"{self.env_name} step on idx {idx} timed out, ending the episode.")
+                episode.timed_out = True
+                break
+            self._add_observation(agent, episode, step_output, max_rounds)
+
+        return self._finish_episode(agent, episode)
+
+    async def agenerate_experience(
+        self,
+        agent: AsyncAPIAgent,
+        idxs: Sequence[int] | int,
+        max_rounds: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ) -> list[APIExperienceOutput]:
+        """
+        Roll out `idxs` concurrently in the running event loop, each episode on its own
+        async env client. Up to `concurrency` (default `agent.max_concurrency`) clients
+        are opened on the env server and kept in `self.async_clients` for later calls.
+        """
+        if self.async_env_client_cls is None:
+            raise NotImplementedError(f"{self.env_name} has no async env client.")
+        if not isinstance(agent, AsyncAPIAgent):
+            raise NotImplementedError
+        if isinstance(idxs, int):
+            idxs = [idxs]
+
+        concurrency = min(concurrency or agent.max_concurrency, len(idxs))
+        n_new = concurrency - len(self.async_clients)
+        if n_new > 0:
+            self.async_clients += await asyncio.gather(
+                *(
+                    self.async_env_client_cls.open(**self.client_args)
+                    for _ in range(n_new)
+                )
+            )
+        idle_clients = asyncio.Queue()
+        for client in self.async_clients[:concurrency]:
+            idle_clients.put_nowait(client)
+
+        async def run(idx: int) -> APIExperienceOutput:
+            client = await idle_clients.get()
+            try:
+                return await self._agenerate_experience_one(
+                    agent, client, idx, max_rounds
+                )
+            finally:
+                idle_clients.put_nowait(client)
+
+        return list(await asyncio.gather(*(run(idx) for idx in idxs)))
+
     def generate_experience(
         self,
         agent: Agent | APIAgent,
@@ -183,3 +832,51 @@ class BaseTask:
             generation_config=generation_config,
             max_rounds=max_rounds,
         )
+
+
+def _cut_at_stop(tokenizer: Any, tokens: list[int], stop: Sequence[str]) -> list[int]:
+    """
+    `tokens` up to the first of the `stop` sequences in their text. The tokens kept are
+    the generated ones, but for the last, which may also hold the start of the stop
+    sequence: its part before the stop sequence is tokenized anew.
+    """
+    if not stop or not tokens:
+        return tokens
+    text = tokenizer.decode(tokens)
+    end = min((text.find(s) for s in stop if s in text), default=-1)
+    if end == -1:
+        return tokens
+    # the longest prefix of the tokens whose text does not run past `end`
+    low, high = 0, len(tokens)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(tokenizer.decode(tokens[:middle])) <= end:
+            low = middle
+        else:
+            high = middle - 1
+    kept = tokens[:low]
+    rest = text[len(tokenizer.decode(kept)) : end]
+    if rest:
+        kept += tokenizer.encode(rest, add_special_tokens=False)
+    return kept
+
+
+def _run_in_thread(fn: Callable, *args) -> Future:
+    """
+    Run `fn(*args)` in a new daemon thread, so that a call that hangs neither holds a
+    worker of an executor nor blocks the interpreter from exiting.
+    """
+    future = Future()
+    # e.g. the request coalescer of the calling thread
+    context = contextvars.copy_context()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:  # pylint: disable=W0718:broad-exception-caught
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
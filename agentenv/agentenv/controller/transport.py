@@ -0,0 +1,388 @@
+"""
+HTTP transport shared by the env clients.
+
+There is one `EnvTransport` per env server, obtained with `get_transport`. It keeps a
+pooled keep-alive `requests.Session` (and, for async clients, one aiohttp session per
+event loop), retries transient failures with exponential backoff and jitter, stops
+calling a server that keeps failing (circuit breaker) and records per-endpoint latency.
+
+To change the defaults for a server, create its transport before the clients:
+
+    get_transport("http://127.0.0.1:36001", retry_policy=RetryPolicy(max_retries=10))
+
+Env servers that are plain Python can be called without HTTP, in this process or in a
+worker process, by naming their app instead: `inproc://agentenv_textcraft.server:app`
+or `pipe://agentenv_textcraft.server:app` (see `inproc`).
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout, ReadTimeout, RequestException, Timeout
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .profiler import mark_env_request
+
+
+class EnvServerError(RequestException):
+    """
+    The env server answered with an error status, or could not be reached after retries.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(EnvServerError):
+    """
+    The circuit breaker of the env server is open; the request was not sent.
+    """
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 5
+    backoff_base: float = 0.1
+    backoff_factor: float = 2.0
+    backoff_max: float = 10.0
+    # the delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+    jitter: float = 0.5
+    retry_statuses: tuple[int, ...] = (502, 503, 504)
+    # A read timeout or a connection lost after the request was sent may hit a request
+    # the server already executed (e.g. /step or /create), so only connect errors are
+    # retried for POST requests unless this is set.
+    retry_read_timeouts: bool = False
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.backoff_base * self.backoff_factor**attempt, self.backoff_max)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def _is_connect_error(exc: Optional[BaseException]) -> bool:
+    """
+    Whether `exc` happened before the request was sent: the connection was refused or
+    could not be opened in time.
+    """
+    if aiohttp is not None and isinstance(exc, aiohttp.ClientConnectorError):
+        return True
+    seen = set()
+    # requests wraps urllib3's MaxRetryError, whose `reason` is the connection error
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(
+            exc, (ConnectTimeout, ConnectTimeoutError, NewConnectionError, ConnectionRefusedError)
+        ):
+            return True
+        reason = getattr(exc, "reason", None)
+        if not isinstance(reason, BaseException):
+            reason = exc.args[0] if exc.args and isinstance(exc.args[0], BaseException) else None
+        exc = reason or exc.__cause__
+    return False
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open, requests fail fast
+    with `CircuitOpenError`; after `reset_timeout` seconds one trial request is let
+    through, which closes the circuit on success and re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_request(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                time.monotonic() - self._opened_at >= self.reset_timeout
+                and not self._trial_in_flight
+            ):
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError("Circuit breaker is open for this env server.")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class LatencyStats:
+    """
+    Per-endpoint request counters: count, errors, total and max latency in seconds.
+    """
+
+    def __init__(self) -> None:
+        self._stats: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, latency: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                endpoint, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += int(error)
+            stats["total"] += latency
+            stats["max"] = max(stats["max"], latency)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                endpoint: {**stats, "mean": stats["total"] / stats["count"]}
+                for endpoint, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class EnvTransport:
+    def __init__(
+        self,
+        env_server_base: str,
+        retry_policy: Optional[RetryPolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        pool_maxsize: int = 64,
+        max_async_connections: int = 512,
+    ) -> None:
+        self.env_server_base = env_server_base.rstrip("/")
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.latency = LatencyStats()
+        self.max_async_connections = max_async_connections
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_sessions: dict[asyncio.AbstractEventLoop, "aiohttp.ClientSession"] = {}
+
+    def _should_retry(self, method: str, attempt: int, status: Optional[int], exc: Optional[Exception]) -> bool:
+        policy = self.retry_policy
+        if attempt >= policy.max_retries:
+            return False
+        if status is not None:
+            return status in policy.retry_statuses
+        if method == "GET" or policy.retry_read_timeouts:
+            return True
+        return not isinstance(exc, (ReadTimeout, asyncio.TimeoutError)) and _is_connect_error(exc)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        url = f"{self.env_server_base}/{path}"
+        mark_env_request()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_request()
+            start = time.perf_counter()
+            status, exc = None, None
+            try:
+                res = self.session.request(
+                    method, url, json=json, params=params, timeout=timeout
+                )
+                status = res.status_code
+            except (RequestsConnectionError, Timeout) as e:
+                exc = e
+            except BaseException:
+                # e.g. ChunkedEncodingError; also ends a half-open trial request
+                self.circuit_breaker.record_failure()
+                raise
+            latency = time.perf_counter() - start
+
+            if exc is None and status == 200:
+                self.latency.record(path, latency)
+                self.circuit_breaker.record_success()
+                return res.json()
+
+            self.latency.record(path, latency, error=True)
+            if exc is not None or status >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()  # the server is up, the request is wrong
+            if not self._should_retry(method, attempt, status, exc):
+                if exc is not None:
+                    raise EnvServerError(f"{method} {url} failed: {exc}") from exc
+                raise EnvServerError(
+                    f"{method} {url} returned {status}: {res.text}", status_code=status
+                )
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+    def post(self, path: str, json: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("POST", path, json=json, timeout=timeout)
+
+    def get(self, path: str, params: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("GET", path, params=params, timeout=timeout)
+
+    def _get_async_session(self) -> "aiohttp.ClientSession":
+        if aiohttp is None:
+            raise ImportError(
+                "aiohttp is required for async env clients: pip install agentenv[async]"
+            )
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_async_connections),
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def arequest(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Async version of `request`, on the pooled aiohttp session of the running loop.
+        """
+        session = self._get_async_session()
+        url = f"{self.env_server_base}/{path}"
+        mark_env_request()
+        attempt = 0
+        while True:
+            self.circuit_breaker.before_request()
+            start = time.perf_counter()
+            status, exc, body = None, None, None
+            try:
+                async with session.request(
+                    method,
+                    url,
+                    json=json,
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as res:
+                    status = res.status
+                    body = await (res.json() if status == 200 else res.text())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                exc = e
+            except BaseException:
+                # e.g. a payload or decoding error, or cancellation; also ends a half-open trial
+                self.circuit_breaker.record_failure()
+                raise
+            latency = time.perf_counter() - start
+
+            if exc is None and status == 200:
+                self.latency.record(path, latency)
+                self.circuit_breaker.record_success()
+                return body
+
+            self.latency.record(path, latency, error=True)
+            if exc is not None or status >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            if not self._should_retry(method, attempt, status, exc):
+                if exc is not None:
+                    raise EnvServerError(f"{method} {url} failed: {exc!r}") from exc
+                raise EnvServerError(
+                    f"{method} {url} returned {status}: {body}", status_code=status
+                )
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+
+    async def apost(self, path: str, json: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return await self.arequest("POST", path, json=json, timeout=timeout)
+
+    async def aget(self, path: str, params: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return await self.arequest("GET", path, params=params, timeout=timeout)
+
+    async def aclose(self) -> None:
+        """
+        Close the aiohttp session opened in the running event loop.
+        """
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_transports: dict[str, EnvTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(env_server_base: str, **kwargs) -> EnvTransport:
+    """
+    Return the transport shared by all clients of `env_server_base`, creating it with
+    `kwargs` (see `EnvTransport`) on first use. An `inproc://` or `pipe://` base gets
+    a transport that calls the env server app without HTTP (see `inproc`).
+    """
+    key = env_server_base.rstrip("/")
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            if key.startswith(("inproc://", "pipe://")):
+                from .inproc import local_transport
+
+                transport = _transports[key] = local_transport(key, **kwargs)
+            else:
+                transport = _transports[key] = EnvTransport(key, **kwargs)
+        return transport
+
+
+def transport_stats() -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Per-server, per-endpoint latency counters of every transport.
+    """
+    with _transports_lock:
+        transports = list(_transports.values())
+    return {t.env_server_base: t.latency.snapshot() for t in transports}
+
+
+async def close_async_sessions() -> None:
+    """
+    Close the pooled aiohttp sessions opened in the running event loop.
+    """
+    with _transports_lock:
+        transports = list(_transports.values())
+    for transport in transports:
+        await transport.aclose()
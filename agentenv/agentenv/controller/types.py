@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import Optional, Sequence, TypedDict, List
+from typing import Any, Optional, Sequence, TypedDict, List
+
+import numpy as np
 
 ConversationMessage = TypedDict(
     "ConversationMessage", {"from": str, "loss": Optional[bool], "value": str}
@@ -47,6 +49,60 @@ class ExperienceOutput:
     attention_mask: list[int]
     action_mask: list[int]
 
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    def to_compact(self) -> "CompactExperienceOutput":
+        return CompactExperienceOutput(
+            conversation=self.conversation,
+            reward=self.reward,
+            text=self.text,
+            seq_ids=np.asarray(self.seq_ids, dtype=np.int32),
+            packed_action_mask=np.packbits(np.asarray(self.action_mask, dtype=np.bool_)),
+        )
+
+
+@dataclass
+class CompactExperienceOutput:
+    """
+    ExperienceOutput with the token ids in an int32 array and the action mask packed
+    into bits. The attention mask, which is all ones, is built on demand. Pickles
+    (e.g. in `gather_object`) and sits in memory at a fraction of the list form.
+    """
+
+    conversation: list[ConversationMessage]
+    reward: float
+    text: str
+    seq_ids: np.ndarray
+    packed_action_mask: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.seq_ids)
+
+    @property
+    def action_mask(self) -> np.ndarray:
+        return np.unpackbits(self.packed_action_mask, count=len(self.seq_ids))
+
+    @property
+    def attention_mask(self) -> np.ndarray:
+        return np.ones(len(self.seq_ids), dtype=np.uint8)
+
+    def to_experience(self) -> ExperienceOutput:
+        return ExperienceOutput(
+            conversation=self.conversation,
+            reward=self.reward,
+            text=self.text,
+            seq_ids=self.seq_ids.tolist(),
+            attention_mask=self.attention_mask.tolist(),
+            action_mask=self.action_mask.tolist(),
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        The same dict as `ExperienceOutput.to_dict`, with plain lists.
+        """
+        return self.to_experience().to_dict()
+
 
 @dataclass
 class APIExperienceOutput:
@@ -54,6 +110,18 @@ class APIExperienceOutput:
     reward: float
 
 
+@dataclass
+class TaskExperienceOutput:
+    """
+    An experience tagged with the task (by position in the controller) that produced it.
+    """
+
+    task_index: int
+    env_name: str
+    idx: int
+    experience: ExperienceOutput | APIExperienceOutput
+
+
 @dataclass
 class ActionWithTought:
     thought: str
@@ -62,7 +130,7 @@ class ActionWithTought:
 
 @dataclass
 class EvaluationOutput:
-    experiences: list[ExperienceOutput]
+    experiences: list[ExperienceOutput | CompactExperienceOutput]
     score: float
     success: float
 
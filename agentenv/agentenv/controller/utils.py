@@ -1,3 +1,4 @@
+import asyncio
 import json
 import re
 from typing import Optional, Sequence
@@ -5,7 +6,8 @@ from typing import Optional, Sequence
 import numpy as np
 from transformers import GenerationConfig
 
-from . import Agent, APIAgent, BaseTask
+from . import Agent, APIAgent, AsyncAPIAgent, BaseTask
+from .scheduler import MultiTaskScheduler
 from .types import (
     ActionFormat,
     ActionWithTought,
@@ -13,6 +15,7 @@ from .types import (
     EvaluationOutput,
     ExperienceOutput,
     APIExperienceOutput,
+    TaskExperienceOutput,
 )
 
 INVOKING_FUNCTION_PROMPT = """
@@ -113,6 +116,26 @@ class BaseAdapter:
     conversation_start_dict: dict[
         ActionFormat, tuple[ConversationMessage, ConversationMessage]
     ]
+    # text that only follows a complete action, per format: generation stops at it (see
+    # `Agent.generate_batch` and `APIAgent.generate`) and `action_parser` cuts it off
+    stop_sequences: dict[ActionFormat, tuple[str, ...]] = {
+        ActionFormat.REACT: ("\nObservation:", "\nThought:"),
+        ActionFormat.FUNCTION_CALLING: ("\n```\n",),
+        ActionFormat.CODE_AS_ACTION: ("\n```\n",),
+    }
+
+    @classmethod
+    def truncate_at_stop(cls, text: str, action_format: ActionFormat) -> str:
+        """
+        Cut `text` at the first stop sequence of `action_format`. Local engines keep
+        the stop sequence in their output, APIs drop it.
+        """
+        end = len(text)
+        for stop in cls.stop_sequences.get(action_format, ()):
+            position = text.find(stop)
+            if position != -1:
+                end = min(end, position)
+        return text[:end]
 
     @staticmethod
     def parse_react(text: str) -> ActionWithTought:
@@ -194,6 +217,7 @@ class BaseAdapter:
 
     @classmethod
     def action_parser(cls, action: str, action_format: ActionFormat) -> str:
+        action = cls.truncate_at_stop(action, action_format)
         if action_format == ActionFormat.REACT:
             return cls.parse_react(action).action
         elif action_format == ActionFormat.FUNCTION_CALLING:
@@ -205,9 +229,41 @@ class BaseAdapter:
 
 
 class BaseAgentEnvController:
-    def __init__(self, agent: Agent | APIAgent, tasks: Sequence[BaseTask]) -> None:
+    # interleaves the episodes of multiple tasks; built with the defaults on first use
+    scheduler: Optional[MultiTaskScheduler] = None
+
+    def __init__(
+        self,
+        agent: Agent | APIAgent,
+        tasks: Sequence[BaseTask],
+        scheduler: Optional[MultiTaskScheduler] = None,
+    ) -> None:
         self.agent = agent
         self.tasks = tasks
+        self.scheduler = scheduler
+
+    def close(self) -> None:
+        """
+        Close the envs of all tasks on their env servers.
+        """
+        for task in self.tasks:
+            task.close()
+
+    def generate_experience_tagged(
+        self,
+        idxs: Sequence[Sequence[int]],
+        generation_config: Optional[GenerationConfig] = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[TaskExperienceOutput]:
+        """
+        Roll out `idxs[i]` on `self.tasks[i]`, interleaving all tasks, and return the
+        experiences tagged by task.
+        """
+        if self.scheduler is None:
+            self.scheduler = MultiTaskScheduler(self.tasks)
+        return self.scheduler.generate_experience(
+            self.agent, idxs, generation_config, max_rounds
+        )
 
     def generate_experience(
         self,
@@ -224,18 +280,60 @@ class BaseAgentEnvController:
                 max_rounds,
             )
         elif isinstance(idxs[0], Sequence):
-            for idx, task in enumerate(self.tasks):
-                experience += task.generate_experience(
-                    self.agent,
-                    idxs[idx],
-                    generation_config,
-                    max_rounds,
+            experience += [
+                tagged.experience
+                for tagged in self.generate_experience_tagged(
+                    idxs, generation_config, max_rounds
                 )
+            ]
         else:
             raise ValueError("Incorrect Format for idxs")
 
         return experience
 
+    async def agenerate_experience(
+        self,
+        idxs: Sequence[int] | Sequence[Sequence[int]] | None = None,
+        max_rounds: Optional[int] = None,
+    ) -> list[APIExperienceOutput]:
+        """
+        Async counterpart of `generate_experience` for an `AsyncAPIAgent`;
+        the episodes of all tasks run concurrently.
+        """
+        if isinstance(idxs[0], int):
+            idxs = [idxs]
+        elif not isinstance(idxs[0], Sequence):
+            raise ValueError("Incorrect Format for idxs")
+        experiences = await asyncio.gather(
+            *(
+                task.agenerate_experience(self.agent, task_idxs, max_rounds)
+                for task, task_idxs in zip(self.tasks, idxs)
+            )
+        )
+        return [exp for task_experiences in experiences for exp in task_experiences]
+
+    async def aeval(
+        self,
+        max_rounds: Optional[int] = None,
+        idxs: Sequence[int] | Sequence[Sequence[int]] | None = None,
+    ) -> EvaluationOutput:
+        """
+        Async counterpart of `eval` for an `AsyncAPIAgent`, on all items of every task
+        unless `idxs` is given.
+        """
+        exps = await self.agenerate_experience(
+            idxs=(
+                idxs
+                if idxs is not None
+                else [list(range(task.len)) for task in self.tasks]
+            ),
+            max_rounds=max_rounds,
+        )
+        rewards = np.array([exp.reward for exp in exps])
+        return EvaluationOutput(
+            experiences=exps, score=rewards.mean(), success=((rewards == 1) | (rewards == 100)).mean()
+        )
+
 
 class Evaluator(BaseAgentEnvController):
     def eval(
@@ -248,14 +346,14 @@ class Evaluator(BaseAgentEnvController):
             idxs=(
                 idxs
                 if idxs is not None
-                else [list(range(len(task.clients[0]))) for task in self.tasks]
+                else [list(range(task.len)) for task in self.tasks]
             ),
             generation_config=generation_config,
             max_rounds=max_rounds,
         )
         rewards = np.array([exp.reward for exp in exps])
         return EvaluationOutput(
-            experiences=exps, score=rewards.mean(), success=(rewards == 1 or rewards == 100).mean()
+            experiences=exps, score=rewards.mean(), success=((rewards == 1) | (rewards == 100)).mean()
         )
 
 
@@ -279,7 +377,7 @@ class BaseTrainer(BaseAgentEnvController):
         )
         rewards = np.array([exp.reward for exp in exps])
         return EvaluationOutput(
-            experiences=exps, score=rewards.mean(), success=(rewards == 1 or rewards == 100).mean()
+            experiences=exps, score=rewards.mean(), success=((rewards == 1) | (rewards == 100)).mean()
         )
 
     def save_model(self):
@@ -0,0 +1,308 @@
+"""
+Batched env requests. The env servers answer `POST /step_batch` with body
+`{"steps": [...]}` and `POST /reset_batch` with body `{"resets": [...]}`, where every
+item is the body of a `/step` or `/reset` request. They return one
+`{"ok": true, "result": ...}` or `{"ok": false, "status_code": ..., "error": ...}`
+per item, in order.
+
+The env clients send one request per env. A `RequestCoalescer` gathers the step and
+reset requests that concurrent callers ("participants") send through a
+`CoalescingTransport`, and sends them to the server as a single batch request:
+
+    vector = VectorEnvClient(clients)
+    vector.reset(idxs)
+    step_outputs = vector.step(actions)
+
+A server without the batch endpoints answers 404. Its requests are then sent one by one,
+as before.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from .env import BaseEnvClient, StepOutput
+from .transport import EnvServerError
+
+# the coalescer of the participant running in the current thread
+_coalescer: contextvars.ContextVar[Optional["RequestCoalescer"]] = contextvars.ContextVar(
+    "agentenv_request_coalescer", default=None
+)
+# the participant running in the current thread; the threads it starts with its context,
+# e.g. for a speculative duplicate of a step, act for the same participant
+_participant: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar(
+    "agentenv_request_participant", default=None
+)
+# (env server, path) of the endpoints whose batch endpoint does not exist
+_unsupported: set[tuple[str, str]] = set()
+# tells a waiting request to send itself
+_SEND = object()
+
+BATCH_KEYS = {"step": "steps", "reset": "resets"}
+
+
+def _endpoint(path: str) -> str:
+    return path.rstrip("/").rsplit("/", 1)[-1]
+
+
+class _Request:
+    def __init__(
+        self,
+        transport: Any,
+        path: str,
+        json: Optional[dict[str, Any]],
+        timeout: Optional[float],
+        participant: Optional[object],
+    ) -> None:
+        self.participant = self if participant is None else participant
+        self.transport = transport
+        self.path = path
+        self.json = json
+        self.timeout = timeout
+        self.future = Future()
+
+
+class RequestCoalescer:
+    """
+    Batches the step and reset requests of `n_participants` concurrent callers. A
+    request waits until every participant still running has sent one (or `max_wait`
+    seconds), then all waiting requests go out in one batch request per server and
+    endpoint. A participant with several requests waiting, e.g. a step and its
+    speculative duplicate, counts once. Participants that finish early call `leave`, so
+    that the others do not wait for them.
+    """
+
+    def __init__(self, n_participants: int, max_wait: float = 0.05) -> None:
+        """
+        Args:
+            n_participants (int): The number of callers that send requests through the coalescer.
+            max_wait (float, optional): Seconds a request waits for the requests of the other participants before the requests waiting so far are sent. Defaults to 0.05.
+        """
+        self.max_wait = max_wait
+        self._live = n_participants
+        self._waiting: list[_Request] = []
+        # participant -> number of its requests waiting
+        self._pending: dict[object, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def participant(self) -> Iterator["RequestCoalescer"]:
+        """
+        Coalesce the requests sent by the current thread (and the threads it starts with
+        its context) until the block ends, then `leave`.
+        """
+        token = _coalescer.set(self)
+        participant_token = _participant.set(object())
+        try:
+            yield self
+        finally:
+            _participant.reset(participant_token)
+            _coalescer.reset(token)
+            self.leave()
+
+    def leave(self) -> None:
+        with self._lock:
+            self._live -= 1
+            batch = self._take(len(self._pending) >= self._live)
+        self._send(batch)
+
+    def submit(
+        self,
+        transport: Any,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Send `POST path` as part of a batch and return its result.
+        """
+        request = _Request(transport, path, json, timeout, _participant.get())
+        with self._lock:
+            self._waiting.append(request)
+            self._pending[request.participant] = self._pending.get(request.participant, 0) + 1
+            batch = self._take(len(self._pending) >= self._live)
+        self._send(batch)
+        try:
+            result = request.future.result(timeout=self.max_wait)
+        except FutureTimeoutError:
+            # a participant is slow to send its request, send the ones waiting now
+            with self._lock:
+                batch = self._take(request in self._waiting)
+            self._send(batch)
+            result = request.future.result()
+        if result is _SEND:
+            return transport.request("POST", path, json=json, timeout=timeout)
+        return result
+
+    def _take(self, ready: bool) -> list[_Request]:
+        if not ready:
+            return []
+        batch, self._waiting = self._waiting, []
+        self._pending = {}
+        return batch
+
+    def _send(self, batch: list[_Request]) -> None:
+        groups: dict[tuple[int, str], list[_Request]] = {}
+        for request in batch:
+            groups.setdefault((id(request.transport), request.path), []).append(request)
+        for requests in groups.values():
+            if len(requests) == 1:
+                requests[0].future.set_result(_SEND)
+            else:
+                self._send_batch(requests)
+
+    @staticmethod
+    def _send_batch(requests: list[_Request]) -> None:
+        transport, path = requests[0].transport, requests[0].path
+        timeouts = [r.timeout for r in requests]
+        try:
+            results = transport.request(
+                "POST",
+                path.rstrip("/") + "_batch",
+                json={BATCH_KEYS[_endpoint(path)]: [r.json or {} for r in requests]},
+                timeout=None if None in timeouts else max(timeouts),
+            )
+        except EnvServerError as e:
+            if e.status_code in (404, 405):
+                _unsupported.add((transport.env_server_base, path))
+                for request in requests:
+                    request.future.set_result(_SEND)
+                return
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        for request, result in zip(requests, results):
+            if result["ok"]:
+                request.future.set_result(result["result"])
+            else:
+                request.future.set_exception(
+                    EnvServerError(
+                        f"POST {transport.env_server_base}/{path} returned "
+                        f"{result['status_code']} in a batch: {result['error']}",
+                        status_code=result["status_code"],
+                    )
+                )
+
+
+class CoalescingTransport:
+    """
+    Wraps the transport of an env client. Its step and reset requests are batched with
+    those of other clients while the calling thread is a participant of a
+    `RequestCoalescer`, and sent as usual otherwise.
+    """
+
+    def __init__(self, transport: Any) -> None:
+        self.transport = transport
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        json: Optional[dict[str, Any]] = None,
+        params: Optional[dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        coalescer = _coalescer.get()
+        if (
+            coalescer is not None
+            and method == "POST"
+            and _endpoint(path) in BATCH_KEYS
+            and (self.transport.env_server_base, path) not in _unsupported
+        ):
+            return coalescer.submit(self.transport, path, json, timeout)
+        return self.transport.request(method, path, json=json, params=params, timeout=timeout)
+
+    def post(self, path: str, json: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("POST", path, json=json, timeout=timeout)
+
+    def get(self, path: str, params: Optional[dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        return self.request("GET", path, params=params, timeout=timeout)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.transport, name)
+
+
+def coalesce_requests(client: BaseEnvClient) -> BaseEnvClient:
+    """
+    Route the requests of `client` through a `CoalescingTransport`. Clients without a
+    `transport` are left as they are.
+    """
+    transport = getattr(client, "transport", None)
+    if transport is not None and not isinstance(transport, CoalescingTransport):
+        client.transport = CoalescingTransport(transport)
+    return client
+
+
+def run_coalesced(
+    executor: ThreadPoolExecutor, fn: Callable, args: Sequence[tuple]
+) -> list[Future]:
+    """
+    Run `fn(*a)` for every `a` of `args` on `executor`, as participants of one
+    `RequestCoalescer`. The executor needs a worker per call, or the calls that have
+    not started hold the others back by `max_wait` per request.
+    """
+    coalescer = RequestCoalescer(len(args))
+
+    def run(call_args: tuple) -> Any:
+        with coalescer.participant():
+            return fn(*call_args)
+
+    return [executor.submit(run, call_args) for call_args in args]
+
+
+class VectorEnvClient:
+    """
+    Several env clients, stepped and reset together with one batch request per call.
+    """
+
+    def __init__(self, clients: Sequence[BaseEnvClient]) -> None:
+        """
+        Args:
+            clients (Sequence[BaseEnvClient]): The clients. Their transports are wrapped in a `CoalescingTransport`.
+        """
+        if not clients:
+            raise ValueError("A vector env client needs at least one client.")
+        self.clients = [coalesce_requests(client) for client in clients]
+        self._executor = ThreadPoolExecutor(max_workers=len(self.clients))
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def _map(self, fn: Callable, args: Sequence[tuple]) -> list[Any]:
+        futures = run_coalesced(self._executor, fn, args)
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def step(self, actions: Sequence[str]) -> list[StepOutput]:
+        """
+        Step every client with its action. If a step fails, the error is raised once
+        all steps are done.
+        """
+        if len(actions) != len(self.clients):
+            raise ValueError(f"Expected {len(self.clients)} actions, got {len(actions)}.")
+        return self._map(lambda client, action: client.step(action), list(zip(self.clients, actions)))
+
+    def reset(self, idxs: Sequence[int]) -> list[Any]:
+        if len(idxs) != len(self.clients):
+            raise ValueError(f"Expected {len(self.clients)} idxs, got {len(idxs)}.")
+        return self._map(lambda client, idx: client.reset(idx), list(zip(self.clients, idxs)))
+
+    def observe(self) -> list[str]:
+        return [client.observe() for client in self.clients]
+
+    def close(self) -> None:
+        """
+        Close the envs of all clients on the env server.
+        """
+        self._executor.shutdown()
+        for client in self.clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
@@ -1,15 +1,22 @@
-from .academia import AcademiaEnvClient, AcademiaTask
-from .alfworld import AlfWorldEnvClient, AlfWorldTask, AlfWorldAdapter
-from .babyai import BabyAIEnvClient, BabyAITask
-from .lmrlgym import MazeEnvClient, MazeTask, WordleEnvClient, WordleTask
-from .movie import MovieEnvClient, MovieTask
-from .sciworld import SciworldEnvClient, SciworldTask, SciWorldAdapter
-from .sheet import SheetEnvClient, SheetTask
-from .sqlgym import SqlGymEnvClient, SqlGymTask
-from .textcraft import TextCraftEnvClient, TextCraftTask
-from .todo import TodoEnvClient, TodoTask
-from .weather import WeatherEnvClient, WeatherTask
-from .webarena import WebarenaEnvClient, WebarenaTask
-from .webshop import WebshopAdapter, WebshopEnvClient, WebshopTask
-from .searchqa import SearchQAEnvClient, SearchQATask
-from .ded import DEDEnvClient, DEDTask # SJ
\ No newline at end of file
+from .academia import AcademiaEnvClient, AcademiaTask, AsyncAcademiaEnvClient
+from .alfworld import AlfWorldEnvClient, AlfWorldTask, AlfWorldAdapter, AsyncAlfWorldEnvClient
+from .babyai import AsyncBabyAIEnvClient, BabyAIEnvClient, BabyAITask
+from .lmrlgym import (
+    AsyncMazeEnvClient,
+    AsyncWordleEnvClient,
+    MazeEnvClient,
+    MazeTask,
+    WordleEnvClient,
+    WordleTask,
+)
+from .movie import AsyncMovieEnvClient, MovieEnvClient, MovieTask
+from .sciworld import AsyncSciworldEnvClient, SciworldEnvClient, SciworldTask, SciWorldAdapter
+from .sheet import AsyncSheetEnvClient, SheetEnvClient, SheetTask
+from .sqlgym import AsyncSqlGymEnvClient, SqlGymEnvClient, SqlGymTask
+from .textcraft import AsyncTextCraftEnvClient, TextCraftEnvClient, TextCraftTask
+from .todo import AsyncTodoEnvClient, TodoEnvClient, TodoTask
+from .weather import AsyncWeatherEnvClient, WeatherEnvClient, WeatherTask
+from .webarena import AsyncWebarenaEnvClient, WebarenaEnvClient, WebarenaTask
+from .webshop import AsyncWebshopEnvClient, WebshopAdapter, WebshopEnvClient, WebshopTask
+from .searchqa import AsyncSearchQAEnvClient, SearchQAEnvClient, SearchQATask
+from .ded import AsyncDEDEnvClient, DEDEnvClient, DEDTask # SJ
\ No newline at end of file
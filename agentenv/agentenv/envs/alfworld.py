@@ -2,16 +2,15 @@ import json
 from typing import Any, Mapping
 import re
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import (
+    AsyncBaseEnvClient,
     BaseAdapter,
     BaseEnvClient,
     BaseTask,
     extract_python_code_blocks,
     format_code_as_action_prompt,
     format_function_call_prompt,
+    get_transport,
     parse_python_code_comments,
 )
 from agentenv.controller.types import (
@@ -528,15 +527,13 @@ class AlfWorldEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise requests.RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
         
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
         
-        ok = ok.json()
         # print(ok)
         self.env_id = ok["id"]
         self.info = None
@@ -546,21 +543,12 @@ class AlfWorldEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return f"{self.info['observation']}\nAVAILABLE ACTIONS: {','.join(self.info['available_actions'])}"
@@ -604,8 +592,53 @@ class AlfWorldEnvClient(BaseEnvClient):
         response = self._post("close",{})
         return response
 
+class AsyncAlfWorldEnvClient(AsyncBaseEnvClient):
+    adapter_cls = AlfWorldAdapter
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["id"]
+        self.info = None
+
+    async def observe(self) -> str:
+        return f"{self.info['observation']}\nAVAILABLE ACTIONS: {','.join(self.info['available_actions'])}"
+
+    async def step(self, action: str) -> StepOutput:
+        if action.endswith("</s>"):
+            action = action[:-5]
+        try:
+            action = self.adapter_cls.action_parser(action, self.action_format)
+        except Exception as e:
+            print(e, action)
+            return StepOutput(
+                state="Invalid Action.\n\n" + await self.observe(), reward=0.0, done=False
+            )
+        response = await self._post("step", {"action": action})
+        self.info = {
+            "observation": response["observation"],
+            "available_actions": response["available_actions"],
+            "reward": response["reward"],
+            "done": response["done"],
+        }
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, game: int, world_type: str = "Text") -> dict[str, Any]:
+        response = await self._post("reset", {"game": game, "world_type": world_type})
+        self.info = {
+            "observation": response["observation"],
+            "available_actions": response["available_actions"],
+            "reward": 0,
+            "done": False,
+        }
+        return response
+
 class AlfWorldTask(BaseTask):
     env_client_cls = AlfWorldEnvClient
+    async_env_client_cls = AsyncAlfWorldEnvClient
     env_name = "AlfWorld"
 
     def __init__(
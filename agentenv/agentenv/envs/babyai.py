@@ -1,8 +1,6 @@
 from typing import Any, Mapping
-import requests
 import re
-from requests.exceptions import RequestException
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
@@ -32,11 +30,9 @@ class BabyAIEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
 
-        ok = ok.json()
         self.env_id = ok["id"]
 
     def __len__(self):
@@ -44,21 +40,12 @@ class BabyAIEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -101,8 +88,53 @@ class BabyAIEnvClient(BaseEnvClient):
         response = self._post("close",{})
         return response
 
+class AsyncBabyAIEnvClient(AsyncBaseEnvClient):
+    conversation_start = BabyAIEnvClient.conversation_start
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["id"]
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        action_matches = re.findall(r"Action:\s*(.*?)(?=\n|$)", action, re.DOTALL)
+        if len(action_matches) > 1:
+            return StepOutput(
+                state="Error: Only one 'Action' is allowed per response. Please adjust your response.",
+                reward=0,
+                done=False,
+            )
+        action = action_matches[-1] if action_matches else ""
+        action = re.sub(r"[^A-Za-z0-9, ]+", "", action)
+        action = " ".join(action.split()).strip()
+        response = await self._post("step", {"action": action})
+        self.info = {
+            "observation": response["observation"],
+            "reward": response["reward"],
+            "score": response["score"],
+            "done": response["done"],
+        }
+        return StepOutput(
+            state=response["observation"],
+            reward=response["score"],
+            done=response["done"],
+        )
+
+    async def reset(self, data_idx: int = 0) -> dict[str, Any]:
+        response = await self._post("reset", {"data_idx": data_idx})
+        self.info = {
+            "observation": response["observation"],
+            "reward": response["reward"],
+            "score": response["score"],
+            "done": response["done"],
+        }
+        return response
+
 class BabyAITask(BaseTask):
     env_client_cls = BabyAIEnvClient
+    async_env_client_cls = AsyncBabyAIEnvClient
     env_name = "BabyAI"
 
     def __init__(
@@ -1,10 +1,7 @@
 import json
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
@@ -125,11 +122,9 @@ Now let's start a new game. Return your action and your thought in the format ab
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
 
-        ok = ok.json()
         print(ok)
         self.env_id = ok["id"]
         self.info = {
@@ -142,21 +137,12 @@ Now let's start a new game. Return your action and your thought in the format ab
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -203,8 +189,62 @@ Now let's start a new game. Return your action and your thought in the format ab
         return response
 
 
+class AsyncMazeEnvClient(AsyncBaseEnvClient):
+    conversation_start = MazeEnvClient.conversation_start
+    _fully_first_observation = MazeEnvClient._fully_first_observation
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["id"]
+        self.info = {
+            "reward": 0,
+            "done": False,
+        }
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        if action.endswith("</s>"):
+            action = action[:-5]
+        _action = action.split("Action:")
+        if len(_action) > 1:
+            action = _action[1].strip()
+        else:
+            action = _action[0].strip()
+        response = await self._post("step", {"action": action})
+        self.info.update(
+            {
+                "observation": response["observation"],
+                "reward": self.info["reward"] + response["reward"],
+                "done": response["done"],
+            }
+        )
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, idx: int = 0) -> dict[str, Any]:
+        response = await self._post("reset", {"game": idx})
+        self.first_observation = self._fully_first_observation
+        response["observation"] = (
+            self.first_observation + "\n" + response["observation"]
+        )
+        self.info.update(
+            {
+                "observation": response["observation"],
+                "reward": 0,
+                "done": False,
+            }
+        )
+        return response
+
+
 class MazeTask(BaseTask):
     env_client_cls = MazeEnvClient
+    async_env_client_cls = AsyncMazeEnvClient
     env_name = "LMRL-Gym.maze"
 
     def __init__(
@@ -276,11 +316,9 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
 
-        ok = ok.json()
         print(ok)
         self.env_id = ok["id"]
         vocab = self._get("filtered_vocab")
@@ -299,21 +337,12 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -357,8 +386,64 @@ Now let's start a new game. Remember, the word you guess should be strictly in t
         return response
 
 
+class AsyncWordleEnvClient(AsyncBaseEnvClient):
+    conversation_start = WordleEnvClient.conversation_start
+    first_observation = WordleEnvClient.first_observation
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["id"]
+        vocab = await self._get("filtered_vocab")
+        self.info = {
+            "observation": self.first_observation.replace(
+                "{{vocab}}", "\n".join(vocab)
+            ),
+            "vocab": vocab,
+            "reward": 0,
+            "done": False,
+        }
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        if action.endswith("</s>"):
+            action = action[:-5]
+        _action = action.split("Action:")
+        if len(_action) > 1:
+            action = _action[1].strip()
+        else:
+            action = _action[0].strip()
+        response = await self._post("step", {"action": action})
+        self.info.update(
+            {
+                "observation": response["observation"],
+                "reward": self.info["reward"] + response["reward"],
+                "done": response["done"],
+            }
+        )
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, idx: int = 0) -> dict[str, Any]:
+        await self._post("reset", {"seed": idx})
+        self.info.update(
+            {
+                "observation": self.first_observation.replace(
+                    "{{vocab}}", "\n".join(self.info["vocab"])
+                ),
+                "reward": 0,
+                "done": False,
+            }
+        )
+
+
 class WordleTask(BaseTask):
     env_client_cls = WordleEnvClient
+    async_env_client_cls = AsyncWordleEnvClient
     env_name = "LMRL-Gym.wordle"
 
     def __init__(
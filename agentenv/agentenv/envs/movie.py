@@ -1,9 +1,6 @@
 from typing import Any, Mapping, Dict
 
-import requests
-from requests.exceptions import RequestException
-
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
@@ -30,36 +27,22 @@ class MovieEnvClient(BaseEnvClient):
         self.id = 0
         data = dict()
         data["id"] = 0
-        ok = requests.post(
-            f"{self.env_server_base}/create",
-            json=data,
-            timeout=self.timeout,
-        )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", json=data, timeout=self.timeout)
 
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         data["env_idx"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> Dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?env_idx={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"env_idx": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> Dict[str, Any]:
         response = self._get("observation")
@@ -80,8 +63,34 @@ class MovieEnvClient(BaseEnvClient):
         return response
 
 
+class AsyncMovieEnvClient(AsyncBaseEnvClient):
+    conversation_start = MovieEnvClient.conversation_start
+    env_id_key = "env_idx"
+
+    async def create(self) -> None:
+        self.env_id = await self._request("POST", "create", json={"id": 0})
+
+    async def observe(self) -> Dict[str, Any]:
+        response = await self._get("observation")
+        return response
+
+    async def step(self, action: str) -> StepOutput:
+        # action is the original output of llm
+        response = await self._post("step", {"action": action})
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, id: int) -> Dict[str, Any]:
+        self.id = id
+        response = await self._post("reset", {"id": self.id})
+        return response
+
 class MovieTask(BaseTask):
     env_client_cls = MovieEnvClient
+    async_env_client_cls = AsyncMovieEnvClient
     env_name = "Movie"
 
     def __init__(
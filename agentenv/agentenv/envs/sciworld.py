@@ -2,16 +2,15 @@ import json
 import re
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
 from agentenv.controller import (
+    AsyncBaseEnvClient,
     BaseAdapter,
     BaseEnvClient,
     BaseTask,
     extract_python_code_blocks,
     format_code_as_action_prompt,
     format_function_call_prompt,
+    get_transport,
     parse_python_code_comments,
 )
 from agentenv.controller.types import (
@@ -801,13 +800,11 @@ class SciworldEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(f"{self.env_server_base}/create", timeout=self.timeout)
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
-        ok = ok.json()
         self.env_id = ok["id"]
 
     def __len__(self):
@@ -815,21 +812,12 @@ class SciworldEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -871,8 +859,52 @@ class SciworldEnvClient(BaseEnvClient):
         response = self._post("close",{})
         return response
 
+class AsyncSciworldEnvClient(AsyncBaseEnvClient):
+    adapter_cls = SciWorldAdapter
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["id"]
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        if action.endswith("</s>"):
+            action = action[:-5]
+        try:
+            action = self.adapter_cls.action_parser(action, self.action_format)
+        except Exception as e:
+            print(e, action)
+            return StepOutput(
+                state="Invalid Action.\n\n" + await self.observe(), reward=0.0, done=False
+            )
+        response = await self._post("step", {"action": action})
+        self.info = {
+            "observation": response["observation"],
+            "reward": response["reward"],
+            "score": response["score"],
+            "done": response["done"],
+        }
+        return StepOutput(
+            state=response["observation"],
+            reward=response["score"],
+            done=response["done"],
+        )
+
+    async def reset(self, data_idx: int = 0) -> dict[str, Any]:
+        response = await self._post("reset", {"data_idx": data_idx})
+        self.info = {
+            "observation": response["task_description"] + '\n' + response["observation"],
+            "reward": 0,
+            "score": 0,
+            "done": False,
+        }
+        return response
+
 class SciworldTask(BaseTask):
     env_client_cls = SciworldEnvClient
+    async_env_client_cls = AsyncSciworldEnvClient
     env_name = "SciWorld"
 
     def __init__(
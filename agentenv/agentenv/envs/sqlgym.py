@@ -1,9 +1,6 @@
 from typing import Any, Mapping
 
-import requests
-from requests.exceptions import RequestException
-
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
@@ -27,47 +24,22 @@ class SqlGymEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(
-            f"{self.env_server_base}/create",
-            timeout=self.timeout,
-        )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
 
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["env_idx"] = self.env_id
-        max_retries = 5
-        for _ in range(max_retries):
-            res = requests.post(
-                f"{self.env_server_base}/{path}",
-                json=data,
-                timeout=self.timeout,
-            )
-            if res.status_code == 503:
-                import time
-
-                time.sleep(0.1)
-            elif res.status_code == 200:
-                break
-            else:
-                print("---------------------")
-                print(res.status_code)
-                print(data)
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?env_idx={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"env_idx": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def step(self, action: str) -> StepOutput:
         action = action.split("```sql")[-1].split("```")[0].strip()
@@ -87,8 +59,33 @@ class SqlGymEnvClient(BaseEnvClient):
         return response
 
 
+class AsyncSqlGymEnvClient(AsyncBaseEnvClient):
+    conversation_start = SqlGymEnvClient.conversation_start
+    env_id_key = "env_idx"
+
+    async def create(self) -> None:
+        self.env_id = await self._request("POST", "create")
+
+    async def step(self, action: str) -> StepOutput:
+        action = action.split("```sql")[-1].split("```")[0].strip()
+        response = await self._post("step", {"action": action})
+        return StepOutput(
+            state=response["state"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def observe(self) -> dict[str, Any]:
+        response = await self._get("observation")
+        return response
+
+    async def reset(self, idx: int) -> dict[str, Any]:
+        response = await self._post("reset", {"item_id": idx})
+        return response
+
 class SqlGymTask(BaseTask):
     env_client_cls = SqlGymEnvClient
+    async_env_client_cls = AsyncSqlGymEnvClient
     env_name = "SQLGym"
 
     def __init__(
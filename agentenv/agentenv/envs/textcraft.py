@@ -2,10 +2,7 @@ from typing import Any, Mapping
 
 import re
 
-import requests
-from requests.exceptions import RequestException
-
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 
 
@@ -44,13 +41,9 @@ class TextCraftEnvClient(BaseEnvClient):
         self.data_len = data_len
 
         dir_info = {"minecraft_dir": minecraft_dir, "commands": commands, "goal": goal}
-        ok = requests.post(
-            f"{self.env_server_base}/create", timeout=self.timeout, json=dir_info
-        )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", json=dir_info, timeout=self.timeout)
 
-        ok = ok.json()
         self.env_id = ok["id"]
         self.info = {
             "observation": ok["observation"],
@@ -63,21 +56,12 @@ class TextCraftEnvClient(BaseEnvClient):
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["id"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?id={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"id": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> str:
         return self.info["observation"]
@@ -120,8 +104,71 @@ class TextCraftEnvClient(BaseEnvClient):
         response = self._post("close",{})
         return response
 
+class AsyncTextCraftEnvClient(AsyncBaseEnvClient):
+    conversation_start = TextCraftEnvClient.conversation_start
+
+    def __init__(
+        self,
+        env_server_base: str,
+        data_len: int,
+        *args,
+        minecraft_dir: str = "agentenv_textcraft/",
+        commands: str = None,
+        goal: str = None,
+        **kwargs,
+    ):
+        super().__init__(env_server_base, data_len, *args, **kwargs)
+        self.dir_info = {"minecraft_dir": minecraft_dir, "commands": commands, "goal": goal}
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create", json=self.dir_info)
+        self.env_id = ok["id"]
+        self.info = {
+            "observation": ok["observation"],
+            "reward": 0,
+            "done": False,
+        }
+
+    async def observe(self) -> str:
+        return self.info["observation"]
+
+    async def step(self, action: str) -> StepOutput:
+        action_matches = re.findall(r"Action:\s*(.*?)(?=\n|$)", action, re.DOTALL)
+        if len(action_matches) > 1:
+            return StepOutput(
+                state="Error: Only one 'Action' is allowed per response. Please adjust your response.",
+                reward=0,
+                done=False,
+            )
+        action = action_matches[-1] if action_matches else ""
+        action = re.sub(r"[^A-Za-z0-9, ]+", "", action)
+        action = " ".join(action.split()).strip()
+        response = await self._post("step", {"action": action})
+        self.info = {
+            "observation": response["observation"],
+            "reward": response["reward"],
+            "done": response["done"],
+        }
+        return StepOutput(
+            state=response["observation"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, idx: int = 0) -> dict[str, Any]:
+        response = await self._post("reset", {"data_idx": idx})
+        self.info.update(
+            {
+                "observation": response["observation"],
+                "reward": 0,
+                "done": False,
+            }
+        )
+        return response
+
 class TextCraftTask(BaseTask):
     env_client_cls = TextCraftEnvClient
+    async_env_client_cls = AsyncTextCraftEnvClient
     env_name = "TextCraft"
 
     def __init__(
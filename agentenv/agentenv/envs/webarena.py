@@ -1,8 +1,6 @@
 from typing import Any, Mapping, Dict
 
-import requests
-from requests.exceptions import RequestException
-from agentenv.controller import BaseEnvClient, BaseTask
+from agentenv.controller import AsyncBaseEnvClient, BaseEnvClient, BaseTask, get_transport
 from agentenv.controller.types import ConversationMessage, StepOutput
 import re
 
@@ -27,35 +25,22 @@ class WebarenaEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(
-            f"{self.env_server_base}/create",
-            timeout=self.timeout,
-        )
-        if ok.status_code != 200:
-            raise RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
 
-        self.env_id = ok.json()["env_idx"]
+        self.env_id = ok["env_idx"]
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: Dict[str, Any]) -> Dict[str, Any]:
         data["env_idx"] = self.env_id
-        res = requests.post(
-            f"{self.env_server_base}/{path}",
-            json=data,
-            timeout=self.timeout,
-        )
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> Dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?env_idx={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"env_idx": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> Dict[str, Any]:
         response = self._get("observation")
@@ -97,8 +82,44 @@ class WebarenaEnvClient(BaseEnvClient):
         response = self._post("close",{})
         return response
 
+class AsyncWebarenaEnvClient(AsyncBaseEnvClient):
+    conversation_start = WebarenaEnvClient.conversation_start
+    env_id_key = "env_idx"
+
+    async def create(self) -> None:
+        ok = await self._request("POST", "create")
+        self.env_id = ok["env_idx"]
+
+    async def observe(self) -> Dict[str, Any]:
+        response = await self._get("observation")
+        return response
+
+    async def step(self, action: str) -> StepOutput:
+        # action is the original output of llm
+        _action = re.findall(r"```(.*?)```", action, re.DOTALL)
+        if len(_action) == 0:
+            return StepOutput(
+                state="Cannot parse action from response. Your action should be inside triple backticks (```). Please adjust accordingly.",
+                reward=0,
+                done=False,
+            )
+        response = await self._post("step", {"action": action})
+        reward = response["reward"] if response["terminated"] else 0
+        return StepOutput(
+            state=response["observation"],
+            reward=reward,
+            done=response["terminated"],
+        )
+
+    async def reset(self, idx: int) -> Dict[str, Any]:
+        response = await self._post("reset", {"seed": 0, "idx": idx})
+        if response["observation"] == "TimeoutError":
+            raise TimeoutError(f"WebArena Reset Timeout: item id={idx}, you may consider restarting the web server.")
+        return response
+
 class WebarenaTask(BaseTask):
     env_client_cls = WebarenaEnvClient
+    async_env_client_cls = AsyncWebarenaEnvClient
     env_name = "Webarena"
 
     def __init__(
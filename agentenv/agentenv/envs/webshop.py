@@ -1,15 +1,15 @@
 import json
 from typing import Any, Mapping
 
-import requests
-
 from agentenv.controller import (
+    AsyncBaseEnvClient,
     BaseAdapter,
     BaseEnvClient,
     BaseTask,
     extract_python_code_blocks,
     format_code_as_action_prompt,
     format_function_call_prompt,
+    get_transport,
     parse_python_code_comments,
 )
 from agentenv.controller.types import (
@@ -158,49 +158,24 @@ class WebshopEnvClient(BaseEnvClient):
         self.timeout = timeout
         self.data_len = data_len
 
-        ok = requests.post(
-            f"{self.env_server_base}/create",
-            timeout=self.timeout,
-        )
-        if ok.status_code != 200:
-            raise requests.RequestException(f"Failed to create environment: {ok}")
+        self.transport = get_transport(self.env_server_base)
+        ok = self.transport.post("create", timeout=self.timeout)
         self.conversation_start = self.adapter_cls.conversation_start_dict[
             self.action_format
         ]
-        self.env_id = ok.json()
+        self.env_id = ok
 
     def __len__(self):
         return self.data_len
 
     def _post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         data["env_idx"] = self.env_id
-        max_retries = 5
-        for attempt in range(max_retries):
-            res = requests.post(
-                f"{self.env_server_base}/{path}",
-                json=data,
-                timeout=self.timeout,
-            )
-            if res.status_code == 503:
-                import time
-
-                time.sleep(0.1)
-            elif res.status_code == 200:
-                break
-            else:
-                print("---------------------")
-                print(res.status_code)
-                print(data)
-        assert res.status_code == 200
-        return res.json()
+        return self.transport.post(path, json=data, timeout=self.timeout)
 
     def _get(self, path: str) -> dict[str, Any]:
-        res = requests.get(
-            f"{self.env_server_base}/{path}?env_idx={self.env_id}",
-            timeout=self.timeout,
+        return self.transport.get(
+            path, params={"env_idx": self.env_id}, timeout=self.timeout
         )
-        assert res.status_code == 200
-        return res.json()
 
     def observe(self) -> dict[str, Any]:
         response = self._get("observation")
@@ -232,8 +207,41 @@ class WebshopEnvClient(BaseEnvClient):
     def close(self):
         response = self._post("close", {})
 
+class AsyncWebshopEnvClient(AsyncBaseEnvClient):
+    adapter_cls = WebshopAdapter
+    env_id_key = "env_idx"
+
+    async def create(self) -> None:
+        self.env_id = await self._request("POST", "create")
+
+    async def observe(self) -> str:
+        return await self._get("observation")
+
+    async def step(self, action: str) -> StepOutput:
+        if action.endswith("</s>"):
+            action = action[:-5]
+        try:
+            action = WebshopAdapter.action_parser(action, self.action_format)
+        except Exception as e:
+            print(e, action)
+            return StepOutput(
+                state="Invalid Action.\n\n" + await self.observe(), reward=0.0, done=False
+            )
+        response = await self._post("step", {"action": action})
+        return StepOutput(
+            state=response["state"],
+            reward=response["reward"],
+            done=response["done"],
+        )
+
+    async def reset(self, idx: int) -> dict[str, Any]:
+        response = await self._post("reset", {"session_id": idx})
+        response[0] = await self.observe()
+        return response
+
 class WebshopTask(BaseTask):
     env_client_cls = WebshopEnvClient
+    async_env_client_cls = AsyncWebshopEnvClient
     env_name = "WebShop"
 
     def __init__(
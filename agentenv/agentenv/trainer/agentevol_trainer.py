@@ -15,7 +15,12 @@ from accelerate.utils import broadcast, gather_object
 from agentenv.controller.agent import Agent
 from agentenv.controller.task import BaseTask, GenerationConfig
 from agentenv.controller.utils import BaseTrainer
-from agentenv.trainer.utils import set_seed
+from agentenv.trainer.utils import (
+    experience_sink,
+    load_raw_dataset,
+    set_seed,
+    trajectory_writer,
+)
 from datasets import Dataset, DatasetDict
 from torch.utils.data import DataLoader
 from tqdm import tqdm
@@ -83,9 +88,9 @@ class AgentEvolTrainer(BaseTrainer):
         with self.accelerator.main_process_first():
             self.raw_dataset = DatasetDict(
                 {
-                    "train": Dataset.from_list(json.load(open(self.args["train_file"], "r"))),
-                    "inference": Dataset.from_list(json.load(open(self.args["inference_file"], "r"))),
-                    "test": Dataset.from_list(json.load(open(self.args["test_file"], "r"))),
+                    "train": load_raw_dataset(self.args["train_file"]),
+                    "inference": load_raw_dataset(self.args["inference_file"]),
+                    "test": load_raw_dataset(self.args["test_file"]),
                 }
             )
             self.accelerator.print("Raw data:", self.raw_dataset)
@@ -518,6 +523,15 @@ class AgentEvolTrainer(BaseTrainer):
         all_success = []
 
         iter_data_file_path = os.path.join(self.args["iter_data_path"], f"webshop_iter_{iter + 1}.jsonl")
+        inference_file_path = os.path.join(
+            self.args["model_save_path"], f"inference_iter_{iter + 1}.jsonl"
+        )
+        # the output file in the configured format, open across batches
+        sink = (
+            experience_sink(inference_file_path, self.args.get("output_format", "jsonl"))
+            if self.accelerator.is_main_process
+            else None
+        )
 
         for _, batch in tqdm(
             enumerate(dataloader),
@@ -555,17 +569,16 @@ class AgentEvolTrainer(BaseTrainer):
                 # gather operation
                 all_device_batch_rewards = self.accelerator.gather(cur_batch_rewards)
                 all_device_batch_success = self.accelerator.gather(cur_batch_success)
-                all_device_batch_exp = gather_object(exps.experiences)
+                all_device_batch_exp = gather_object(
+                    [exp.to_compact() for exp in exps.experiences]
+                )
                 all_device_data_idx = self.accelerator.gather(cur_batch_data_idx)
                 all_rewards.extend(all_device_batch_rewards.cpu().numpy().tolist())
                 all_success.extend(all_device_batch_success.cpu().numpy().tolist())
 
                 # write inference results to file
                 if self.accelerator.is_main_process:
-                    inference_file_path = os.path.join(
-                        self.args["model_save_path"], f"inference_iter_{iter + 1}.jsonl"
-                    )
-                    with jsonlines.open(inference_file_path, mode="a") as f:
+                    with trajectory_writer(inference_file_path, sink) as f:
                         for idx, exp in enumerate(all_device_batch_exp):
                             cur_idx = all_device_data_idx[idx]
                             conversation = exp.conversation
@@ -578,7 +591,8 @@ class AgentEvolTrainer(BaseTrainer):
                                     "item_id": item_id,
                                     "reward": cur_reward,
                                     "success": cur_success,
-                                }
+                                },
+                                exp,
                             )
                     # filter data with high reward
                     with jsonlines.open(iter_data_file_path, mode="a") as f:
@@ -589,6 +603,9 @@ class AgentEvolTrainer(BaseTrainer):
                                 item_id = f"webshop_{cur_idx}"
                                 f.write({"conversations": conversation, "item_id": item_id})
 
+        if sink is not None:
+            sink.close()
+
         # fix for duplicated data
         all_rewards = all_rewards[: len(dataloader.dataset)]
         all_success = all_success[: len(dataloader.dataset)]
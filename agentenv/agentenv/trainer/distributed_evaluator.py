@@ -14,7 +14,12 @@ from agentenv.controller import Agent
 from agentenv.controller.agent import Agent
 from agentenv.controller.task import BaseTask, GenerationConfig
 from agentenv.controller.utils import BaseTrainer
-from agentenv.trainer.utils import set_seed
+from agentenv.trainer.utils import (
+    experience_sink,
+    load_raw_dataset,
+    set_seed,
+    trajectory_writer,
+)
 from datasets import Dataset, DatasetDict
 from torch.utils.data import DataLoader
 from tqdm import tqdm
@@ -66,9 +71,7 @@ class DistributedEvaluator(BaseTrainer):
         with self.accelerator.main_process_first():
             self.raw_dataset = DatasetDict(
                 {
-                    "inference": Dataset.from_list(
-                        json.load(open(self.args["inference_file"], "r"))
-                    ),
+                    "inference": load_raw_dataset(self.args["inference_file"]),
                 }
             )
             self.accelerator.print("Raw data:", self.raw_dataset)
@@ -105,6 +108,12 @@ class DistributedEvaluator(BaseTrainer):
         all_success = []
         if dataloader is None:
             dataloader = self.inference_dataloader
+        # the output file in the configured format, open across batches
+        sink = (
+            experience_sink(self.args["output_file"], self.args.get("output_format", "jsonl"))
+            if self.accelerator.is_main_process
+            else None
+        )
 
         for _, batch in tqdm(
             enumerate(dataloader),
@@ -141,14 +150,16 @@ class DistributedEvaluator(BaseTrainer):
                 # gather operation
                 all_device_batch_rewards = self.accelerator.gather(cur_batch_rewards)
                 all_device_batch_success = self.accelerator.gather(cur_batch_success)
-                all_device_batch_exp = gather_object(exps.experiences)
+                all_device_batch_exp = gather_object(
+                    [exp.to_compact() for exp in exps.experiences]
+                )
                 all_device_data_idx = self.accelerator.gather(cur_batch_data_idx)
                 all_rewards.extend(all_device_batch_rewards.cpu().numpy().tolist())
                 all_success.extend(all_device_batch_success.cpu().numpy().tolist())
                 
                 # write inference results to file
                 if self.accelerator.is_main_process:
-                    with jsonlines.open(self.args["output_file"], mode="a") as f:
+                    with trajectory_writer(self.args["output_file"], sink) as f:
                         for idx, exp in enumerate(all_device_batch_exp):
                             cur_idx = all_device_data_idx[idx]
                             conversation = exp.conversation
@@ -161,9 +172,13 @@ class DistributedEvaluator(BaseTrainer):
                                     "item_id": item_id,
                                     "reward": cur_reward,
                                     "success": cur_success,
-                                }
+                                },
+                                exp,
                             )
 
+        if sink is not None:
+            sink.close()
+
         # fix for duplicated data
         all_rewards = all_rewards[: len(dataloader.dataset)]
         all_success = all_success[: len(dataloader.dataset)]
@@ -1,7 +1,18 @@
+import json
+import os
 import random
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
 
+import jsonlines
 import numpy as np
 import torch
+from agentenv.controller.arrow_writer import (
+    ArrowExperienceWriter,
+    load_experience_dataset,
+)
+from agentenv.controller.store import TrajectoryStore
+from datasets import Dataset
 
 
 def set_seed(seed):
@@ -12,3 +23,55 @@ def set_seed(seed):
         torch.cuda.manual_seed_all(seed)
         torch.backends.cudnn.deterministic = True
         torch.backends.cudnn.benchmark = False
+
+
+class _JsonlinesRows:
+    def __init__(self, writer: jsonlines.Writer) -> None:
+        self.writer = writer
+
+    def write(self, row: dict[str, Any], experience: Any = None) -> None:
+        self.writer.write(row)
+
+
+def experience_sink(
+    path: str, output_format: str = "jsonl"
+) -> Optional[TrajectoryStore | ArrowExperienceWriter]:
+    """
+    Open the sink that the rows for `path` go to across batches: None for "jsonl" (the
+    file is reopened per batch), a TrajectoryStore at `path` for "trie", or an
+    ArrowExperienceWriter at `path` with an ".arrow" extension for "arrow".
+    """
+    if output_format == "jsonl":
+        return None
+    if output_format == "trie":
+        return TrajectoryStore(path)
+    if output_format == "arrow":
+        return ArrowExperienceWriter(os.path.splitext(path)[0] + ".arrow")
+    raise ValueError(f"Unknown output format: {output_format}")
+
+
+@contextmanager
+def trajectory_writer(
+    path: str, sink: Optional[TrajectoryStore | ArrowExperienceWriter] = None
+) -> Iterator[_JsonlinesRows | TrajectoryStore | ArrowExperienceWriter]:
+    """
+    Append a batch of {"conversations", ...} rows, each with its experience, to `sink`
+    if given, else to `path` as JSON lines. The sink is kept open across batches, so it
+    is only flushed here.
+    """
+    if sink is None:
+        with jsonlines.open(path, mode="a") as f:
+            yield _JsonlinesRows(f)
+    else:
+        yield sink
+        sink.flush()
+
+
+def load_raw_dataset(path: str) -> Dataset:
+    """
+    Load a JSON data file, or an ".arrow" experience directory memory-mapped.
+    """
+    if path.endswith(".arrow"):
+        return load_experience_dataset(path)
+    with open(path, "r") as f:
+        return Dataset.from_list(json.load(f))
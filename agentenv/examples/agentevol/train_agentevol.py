@@ -76,6 +76,12 @@ class TrainingArguments:
     data_len: int = field(default=200)
     timeout: int = field(default=2400)
 
+    # output format
+    output_format: str = field(
+        default="jsonl",
+        metadata={"help": "Format of the inference files: jsonl, trie (a trajectory store that keeps shared conversation prefixes once, read with agentenv.controller.iter_trajectories) or arrow (a directory of Arrow shards with token ids, read with agentenv.controller.load_experience_dataset)"},
+    )
+
 
 def main():
     parser = transformers.HfArgumentParser(TrainingArguments)
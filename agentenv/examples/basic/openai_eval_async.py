@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import transformers
+
+from agentenv.controller import (
+    AsyncAPIAgent,
+    Evaluator,
+    RateLimiter,
+    close_async_sessions,
+)
+from agentenv.envs import (
+    AcademiaTask,
+    AlfWorldTask,
+    BabyAITask,
+    MazeTask,
+    MovieTask,
+    SearchQATask,
+    SciworldTask,
+    SheetTask,
+    SqlGymTask,
+    TextCraftTask,
+    TodoTask,
+    WeatherTask,
+    WebarenaTask,
+    WebshopTask,
+    WordleTask,
+)
+
+import os
+
+
+@dataclass
+class EvalArguments:
+    api_key: str
+    base_url: str
+    model: str
+    inference_file: str = field(metadata={"help": "Test dataset."})
+    output_dir: str
+    max_tokens: int = field(default=4096)
+    temperature: float = field(default=1)
+    top_p: float = field(default=1)
+    task_name: str = field(
+        default="webshop", metadata={"help": "Task name for evaluation"}
+    )
+
+    # conversation rounds
+    max_round: int = field(
+        default=6,
+        metadata={"help": "Interaction rounds between agents and environment"},
+    )
+
+    # environment parameters
+    env_server_base: str = field(default=None)
+    data_len: int = field(default=200)
+    timeout: int = field(default=2400)
+
+    # api limits
+    concurrency: int = field(
+        default=64, metadata={"help": "Episodes (and API requests) in flight at once"}
+    )
+    requests_per_minute: Optional[float] = field(default=None)
+    tokens_per_minute: Optional[float] = field(default=None)
+    max_retries: int = field(default=6)
+
+
+async def main(args):
+
+    DATA_PATH = args["inference_file"]
+
+    # task_name - task dict
+    task_classes = {
+        "webshop": WebshopTask,
+        "alfworld": AlfWorldTask,
+        "babyai": BabyAITask,
+        "sciworld": SciworldTask,
+        "textcraft": TextCraftTask,
+        "webarena": WebarenaTask,
+        "sqlgym": SqlGymTask,
+        "maze": MazeTask,
+        "wordle": WordleTask,
+        "weather": WeatherTask,
+        "todo": TodoTask,
+        "movie": MovieTask,
+        "sheet": SheetTask,
+        "academia": AcademiaTask,
+        "searchqa": SearchQATask,
+    }
+
+    # select task according to the name
+    task_class = task_classes.get(args["task_name"].lower(), None)
+    if task_class is None:
+        raise ValueError(f"Unsupported task name: {args['task_name']}")
+
+    # set environment parameters
+    env_args = {
+        "env_server_base": args["env_server_base"],
+        "data_len": args["data_len"],
+        "timeout": args["timeout"],
+    }
+
+    # one process drives all episodes; the async env clients are opened on demand
+    evaluator = Evaluator(
+        AsyncAPIAgent(
+            api_key=args["api_key"],
+            base_url=args["base_url"],
+            model=args["model"],
+            max_tokens=args["max_tokens"],
+            temperature=args["temperature"],
+            top_p=args["top_p"],
+            max_concurrency=args["concurrency"],
+            max_retries=args["max_retries"],
+            rate_limiter=RateLimiter(
+                requests_per_minute=args["requests_per_minute"],
+                tokens_per_minute=args["tokens_per_minute"],
+            ),
+        ),
+        [task_class(client_args=env_args, n_clients=1)],
+    )
+
+    with open(DATA_PATH, "r") as file:
+        test_data = json.load(file)
+
+    data_idxs = [int(item["item_id"].split("_")[-1]) for item in test_data]
+
+    start_time = time.time()
+    os.makedirs(args["output_dir"], exist_ok=True)
+    try:
+        exps = await evaluator.aeval(max_rounds=args["max_round"], idxs=data_idxs)
+    finally:
+        await close_async_sessions()
+
+    # write inference results to file
+    for data_idx, exp in zip(data_idxs, exps.experiences):
+        item_id = f"{args['task_name']}_{data_idx}"
+        with open(os.path.join(args["output_dir"], f"{item_id}.json"), "w") as f:
+            json.dump({
+                "conversations": exp.conversation,
+                "item_id": item_id,
+                "reward": exp.reward,
+                "success": 1 if exp.reward == 1 else 0,
+            }, f, ensure_ascii=False, indent=4)
+    process_time = time.time() - start_time
+
+    print("\n\n==== EVALUATION ====\n")
+    print(f"Score: {exps.score}")
+    print(f"Success: {exps.success}")
+    print(f"Time: {process_time} seconds")
+
+
+if __name__ == "__main__":
+    parser = transformers.HfArgumentParser(EvalArguments)
+    (args,) = parser.parse_args_into_dataclasses()
+    args = vars(args)
+    print(json.dumps(args, indent=2, ensure_ascii=False))
+    asyncio.run(main(args))
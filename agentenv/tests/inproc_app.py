@@ -0,0 +1,57 @@
+"""
+A small env server app for the tests of the in-process transports.
+"""
+
+import os
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+app = FastAPI()
+envs: dict[int, list[str]] = {}
+
+
+class CreateQuery(BaseModel):
+    data_idx: int = 0
+
+
+class StepQuery(BaseModel):
+    env_idx: int
+    action: str
+
+
+@app.post("/create")
+def create(body: CreateQuery):
+    env_idx = len(envs)
+    envs[env_idx] = [f"task {body.data_idx}"]
+    return env_idx
+
+
+@app.post("/step")
+async def step(body: StepQuery):
+    if body.env_idx not in envs:
+        raise HTTPException(status_code=404, detail=f"Env {body.env_idx} not found")
+    envs[body.env_idx].append(body.action)
+    return {"observation": body.action, "n_steps": len(envs[body.env_idx]) - 1}
+
+
+@app.get("/observation")
+def observation(env_idx: int, last: int = 1):
+    if env_idx not in envs:
+        raise HTTPException(status_code=404, detail=f"Env {env_idx} not found")
+    return envs[env_idx][-last:]
+
+
+@app.post("/create_and_step")
+def create_and_step(create: CreateQuery, step: StepQuery):
+    return {"data_idx": create.data_idx, "action": step.action}
+
+
+@app.post("/fail")
+def fail():
+    raise RuntimeError("boom")
+
+
+@app.post("/exit")
+def exit_worker():
+    os._exit(1)
@@ -0,0 +1,65 @@
+import pytest
+import torch
+from torch import nn
+
+from agentenv.bench.mock_agent import byte_tokenizer
+from agentenv.controller.agent import Agent, _stop_kwargs
+from agentenv.controller.utils import ActionFormat, BaseAdapter
+
+
+class TinyModel(nn.Module):
+    def __init__(self, dtype: torch.dtype) -> None:
+        super().__init__()
+        self.linear = nn.Linear(3, 2).to(dtype)
+
+
+def _agent() -> Agent:
+    agent = Agent.__new__(Agent)
+    agent._weights_fingerprint = (None, None)
+    return agent
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16])
+def test_weights_digest_sees_sum_preserving_updates(dtype):
+    agent, model = _agent(), TinyModel(dtype)
+    before = agent._weights_digest(model)
+    with torch.no_grad():
+        weight = model.linear.weight
+        weight[0, 0], weight[0, 1] = weight[0, 1].clone(), weight[0, 0].clone()
+    after = agent._weights_digest(model)
+
+    assert after != before
+    assert agent._weights_digest(model) == after
+    assert _agent()._weights_digest(model) == after
+
+
+def test_truncate_at_stop_strings():
+    agent = _agent()
+    agent.tokenizer = byte_tokenizer()
+    tokens = agent.tokenizer.encode("Action: a\nObservation: b\nThought:", add_special_tokens=False)
+    cut = agent._truncate_at_stop_strings(tokens, ["\nThought:", "\nObservation:"])
+    assert agent.tokenizer.decode(cut) == "Action: a\nObservation:"
+    cut = agent._truncate_at_stop_strings(tokens, "\nThought:")
+    assert agent.tokenizer.decode(cut) == "Action: a\nObservation: b\nThought:"
+    assert agent._truncate_at_stop_strings(tokens, ["\nAction:"]) == tokens
+
+
+def test_stop_kwargs():
+    assert _stop_kwargs(None) == {}
+    assert _stop_kwargs(()) == {}
+    assert _stop_kwargs(("\nObservation:",)) == {"stop": ["\nObservation:"]}
+    # APIs accept up to four stop sequences
+    assert _stop_kwargs([str(i) for i in range(6)]) == {"stop": ["0", "1", "2", "3"]}
+
+
+@pytest.mark.parametrize(
+    "action_format, text, cut",
+    [
+        (ActionFormat.REACT, "Thought: t\nAction: a\nObservation: o", "Thought: t\nAction: a"),
+        (ActionFormat.REACT, "Action: a\nThought: t\nObservation: o", "Action: a"),
+        (ActionFormat.REACT, "Thought: t\nAction: a", "Thought: t\nAction: a"),
+        (ActionFormat.FUNCTION_CALLING, "```\n{}\n```\nmore", "```\n{}"),
+    ],
+)
+def test_truncate_at_stop(action_format, text, cut):
+    assert BaseAdapter.truncate_at_stop(text, action_format) == cut
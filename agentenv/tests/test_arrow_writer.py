@@ -0,0 +1,79 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from agentenv.controller.arrow_writer import (
+    ArrowExperienceWriter,
+    read_experience_table,
+)
+
+
+def _row(item_id, reward):
+    return {
+        "conversations": [{"from": "human", "loss": None, "value": item_id}],
+        "item_id": item_id,
+        "reward": reward,
+        "success": 1 if reward == 1 else 0,
+    }
+
+
+def test_mixed_int_and_float_rewards(tmp_path):
+    path = str(tmp_path / "inference.arrow")
+    with ArrowExperienceWriter(path) as writer:
+        writer.write(_row("a", 0))
+        writer.write(_row("b", 1))
+        writer.flush()
+        writer.write(_row("c", 0.5))
+        writer.write(_row("d", 0.25))
+
+    table = read_experience_table(path)
+    assert table.schema.field("reward").type == pa.float64()
+    assert table.schema.field("success").type == pa.int8()
+    assert table.column("reward").to_pylist() == [0.0, 1.0, 0.5, 0.25]
+    assert table.column("success").to_pylist() == [0, 1, 0, 0]
+
+
+def test_appending_keeps_float_rewards(tmp_path):
+    path = str(tmp_path / "inference.arrow")
+    with ArrowExperienceWriter(path) as writer:
+        writer.write(_row("a", 0))
+    with ArrowExperienceWriter(path) as writer:
+        writer.write(_row("b", 0.5))
+
+    assert read_experience_table(path).column("reward").to_pylist() == [0.0, 0.5]
+
+
+def test_lossy_values_raise(tmp_path):
+    writer = ArrowExperienceWriter(str(tmp_path / "inference.arrow"))
+    writer.write({**_row("a", 0), "turns": 2})
+    writer.flush()
+    writer.write({**_row("b", 0), "turns": 2.5})
+    with pytest.raises(ValueError, match="turns"):
+        writer.flush()
+
+
+def test_heterogeneous_rows(tmp_path):
+    path = str(tmp_path / "inference.arrow")
+    with ArrowExperienceWriter(path) as writer:
+        writer.write({**_row("a", 1), "note": None})
+        writer.write({**_row("b", 0), "turns": 2})  # a new key within the batch
+        writer.flush()
+        # a key first seen in a later batch, and a value in the column that was all None
+        writer.write({**_row("c", 0.5), "note": "retried", "error": "timeout"})
+        message = {"from": "gpt", "loss": True, "value": "x", "reasoning_content": "r"}
+        writer.write({**_row("d", 0), "conversations": [message]})
+    with ArrowExperienceWriter(path) as writer:
+        writer.write(_row("e", 1))
+
+    table = read_experience_table(path)
+    assert table.schema.field("note").type == pa.string()
+    assert table.column("item_id").to_pylist() == ["a", "b", "c", "d", "e"]
+    assert table.column("turns").to_pylist() == [None, 2, None, None, None]
+    assert table.column("note").to_pylist() == [None, None, "retried", None, None]
+    assert table.column("error").to_pylist() == [None, None, "timeout", None, None]
+    conversations = table.column("conversations").to_pylist()
+    assert conversations[0][0]["reasoning_content"] is None
+    assert conversations[3] == [message]
+
+    ArrowExperienceWriter.compact(path)
+    assert read_experience_table(path).to_pylist() == table.to_pylist()
@@ -0,0 +1,51 @@
+import json
+import sqlite3
+
+from agentenv.controller import cache as cache_module
+from agentenv.controller.cache import GenerationCache
+
+
+def _entries(path):
+    with sqlite3.connect(path) as conn:
+        return {key for (key,) in conn.execute("SELECT key FROM generations")}
+
+
+def test_hits_do_not_write(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache.sqlite"))
+    cache.put("a", [1, 2, 3])
+    changes = cache._conn.total_changes
+    for _ in range(10):
+        assert cache.get("a") == [1, 2, 3]
+    assert cache.get("b") is None
+    assert cache._conn.total_changes == changes
+    assert cache.stats()["hits"] == 10
+    cache.close()
+
+
+def test_evicts_least_recently_used_after_buffered_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    value = list(range(30))
+    cache = GenerationCache(path, max_size=4 * len(json.dumps(value)) + 1)
+    for key in "abcd":
+        cache.put(key, value)
+    assert cache.get("a") == value  # "b" is now the least recently used
+    cache.put("e", value)
+
+    # shrunk to 90% of `max_size`: "b" and "c" are evicted, "a" was hit after them
+    assert _entries(path) == {"a", "d", "e"}
+    assert cache._size == cache.stats()["size"]
+    cache.close()
+
+
+def test_size_counts_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "EVICT_TO", 1.0)
+    path = str(tmp_path / "cache.sqlite")
+    first = GenerationCache(path, max_size=25)
+    second = GenerationCache(path, max_size=25)
+    first.put("a", "x" * 8)  # 10 bytes as JSON
+    second.put("b", "x" * 8)
+    second.put("c", "x" * 8)
+
+    assert _entries(path) == {"b", "c"}
+    first.close()
+    second.close()
@@ -0,0 +1,60 @@
+import pytest
+
+from agentenv.bench.mock_agent import byte_tokenizer
+from agentenv.controller.agent import (
+    BaseChatTemplate,
+    ChatGLM4Template,
+    ChatMLTemplate,
+    Llama2Template,
+    Llama3Template,
+)
+from agentenv.controller.types import TokenizedConversationOutput
+
+MESSAGES = [
+    {"from": "human", "loss": None, "value": "Observation:\nYou are in the kitchen. "},
+    {"from": "gpt", "loss": True, "value": "Thought:\nlook around\n\nAction:\nlook"},
+    {"from": "human", "loss": False, "value": ""},
+]
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return byte_tokenizer()
+
+
+@pytest.mark.parametrize(
+    "template_cls", [Llama2Template, ChatMLTemplate, Llama3Template, ChatGLM4Template]
+)
+@pytest.mark.parametrize("idx", [0, 3])
+@pytest.mark.parametrize("add_generation_prompt", [False, True])
+def test_batch_matches_one_by_one(tokenizer, template_cls, idx, add_generation_prompt):
+    template = template_cls()
+    batch = template.tokenize_conversation_batch(MESSAGES, tokenizer, idx, add_generation_prompt)
+    one_by_one = [
+        template.tokenize_conversation_one(message, tokenizer, idx, add_generation_prompt)
+        for message in MESSAGES
+    ]
+    assert batch == one_by_one
+
+
+def test_template_without_rendering_or_tokenizing_is_abstract():
+    class Incomplete(BaseChatTemplate):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_template_that_tokenizes_itself(tokenizer):
+    class Tokenizing(BaseChatTemplate):
+        def tokenize_conversation_one(self, message, tokenizer, idx=-1, add_generation_prompt=False):
+            input_ids = tokenizer.encode(message["value"], add_special_tokens=False)
+            return TokenizedConversationOutput(
+                {"text": message["value"], "input_ids": input_ids, "action_mask": [0] * len(input_ids)}
+            )
+
+    template = Tokenizing()
+    batch = template.tokenize_conversation_batch(MESSAGES, tokenizer)
+    assert [output["text"] for output in batch] == [m["value"] for m in MESSAGES]
+    with pytest.raises(NotImplementedError):
+        template.render_conversation_one(MESSAGES[0])
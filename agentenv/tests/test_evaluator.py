@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from agentenv.bench.mock_agent import MockAsyncAPIAgent
+from agentenv.bench.mock_env import MockEnvServer, MockTask
+from agentenv.controller.utils import BaseTrainer, Evaluator
+from agentenv.controller.transport import close_async_sessions
+
+
+@pytest.fixture
+def server():
+    with MockEnvServer(episode_length=3) as server:
+        yield server
+
+
+@pytest.mark.parametrize("controller_cls", [Evaluator, BaseTrainer])
+def test_aeval(server, controller_cls):
+    tasks = [
+        MockTask({"env_server_base": server.url, "data_len": 4}, n_clients=2),
+        MockTask({"env_server_base": server.url, "data_len": 2}, n_clients=1),
+    ]
+    controller = controller_cls(MockAsyncAPIAgent(new_tokens=8, max_concurrency=4), tasks)
+
+    async def run():
+        try:
+            everything = await controller.aeval()
+            some = await controller.aeval(idxs=[[0, 2], [1]])
+        finally:
+            await close_async_sessions()
+        return everything, some
+
+    everything, some = asyncio.run(run())
+    assert len(everything.experiences) == 6
+    assert len(some.experiences) == 3
+    assert everything.score == 1 and everything.success == 1
+    assert server.n_steps == 3 * 9
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from agentenv.controller.inproc import AppDispatcher, PipeTransport, local_transport
+from agentenv.controller.transport import EnvServerError
+
+import inproc_app
+
+
+def test_dispatcher_binds_arguments():
+    dispatcher = AppDispatcher(inproc_app.app)
+    env_idx = dispatcher.call("POST", "/create", json={"data_idx": 3})
+    # a single body model is the whole body
+    assert dispatcher.call("POST", "step", json={"env_idx": env_idx, "action": "go"}) == {
+        "observation": "go",
+        "n_steps": 1,
+    }
+    # query parameters are converted to the annotated type, defaults are kept
+    assert dispatcher.call("GET", "/observation", params={"env_idx": str(env_idx)}) == ["go"]
+    assert dispatcher.call(
+        "GET", "/observation", params={"env_idx": env_idx, "last": "2"}
+    ) == ["task 3", "go"]
+    # several body models are embedded by parameter name
+    assert dispatcher.call(
+        "POST",
+        "/create_and_step",
+        json={"create": {"data_idx": 1}, "step": {"env_idx": 0, "action": "look"}},
+    ) == {"data_idx": 1, "action": "look"}
+    assert asyncio.run(
+        dispatcher.acall("POST", "/step", json={"env_idx": env_idx, "action": "stop"})
+    ) == {"observation": "stop", "n_steps": 2}
+
+
+def test_dispatcher_maps_errors():
+    dispatcher = AppDispatcher(inproc_app.app)
+    cases = [
+        ("POST", "/step", {"env_idx": -1, "action": "go"}, 404),  # HTTPException
+        ("POST", "/step", {"action": "go"}, 422),  # invalid body
+        ("GET", "/nowhere", None, 404),  # no such route
+        ("POST", "/fail", None, 500),  # any other exception
+    ]
+    for method, path, json, status_code in cases:
+        with pytest.raises(EnvServerError) as info:
+            dispatcher.call(method, path, json=json)
+        assert info.value.status_code == status_code
+        with pytest.raises(EnvServerError) as info:
+            asyncio.run(dispatcher.acall(method, path, json=json))
+        assert info.value.status_code == status_code
+    with pytest.raises(EnvServerError, match="Env -1 not found"):
+        dispatcher.call("POST", "/step", json={"env_idx": -1, "action": "go"})
+
+
+def test_pipe_transport_restarts_dead_worker():
+    transport = local_transport("pipe://inproc_app:app")
+    assert isinstance(transport, PipeTransport)
+    try:
+        env_idx = transport.post("create", json={"data_idx": 0})
+        assert transport.post("step", json={"env_idx": env_idx, "action": "go"})["n_steps"] == 1
+        with pytest.raises(EnvServerError, match="404"):
+            transport.get("observation", params={"env_idx": 99})
+        worker = transport._worker
+
+        with pytest.raises(EnvServerError, match="died"):
+            transport.post("exit", timeout=30)
+        deadline = time.monotonic() + 30
+        while worker.alive and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not worker.alive
+
+        # a new worker serves the next request; the envs of the old one are lost
+        with pytest.raises(EnvServerError) as info:
+            transport.post("step", json={"env_idx": env_idx, "action": "go"})
+        assert info.value.status_code == 404
+        assert transport._worker is not worker
+        env_idx = asyncio.run(transport.apost("create", json={"data_idx": 1}))
+        assert transport.get("observation", params={"env_idx": env_idx}) == ["task 1"]
+    finally:
+        transport.close()
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from agentenv.bench.mock_agent import MockAgent
+from agentenv.bench.mock_env import MockEnvServer, MockTask
+from agentenv.bench.runner import _generation_config
+from agentenv.controller.scheduler import MultiTaskScheduler
+
+
+@pytest.fixture
+def server():
+    with MockEnvServer(step_latency=0.002, episode_length=2) as server:
+        yield server
+
+
+def _tasks(server, n_clients=(2, 2)):
+    return [
+        MockTask({"env_server_base": server.url, "data_len": 8}, n_clients=n)
+        for n in n_clients
+    ]
+
+
+def _track(tasks):
+    """Record the order episodes are opened in and the peak of live episodes per task."""
+    opened, live, peak = [], [0] * len(tasks), [0] * len(tasks)
+    lock = threading.Lock()
+    for t, task in enumerate(tasks):
+
+        def open_episode(agent, idx, position, t=t, inner=task._open_episode):
+            with lock:
+                opened.append(t)
+                live[t] += 1
+                peak[t] = max(peak[t], live[t])
+            return inner(agent, idx, position)
+
+        def finish_episode(agent, episode, t=t, inner=task._finish_episode):
+            with lock:
+                live[t] -= 1
+            return inner(agent, episode)
+
+        task._open_episode = open_episode
+        task._finish_episode = finish_episode
+    return opened, peak
+
+
+def _run(scheduler, idxs):
+    agent = MockAgent(new_tokens=8)
+    try:
+        return scheduler.generate_experience(agent, idxs, _generation_config(agent))
+    finally:
+        for task in scheduler.tasks:
+            task.close()
+
+
+def test_results_are_in_the_order_of_idxs(server):
+    idxs = [[5, 1, 3], [0, 7, 2, 4]]
+    output = _run(MultiTaskScheduler(_tasks(server)), idxs)
+    assert [(o.task_index, o.idx) for o in output] == [
+        (t, idx) for t, task_idxs in enumerate(idxs) for idx in task_idxs
+    ]
+    assert all(o.experience.reward == 1 for o in output)
+
+
+@pytest.mark.parametrize("weights, first", [([1, 1], [0, 1, 0]), ([2, 1], [0, 1, 0]), ([1, 2], [0, 1, 1])])
+def test_free_slots_follow_the_weights(server, weights, first):
+    tasks = _tasks(server, (4, 4))
+    opened, _ = _track(tasks)
+    _run(MultiTaskScheduler(tasks, max_concurrency=3, task_weights=weights), [[0, 1, 2], [3, 4, 5]])
+    assert opened[:3] == first
+    assert sorted(opened) == [0, 0, 0, 1, 1, 1]
+
+
+def test_per_task_concurrency(server):
+    tasks = _tasks(server, (4, 4))
+    _, peak = _track(tasks)
+    scheduler = MultiTaskScheduler(tasks, task_concurrency={0: 1})
+    assert scheduler.task_concurrency == [1, 4]
+    _run(scheduler, [list(range(6)), list(range(6))])
+    assert peak[0] == 1
+    assert 1 < peak[1] <= 4
+
+
+def test_idxs_must_match_the_tasks(server):
+    scheduler = MultiTaskScheduler(_tasks(server))
+    with pytest.raises(ValueError):
+        _run(scheduler, [[0], [1], [2]])
+    with pytest.raises(ValueError):
+        _run(scheduler, [[0]])
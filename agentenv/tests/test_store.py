@@ -0,0 +1,31 @@
+from agentenv.controller.store import TrajectoryStore, iter_trajectories
+
+START = [
+    {"from": "human", "loss": None, "value": "You are a shopping agent."},
+    {"from": "gpt", "loss": False, "value": "OK."},
+]
+
+
+def _conversation(*turns):
+    return START + [{"from": "gpt", "loss": True, "value": turn} for turn in turns]
+
+
+def test_round_trip_with_an_id_in_the_data(tmp_path):
+    path = str(tmp_path / "inference.trie.jsonl")
+    rows = [
+        {"conversations": _conversation("search[a]"), "id": "row-1", "reward": 0.5},
+        {"conversations": _conversation("search[a]", "click[b]"), "id": 2, "parent": None},
+        {"conversations": _conversation("search[c]"), "item_id": "webshop_3", "message": "x"},
+    ]
+    with TrajectoryStore(path) as store:
+        for row in rows[:2]:
+            store.write(row)
+    # reopened for appending, the nodes written so far are shared
+    with TrajectoryStore(path) as store:
+        store.write(rows[2])
+        assert list(store) == rows
+
+    assert list(iter_trajectories(path)) == rows
+    with open(path, encoding="utf-8") as f:
+        n_nodes = sum(line.startswith('{"id"') for line in f)
+    assert n_nodes == len(START) + 3
@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from agentenv.bench.mock_agent import MockAgent
+from agentenv.bench.mock_env import MockEnvServer, MockTask
+from agentenv.bench.runner import _generation_config
+from agentenv.controller import CircuitOpenError
+from agentenv.controller.agent import TokenizedConversationBuffer
+from agentenv.controller.pool import EnvClientPool
+from agentenv.controller.task import EpisodeState
+from agentenv.controller.transport import CircuitBreaker, RetryPolicy, get_transport
+
+
+class ScriptedServer(MockEnvServer):
+    """
+    A mock env server whose steps can be slowed down, lose their env or take the whole
+    server down, decided per (env id, steps taken) by `on_step`.
+    """
+
+    def __init__(self, on_step=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.on_step = on_step or (lambda server, env_id, steps: None)
+        self.dead = False
+        self._httpd.handle_error = lambda *args: None
+
+    def handle(self, path, data):
+        if self.dead:
+            raise ConnectionAbortedError("the server is down")
+        if path == "step" and int(data["id"]) in self.envs:
+            self.on_step(self, int(data["id"]), self.envs[int(data["id"])][1])
+        return super().handle(path, data)
+
+    def kill(self) -> None:
+        self.dead = True
+        threading.Thread(target=self.stop, daemon=True).start()
+
+
+def _task(server, **attributes):
+    get_transport(
+        server.url,
+        retry_policy=RetryPolicy(max_retries=1, backoff_base=0.01),
+        circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+    )
+    task = MockTask({"env_server_base": server.url, "data_len": 4})
+    for name, value in attributes.items():
+        setattr(task, name, value)
+    return task
+
+
+def _rollout(task, idxs=(0,)):
+    agent = MockAgent(new_tokens=8)
+    try:
+        return task.generate_experience(agent, list(idxs), _generation_config(agent))
+    finally:
+        task.close()
+
+
+def test_dead_server_fails_the_episode_while_the_breaker_is_open():
+    def kill_on_second_step(server, env_id, steps):
+        if steps == 1:
+            server.kill()
+            raise ConnectionAbortedError("killed")
+
+    with ScriptedServer(kill_on_second_step, episode_length=5) as server:
+        task = _task(server, circuit_open_timeout=1.0)
+        outcome = {}
+
+        def run():
+            try:
+                _rollout(task)
+            except Exception as e:  # pylint: disable=W0718:broad-exception-caught
+                outcome["error"] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        start = time.monotonic()
+        thread.start()
+        thread.join(timeout=20)
+        assert not thread.is_alive(), "the rollout kept retrying a dead server"
+        assert isinstance(outcome.get("error"), CircuitOpenError)
+        assert time.monotonic() - start < 10
+
+
+def test_lost_env_is_recreated_and_replayed():
+    def lose_env(server, env_id, steps):
+        if env_id == 0 and steps == 2:
+            del server.envs[env_id]
+
+    with ScriptedServer(lose_env, episode_length=4) as server:
+        (experience,) = _rollout(_task(server))
+        assert experience.reward == 1
+        # two steps were replayed on the new env
+        assert server.n_steps == 4 + 2
+        agent_turns = [m for m in experience.conversation if m["from"] == "gpt" and m["loss"]]
+        assert len(agent_turns) == 4
+
+
+def test_step_timeout_ends_the_episode():
+    def hang(server, env_id, steps):
+        if steps == 1:
+            time.sleep(2)
+
+    with ScriptedServer(hang, episode_length=4) as server:
+        start = time.monotonic()
+        (experience,) = _rollout(_task(server, step_timeout=0.3))
+        assert time.monotonic() - start < 1.5
+        assert experience.reward == 0
+
+
+def test_lagging_step_is_speculated_on_another_env():
+    def lag(server, env_id, steps):
+        if env_id == 0 and steps == 9:
+            time.sleep(2)
+
+    with ScriptedServer(lag, episode_length=12) as server:
+        task = _task(server, speculative_steps=True)
+        start = time.monotonic()
+        (experience,) = _rollout(task)
+        assert time.monotonic() - start < 1.8
+        assert experience.reward == 1
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_pool():
+    pool = EnvClientPool(FakeClient, max_clients=2)
+    assert pool.available == 2
+    first, second = pool.acquire(), pool.acquire()
+    assert pool.available == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    extra = pool.acquire(overflow=True)
+    assert len(pool.clients) == 3
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+    new = pool.replace(second)
+    assert second.closed and second not in pool.clients and new in pool.clients
+
+    pending = Future()
+    pool.discard(extra, pending)
+    assert extra not in pool.clients and not extra.closed
+    pending.set_result(None)
+    assert extra.closed
+
+    pool.release(extra)  # dropped clients are not taken back
+    assert extra not in pool.clients
+    pool.close()
+    assert first.closed and new.closed and pool.clients == []
+
+
+
+class PieceTokenizer:
+    """
+    Tokens are the pieces of `vocab`, matched longest first, so a token may hold the end
+    of an action and the start of a stop sequence.
+    """
+
+    eos_token, eos_token_id = "</s>", 0
+
+    def __init__(self, vocab):
+        self.vocab = [self.eos_token, *vocab]
+
+    def decode(self, tokens):
+        return "".join(self.vocab[token] for token in tokens)
+
+    def encode(self, text, add_special_tokens=True):
+        tokens = []
+        while text:
+            piece = max((p for p in self.vocab if text.startswith(p)), key=len)
+            tokens.append(self.vocab.index(piece))
+            text = text[len(piece) :]
+        return tokens
+
+
+@pytest.mark.parametrize(
+    "generated, kept",
+    [
+        # "]\n" is one token: its "]" is kept
+        ("Action: click[a]\nObservation: b", "Action: click[a]"),
+        ("Action: click[a]\nObservation:</s>", "Action: click[a]"),
+        ("Action: click[a]\n\nObservation:", "Action: click[a]\n"),
+        # the earliest stop sequence counts
+        ("Action: a\nThought: b\nObservation:", "Action: a"),
+        ("Action: a</s>", "Action: a"),
+        ("", ""),
+    ],
+)
+def test_add_generation_cuts_at_stop_sequence(generated, kept):
+    tokenizer = PieceTokenizer(
+        ["Action: ", "click[a", "]\n", "\n", "Observation:", "Thought:", " ", "a", "b", "]"]
+    )
+    agent = MockAgent()
+    agent.tokenizer = tokenizer
+    episode = EpisodeState(
+        client=None,
+        idx=0,
+        conversation=[],
+        conversation_tokenized=TokenizedConversationBuffer(),
+        stop=("\nObservation:", "\nThought:"),
+    )
+    task = MockTask({"env_server_base": "http://127.0.0.1:9", "data_len": 1})
+    try:
+        text = task._add_generation(agent, episode, tokenizer.encode(generated))
+    finally:
+        task.close()
+
+    assert text == kept
+    assert episode.conversation[-1]["value"] == kept
+    tokens = episode.conversation_tokenized.input_ids.tolist()
+    assert tokenizer.decode(tokens) == kept + "</s>"
+    assert episode.conversation_tokenized.action_mask.tolist() == [1] * len(tokens)
@@ -0,0 +1,196 @@
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+from requests.exceptions import ChunkedEncodingError
+
+from agentenv.controller.transport import (
+    CircuitBreaker,
+    CircuitOpenError,
+    EnvServerError,
+    EnvTransport,
+    RetryPolicy,
+)
+
+
+def _dead_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+class RawServer:
+    """
+    Accepts connections, reads one request from each and answers it with `response`,
+    or resets the connection if `response` is None.
+    """
+
+    def __init__(self, response: bytes | None = None) -> None:
+        self.response = response
+        self.requests = 0
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}".format(self._sock.getsockname()[1])
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                data = b""
+                while b"\r\n\r\n" not in data:
+                    data += conn.recv(65536)
+                head, body = data.split(b"\r\n\r\n", 1)
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                        while len(body) < length:
+                            body += conn.recv(65536)
+                self.requests += 1
+                if self.response is None:
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                else:
+                    conn.sendall(self.response)
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+@pytest.fixture
+def reset_server():
+    server = RawServer()
+    yield server
+    server.close()
+
+
+def _transport(url: str, **kwargs) -> EnvTransport:
+    return EnvTransport(
+        url,
+        retry_policy=RetryPolicy(max_retries=2, backoff_base=0.0),
+        circuit_breaker=kwargs.pop("circuit_breaker", CircuitBreaker(failure_threshold=100)),
+        **kwargs,
+    )
+
+
+def test_breaker_opens_and_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()  # the trial is still in flight
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
+
+
+def test_unexpected_error_ends_the_trial(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    transport = _transport(_dead_url(), circuit_breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    def broken(*args, **kwargs):
+        raise ChunkedEncodingError("truncated body")
+
+    monkeypatch.setattr(transport.session, "request", broken)
+    with pytest.raises(ChunkedEncodingError):
+        transport.get("observation")
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before_request()  # a new trial is let through
+
+
+def test_post_is_retried_on_connect_errors():
+    transport = _transport(_dead_url())
+    with pytest.raises(EnvServerError):
+        transport.post("step", json={"id": 0})
+    assert transport.latency.snapshot()["step"]["count"] == 3
+
+
+def test_post_is_not_replayed_after_it_was_sent(reset_server):
+    transport = _transport(reset_server.url)
+    with pytest.raises(EnvServerError):
+        transport.post("step", json={"id": 0, "action": "go"})
+    assert reset_server.requests == 1
+
+
+def test_get_is_retried_after_it_was_sent(reset_server):
+    transport = _transport(reset_server.url)
+    with pytest.raises(EnvServerError):
+        transport.get("observation", params={"id": 0})
+    assert reset_server.requests == 3
+
+
+def test_retry_statuses():
+    transport = _transport(_dead_url())
+    assert transport._should_retry("POST", 0, 503, None)
+    assert not transport._should_retry("POST", 0, 404, None)
+    assert not transport._should_retry("POST", 2, 503, None)
+
+
+def test_async_retries(reset_server):
+    pytest.importorskip("aiohttp")
+
+    async def run() -> None:
+        dead = _transport(_dead_url())
+        with pytest.raises(EnvServerError):
+            await dead.apost("step", json={"id": 0})
+        assert dead.latency.snapshot()["step"]["count"] == 3
+        await dead.aclose()
+
+        sent = _transport(reset_server.url)
+        with pytest.raises(EnvServerError):
+            await sent.apost("step", json={"id": 0})
+        assert reset_server.requests == 1
+        await sent.aclose()
+
+    asyncio.run(run())
+
+
+def test_async_unexpected_error_ends_the_trial():
+    pytest.importorskip("aiohttp")
+    body = b"not json"
+    server = RawServer(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nConnection: close\r\n"
+        b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+    )
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    transport = _transport(server.url, circuit_breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    async def run() -> None:
+        with pytest.raises(Exception):
+            await transport.aget("observation")
+        await transport.aclose()
+
+    asyncio.run(run())
+    server.close()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    breaker.before_request()
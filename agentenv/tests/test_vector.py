@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agentenv.controller.transport import EnvServerError
+from agentenv.controller.vector import (
+    CoalescingTransport,
+    RequestCoalescer,
+    _unsupported,
+    run_coalesced,
+)
+
+_servers = itertools.count()
+
+
+class BatchTransport:
+    """
+    Answers `/step` with the action it was sent, and `/step_batch` with one result per
+    step, unless `batch` is False. The action "fail" fails with 400.
+    """
+
+    def __init__(self, batch: bool = True) -> None:
+        self.env_server_base = f"http://batch-{next(_servers)}"
+        self.batch = batch
+        self.requests: list[tuple[str, object]] = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, json=None, params=None, timeout=None):
+        with self._lock:
+            self.requests.append((path, json))
+        if path.endswith("_batch"):
+            if not self.batch:
+                raise EnvServerError("Not Found", status_code=404)
+            return [
+                {"ok": False, "status_code": 400, "error": "bad action"}
+                if step["action"] == "fail"
+                else {"ok": True, "result": step["action"]}
+                for step in json["steps"]
+            ]
+        if json["action"] == "fail":
+            raise EnvServerError("bad action", status_code=400)
+        return json["action"]
+
+
+def _step(transport: CoalescingTransport, action: str) -> str:
+    return transport.post("step", json={"action": action})
+
+
+def _run(fn, args):
+    with ThreadPoolExecutor(len(args)) as executor:
+        futures = run_coalesced(executor, fn, args)
+        for future in futures:
+            future.exception()
+    return futures
+
+
+def test_requests_are_batched():
+    server = BatchTransport()
+    transport = CoalescingTransport(server)
+    futures = _run(_step, [(transport, str(i)) for i in range(4)])
+    assert [future.result() for future in futures] == ["0", "1", "2", "3"]
+    assert len(server.requests) == 1
+    path, body = server.requests[0]
+    assert path == "step_batch"
+    assert sorted(step["action"] for step in body["steps"]) == ["0", "1", "2", "3"]
+    # outside of a participant, requests are sent as usual
+    assert _step(transport, "4") == "4"
+    assert server.requests[-1] == ("step", {"action": "4"})
+
+
+def test_failed_items_raise_for_their_caller_only():
+    server = BatchTransport()
+    transport = CoalescingTransport(server)
+    futures = _run(_step, [(transport, "a"), (transport, "fail"), (transport, "b")])
+    assert futures[0].result() == "a"
+    assert futures[2].result() == "b"
+    error = futures[1].exception()
+    assert isinstance(error, EnvServerError) and error.status_code == 400
+    assert "in a batch" in str(error)
+    assert len(server.requests) == 1
+
+
+def test_server_without_batch_endpoint():
+    server = BatchTransport(batch=False)
+    transport = CoalescingTransport(server)
+    try:
+        futures = _run(_step, [(transport, "a"), (transport, "b")])
+        assert [future.result() for future in futures] == ["a", "b"]
+        assert [path for path, _ in server.requests] == ["step_batch", "step", "step"]
+        assert (server.env_server_base, "step") in _unsupported
+
+        # later requests skip the batch endpoint
+        futures = _run(_step, [(transport, "c"), (transport, "d")])
+        assert [future.result() for future in futures] == ["c", "d"]
+        assert [path for path, _ in server.requests[3:]] == ["step", "step"]
+    finally:
+        _unsupported.discard((server.env_server_base, "step"))
+
+
+def test_participant_with_two_requests_counts_once():
+    server = BatchTransport()
+    transport = CoalescingTransport(server)
+    coalescer = RequestCoalescer(2, max_wait=5.0)
+    results = {}
+
+    def first() -> None:
+        with coalescer.participant():
+            # a duplicate of the step, as a speculative step sends it
+            context = contextvars.copy_context()
+            duplicate = threading.Thread(
+                target=lambda: results.update(duplicate=context.run(_step, transport, "a"))
+            )
+            duplicate.start()
+            results["first"] = _step(transport, "a")
+            duplicate.join()
+
+    def second() -> None:
+        with coalescer.participant():
+            time.sleep(0.3)
+            results["second"] = _step(transport, "b")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"first": "a", "duplicate": "a", "second": "b"}
+    # one batch once both participants sent their steps, not one for the two of the first
+    assert len(server.requests) == 1
+    assert len(server.requests[0][1]["steps"]) == 3
+    assert time.monotonic() - start < 5.0
+
+
+def test_run_batch():
+    common = pytest.importorskip("agentenv_tool_common")
+    from fastapi import HTTPException
+
+    def step(body):
+        if body["action"] == "missing":
+            raise HTTPException(status_code=404, detail="Env not found")
+        if body["action"] == "fail":
+            raise RuntimeError("boom")
+        return body["action"]
+
+    async def astep(body):
+        await asyncio.sleep(0)
+        return step(body)
+
+    bodies = [{"action": "a"}, {"action": "missing"}, {"action": "fail"}, {"action": "b"}]
+    expected = [
+        {"ok": True, "result": "a"},
+        {"ok": False, "status_code": 404, "error": "Env not found"},
+        {"ok": False, "status_code": 500, "error": "RuntimeError('boom')"},
+        {"ok": True, "result": "b"},
+    ]
+    assert asyncio.run(common.run_batch(step, bodies)) == expected
+    assert asyncio.run(common.run_batch(astep, bodies)) == expected
+    assert asyncio.run(common.run_batch(step, [])) == []
@@ -2,7 +2,7 @@ import argparse
 import json
 import os
 
-import jsonlines
+from agentenv.controller import iter_trajectories, read_experience_table
 
 task_list = [
     "webshop",
@@ -33,9 +33,12 @@ def filter_jsonl(inference_output_file_path, cur_iter_file, next_iter_file, add_
         if filename.startswith("inference") and filename.endswith(".jsonl"):
             cur_file_path = os.path.join(inference_output_file_path, filename)
 
-            with jsonlines.open(cur_file_path) as reader:
-                for line in reader.iter(skip_invalid=True):
-                    data.append(line)
+            # plain JSON lines or a trajectory store
+            for line in iter_trajectories(cur_file_path, skip_invalid=True):
+                data.append(line)
+        elif filename.startswith("inference") and filename.endswith(".arrow"):
+            table = read_experience_table(os.path.join(inference_output_file_path, filename))
+            data += table.select(["conversations", "item_id", "reward"]).to_pylist()
 
     filtered_data = []
     for d in data: